@@ -0,0 +1,243 @@
+'''
+Benchmark building definitions programmatically, one gate and connection at a time with add_gate and add_connection
+against batches with add_gates and add_connections
+
+Builds a RAM of 8-bit words out of NAND gates: every word is a register of D latches enabled by comparing the address
+with its own, and the outputs of the words are masked by the same comparison and ORed together.
+
+Run from the repository root:
+    python -m benchmarks.build_benchmark [--words 256] [--repeat 3]
+'''
+from gates.builtins import Nand, Reshaper, Constant
+from gates.project import Project
+import argparse
+import time
+
+class Builder:
+    '''
+    Collects the gates and connections of a definition, then adds them either one by one or in batches
+    '''
+    def __init__(self, definition):
+        self.definition = definition
+        self.gates = []
+        self.connections = []
+
+    def add(self, gate):
+        self.gates.append(gate)
+        return gate
+
+    def connect(self, from_gate, output_idx, to_gate, input_idx):
+        self.connections.append(((from_gate, output_idx), (input_idx, to_gate)))
+
+    def build(self, batch):
+        if batch:
+            self.definition.add_gates(self.gates)
+            self.definition.add_connections(self.connections)
+        else:
+            for gate in self.gates:
+                self.definition.add_gate(gate)
+            for from_pair, to_pair in self.connections:
+                self.definition.add_connection(from_pair, to_pair)
+        return self.definition
+
+def define_gates(project, batch):
+    '''
+    Define the one bit gates and the latch the RAM is made of
+    '''
+    # NOT, AND and OR from NANDs
+    builder = Builder(project.define('NOT', [1], [1]))
+    source, sink = builder.definition.source, builder.definition.sink
+    nand = builder.add(Nand())
+    builder.connect(source, 0, nand, 0)
+    builder.connect(source, 0, nand, 1)
+    builder.connect(nand, 0, sink, 0)
+    builder.build(batch)
+
+    builder = Builder(project.define('AND', [1, 1], [1]))
+    source, sink = builder.definition.source, builder.definition.sink
+    nand, invert = builder.add(Nand()), builder.add(project['NOT']())
+    builder.connect(source, 0, nand, 0)
+    builder.connect(source, 1, nand, 1)
+    builder.connect(nand, 0, invert, 0)
+    builder.connect(invert, 0, sink, 0)
+    builder.build(batch)
+
+    builder = Builder(project.define('OR', [1, 1], [1]))
+    source, sink = builder.definition.source, builder.definition.sink
+    invert0, invert1, nand = builder.add(project['NOT']()), builder.add(project['NOT']()), builder.add(Nand())
+    builder.connect(source, 0, invert0, 0)
+    builder.connect(source, 1, invert1, 0)
+    builder.connect(invert0, 0, nand, 0)
+    builder.connect(invert1, 0, nand, 1)
+    builder.connect(nand, 0, sink, 0)
+    builder.build(batch)
+
+    # XNOR from four NANDs for XOR and a NOT
+    builder = Builder(project.define('XNOR', [1, 1], [1]))
+    source, sink = builder.definition.source, builder.definition.sink
+    nands = [builder.add(Nand()) for _ in range(4)]
+    invert = builder.add(project['NOT']())
+    for idx in range(2):
+        builder.connect(source, idx, nands[0], idx)
+        builder.connect(source, idx, nands[1 + idx], 0)
+        builder.connect(nands[0], 0, nands[1 + idx], 1)
+        builder.connect(nands[1 + idx], 0, nands[3], idx)
+    builder.connect(nands[3], 0, invert, 0)
+    builder.connect(invert, 0, sink, 0)
+    builder.build(batch)
+
+    # D latch, which is transparent while its enable input is set
+    builder = Builder(project.define('Latch', [1, 1], [1]))
+    source, sink = builder.definition.source, builder.definition.sink
+    invert = builder.add(project['NOT']())
+    set_nand, reset_nand, q_nand, not_q_nand = [builder.add(Nand()) for _ in range(4)]
+    builder.connect(source, 0, invert, 0)
+    builder.connect(source, 0, set_nand, 0)
+    builder.connect(source, 1, set_nand, 1)
+    builder.connect(invert, 0, reset_nand, 0)
+    builder.connect(source, 1, reset_nand, 1)
+    builder.connect(set_nand, 0, q_nand, 0)
+    builder.connect(not_q_nand, 0, q_nand, 1)
+    builder.connect(reset_nand, 0, not_q_nand, 0)
+    builder.connect(q_nand, 0, not_q_nand, 1)
+    builder.connect(q_nand, 0, sink, 0)
+    builder.build(batch)
+
+def define_bitwise(project, name, gate_type, batch):
+    '''
+    Define an 8-bit version of a two input one bit gate
+    '''
+    builder = Builder(project.define(name, [8, 8], [8]))
+    source, sink = builder.definition.source, builder.definition.sink
+    split0, split1 = builder.add(Reshaper([8], [1] * 8)), builder.add(Reshaper([8], [1] * 8))
+    merge = builder.add(Reshaper([1] * 8, [8]))
+    builder.connect(source, 0, split0, 0)
+    builder.connect(source, 1, split1, 0)
+    for idx in range(8):
+        gate = builder.add(project[gate_type]())
+        builder.connect(split0, idx, gate, 0)
+        builder.connect(split1, idx, gate, 1)
+        builder.connect(gate, 0, merge, idx)
+    builder.connect(merge, 0, sink, 0)
+    builder.build(batch)
+
+def define_words(project, batch):
+    '''
+    Define the 8-bit register, comparator and mask of a word
+    '''
+    builder = Builder(project.define('Register', [8, 1], [8]))
+    source, sink = builder.definition.source, builder.definition.sink
+    split, merge = builder.add(Reshaper([8], [1] * 8)), builder.add(Reshaper([1] * 8, [8]))
+    builder.connect(source, 0, split, 0)
+    for idx in range(8):
+        latch = builder.add(project['Latch']())
+        builder.connect(split, idx, latch, 0)
+        builder.connect(source, 1, latch, 1)
+        builder.connect(latch, 0, merge, idx)
+    builder.connect(merge, 0, sink, 0)
+    builder.build(batch)
+
+    define_bitwise(project, 'XNOR8', 'XNOR', batch)
+    define_bitwise(project, 'AND8', 'AND', batch)
+    define_bitwise(project, 'OR8', 'OR', batch)
+
+    # Compare two bytes by ANDing the bits of their XNOR together
+    builder = Builder(project.define('Equals', [8, 8], [1]))
+    source, sink = builder.definition.source, builder.definition.sink
+    xnor, split = builder.add(project['XNOR8']()), builder.add(Reshaper([8], [1] * 8))
+    builder.connect(source, 0, xnor, 0)
+    builder.connect(source, 1, xnor, 1)
+    builder.connect(xnor, 0, split, 0)
+    previous, previous_idx = split, 0
+    for idx in range(1, 8):
+        gate = builder.add(project['AND']())
+        builder.connect(previous, previous_idx, gate, 0)
+        builder.connect(split, idx, gate, 1)
+        previous, previous_idx = gate, 0
+    builder.connect(previous, 0, sink, 0)
+    builder.build(batch)
+
+def define_ram(project, num_words, batch):
+    '''
+    Define a RAM with num_words 8-bit words and inputs for the address, the data to write and whether to write it
+    '''
+    builder = Builder(project.define('RAM', [8, 8, 1], [8], ['address', 'data', 'write'], ['data']))
+    source, sink = builder.definition.source, builder.definition.sink
+    output = None
+    for word in range(num_words):
+        address = builder.add(Constant(8, [[(word >> shift) & 1 for shift in range(7, -1, -1)]]))
+        equals = builder.add(project['Equals']())
+        enable = builder.add(project['AND']())
+        register = builder.add(project['Register']())
+        mask = builder.add(project['AND8']())
+        select = builder.add(Reshaper([1] * 8, [8]))
+        builder.connect(source, 0, equals, 0)
+        builder.connect(address, 0, equals, 1)
+        builder.connect(equals, 0, enable, 0)
+        builder.connect(source, 2, enable, 1)
+        builder.connect(source, 1, register, 0)
+        builder.connect(enable, 0, register, 1)
+        for idx in range(8):
+            builder.connect(equals, 0, select, idx)
+        builder.connect(register, 0, mask, 0)
+        builder.connect(select, 0, mask, 1)
+        if output is None:
+            output = mask
+        else:
+            combine = builder.add(project['OR8']())
+            builder.connect(output, 0, combine, 0)
+            builder.connect(mask, 0, combine, 1)
+            output = combine
+    builder.connect(output, 0, sink, 0)
+    return builder.build(batch), len(builder.gates), len(builder.connections)
+
+def build_project(num_words, batch):
+    project = Project('RAM benchmark')
+    define_gates(project, batch)
+    define_words(project, batch)
+    return define_ram(project, num_words, batch)
+
+def bits(value):
+    return [(value >> shift) & 1 for shift in range(7, -1, -1)]
+
+def check(ram, num_words):
+    '''
+    Write a value to every word, then read them back
+    '''
+    ram.reset_state()
+    for word in range(num_words):
+        ram._state['inputs'] = [bits(word), bits(255 - word), 1]
+        ram.tick()
+    results = []
+    for word in range(num_words):
+        ram._state['inputs'] = [bits(word), bits(0), 0]
+        ram.tick()
+        results.append(list(ram._state['outputs'][0]))
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark building definitions one gate at a time and in batches')
+    parser.add_argument('--words', type=int, default=256, help='Number of 8-bit words in the RAM, at most 256')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of times to build the RAM in each mode')
+    args = parser.parse_args()
+    if not 0 < args.words <= 256:
+        parser.error('--words must be between 1 and 256')
+
+    print('{:>8} {:>10} {:>12} {:>12}'.format('mode', 'gates', 'connections', 'time (s)'))
+    results = {}
+    for batch in (False, True):
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            ram, num_gates, num_connections = build_project(args.words, batch)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        mode = 'batch' if batch else 'single'
+        results[mode] = (best, check(ram, args.words))
+        print('{:>8} {:>10} {:>12} {:>12.4f}'.format(mode, num_gates, num_connections, best))
+
+    if results['single'][1] != results['batch'][1]:
+        raise AssertionError('The RAM built in batches does not behave like the one built one gate at a time')
+    if results['batch'][1] != [bits(255 - word) for word in range(args.words)]:
+        raise AssertionError('The RAM does not read back what was written')
+    print('speedup {:.1f}x'.format(results['single'][0] / results['batch'][0]))
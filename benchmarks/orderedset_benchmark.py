@@ -0,0 +1,91 @@
+'''
+Micro-benchmarks for OrderedSet and the graph and definition edits built on it
+
+Times adding, looking up and discarding entries of sets of growing sizes, then edits whose cost is dominated by
+discarding entries: removing the edges of a vertex with many neighbours from a DirectedGraph, removing that vertex,
+and removing every gate of a definition made of NAND gates, which all share one entry in its gate types.
+Costs per operation should stay flat as sizes grow.
+
+Run from the repository root:
+    python -m benchmarks.orderedset_benchmark [--sizes 100 1000 10000] [--seed 0]
+'''
+from gates.utils.orderedset import OrderedSet
+from gates.utils.graph import DirectedGraph
+from gates.builtins import Nand
+from gates.project import Project
+import argparse
+import random
+import time
+
+def time_call(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+def set_operations(size, rng):
+    '''
+    Return the time per operation of adding, looking up, discarding and indexing entries of a set of the given size
+    '''
+    keys = list(range(size))
+    rng.shuffle(keys)
+    oset = OrderedSet()
+    times = {}
+    times['add'] = time_call(lambda: [oset.add(key) for key in keys])
+    times['contains'] = time_call(lambda: [key in oset for key in keys])
+    times['index'] = time_call(lambda: [oset[idx] for idx in range(size)])
+    times['discard'] = time_call(lambda: [oset.discard(key) for key in keys])
+    return {name: elapsed / size for name, elapsed in times.items()}
+
+def star_graph(size):
+    '''
+    Build a graph with edges from a hub to size vertices and back
+    '''
+    graph = DirectedGraph()
+    graph.add_vertex('hub')
+    for v in range(size):
+        graph.add_vertex(v)
+        graph.add_edge('hub', v)
+        graph.add_edge(v, 'hub')
+    return graph
+
+def graph_edits(size, rng):
+    '''
+    Return the time per edge of removing the edges of a hub one by one, and of removing a hub with all its edges
+    '''
+    graph = star_graph(size)
+    vertices = list(range(size))
+    rng.shuffle(vertices)
+    remove_edges = time_call(lambda: [graph.remove_edge('hub', v) for v in vertices])
+
+    graph = star_graph(size)
+    remove_leaves = time_call(lambda: [graph.remove_vertex(v) for v in vertices])
+    return {'remove_edge': remove_edges / size, 'remove_vertex': remove_leaves / size}
+
+def definition_edits(size, rng):
+    '''
+    Return the time per gate of removing every gate of a definition with size NAND gates in a chain
+    '''
+    project = Project('OrderedSet benchmark')
+    definition = project.define('Chain', [1], [1])
+    gates = [Nand() for _ in range(size)]
+    definition.add_gates(gates)
+    connections = [((definition.source, 0), (0, gates[0])), ((gates[-1], 0), (0, definition.sink))]
+    for gate, next_gate in zip(gates, gates[1:]):
+        connections.append(((gate, 0), (0, next_gate)))
+        connections.append(((gate, 0), (1, next_gate)))
+    definition.add_connections(connections)
+    rng.shuffle(gates)
+    return {'remove_gate': time_call(lambda: [definition.remove_gate(gate) for gate in gates]) / size}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark OrderedSet operations and the edits built on them')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print('{:>14} {:>8} {:>14}'.format('operation', 'size', 'us per op'))
+    for benchmark in (set_operations, graph_edits, definition_edits):
+        for size in args.sizes:
+            for name, elapsed in benchmark(size, rng).items():
+                print('{:>14} {:>8} {:>14.3f}'.format(name, size, elapsed * 1e6))
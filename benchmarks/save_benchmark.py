@@ -0,0 +1,211 @@
+'''
+Benchmark the simulator's hot paths on the bundled save files
+
+For every save, times Project.deserialize, Project.deserialize_binary and Project.serialize followed by a JSON dump.
+For every definition in it, times a full _update_order, _init_state and tick, and reports ticks/s, gates evaluated/s
+and peak memory.
+
+Baselines are machine specific, so none is committed. Record one on the machine the comparison runs on, and record
+it again after adding a metric to TIMINGS, since comparisons report metrics missing from the baseline.
+
+Run from the repository root:
+    python -m benchmarks.save_benchmark                                      Print the results
+    python -m benchmarks.save_benchmark --output benchmarks/baseline.json    Also write them as a baseline
+    python -m benchmarks.save_benchmark --compare benchmarks/baseline.json   Fail if any timing regressed
+'''
+from gates import Project
+from gates.gate_definition import GateDefinition
+from gates.profiler import Profiler
+from gates.utils import ProgramEncoder, binary
+import argparse
+import copy
+import gc
+import platform
+import tracemalloc
+import json
+import time
+import sys
+import os
+
+SAVES = ['saves/counters.json', 'saves/test0.json', 'saves/test1.json']
+# Metrics compared against baselines
+TIMINGS = ['deserialize', 'deserialize_binary', 'serialize', 'update_order', 'init_state', 'tick']
+
+def measure(function, min_time, setup=None):
+    '''
+    Return the fastest time in seconds of a call to function, calling it repeatedly for at least min_time seconds
+    As with timeit, the fastest call is the one least disturbed by other processes and garbage collection is disabled
+    while timing. setup is called before every call without being timed
+    '''
+    times = []
+    total = 0
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while len(times) == 0 or total < min_time:
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+            total += times[-1]
+    finally:
+        if enabled:
+            gc.enable()
+    return min(times)
+
+def peak_memory(function):
+    '''
+    Return the peak number of bytes allocated while calling function
+    '''
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def count_gates(definition):
+    '''
+    Count the gates evaluated by one tick of a definition at every level of nesting, as counted by the profiler
+    A compound gate counts as one gate in the definition holding it, and the gates of its own definition are only
+    counted when it is evaluated rather than answered from a truth table
+    '''
+    with Profiler() as profiler:
+        definition.tick()
+    return sum(gates for _, _, _, _, gates in profiler.get_definition_stats())
+
+def load(path):
+    with open(path, 'r') as f:
+        obj = json.load(f)
+    return obj['project'] if 'project' in obj else obj
+
+def benchmark_definition(definition, min_time):
+    '''
+    Time the hot paths of a single definition
+    '''
+    def reorder():
+        # Force a full reorder rather than reusing an incrementally maintained order
+        definition._reorder = True
+        definition._graph.untrack_order()
+
+    result = {}
+    result['update_order'] = measure(definition._update_order, min_time, setup=reorder)
+    result['init_state'] = measure(definition._init_state, min_time)
+    def restore():
+        # Every tick starts from the saved state, so that the work measured does not depend on the number of ticks run
+        definition._state = copy.deepcopy(saved_state)
+
+    saved_state = copy.deepcopy(definition._state)
+    result['tick'] = measure(definition.tick, min_time, setup=restore)
+    result['ticks_per_sec'] = 1 / result['tick']
+    restore()
+    result['gates'] = count_gates(definition)
+    result['gates_per_sec'] = result['gates'] / result['tick']
+    result['peak_memory'] = peak_memory(lambda: (definition._init_state(), definition.tick()))
+    restore()
+    return result
+
+def benchmark_save(path, min_time, names=None):
+    '''
+    Time loading and saving a project, then every definition in it
+    '''
+    obj = load(path)
+    result = {}
+    result['deserialize'] = measure(lambda: Project.deserialize(obj, {}), min_time)
+    result['peak_memory'] = peak_memory(lambda: Project.deserialize(obj, {}))
+    project = Project.deserialize(obj, {})
+    result['serialize'] = measure(lambda: json.dumps(project.serialize(), cls=ProgramEncoder, indent=4), min_time)
+    data = binary.dumps(project.serialize())
+    result['deserialize_binary'] = measure(lambda: Project.deserialize_binary(data, {}), min_time)
+    result['binary_size'] = len(data)
+    result['definitions'] = {}
+    for name, definition in project._definitions.items():
+        if isinstance(definition, GateDefinition) and (names is None or name in names):
+            result['definitions'][name] = benchmark_definition(definition, min_time)
+    return result
+
+def compare(results, baseline, tolerance, min_difference):
+    '''
+    Return a list of descriptions of the timings that are slower than in the baseline by more than the tolerance,
+    and a list of the timings that could not be compared because the baseline does not have them
+    Differences smaller than min_difference seconds are ignored, since timings that short are mostly noise
+    '''
+    regressions = []
+    missing = []
+    def check(label, new, old):
+        for metric in TIMINGS:
+            if metric not in new:
+                continue
+            if metric not in old:
+                missing.append('{} {}'.format(label, metric))
+                continue
+            if new[metric] - old[metric] < min_difference:
+                continue
+            if new[metric] > old[metric] * (1 + tolerance):
+                regressions.append('{} {}: {:.3g}s -> {:.3g}s ({:+.0%})'.format(
+                    label, metric, old[metric], new[metric], new[metric] / old[metric] - 1))
+
+    for save, result in results['saves'].items():
+        old_result = baseline['saves'].get(save, None)
+        if old_result is None:
+            missing.append(save)
+            continue
+        check(save, result, old_result)
+        for name, definition_result in result['definitions'].items():
+            if name in old_result['definitions']:
+                check('{}:{}'.format(save, name), definition_result, old_result['definitions'][name])
+            else:
+                missing.append('{}:{}'.format(save, name))
+    return regressions, missing
+
+def print_results(results, out=sys.stdout):
+    for save, result in results['saves'].items():
+        out.write(
+            '{}: deserialize {:.4f}s, deserialize binary {:.4f}s ({:.1f} KiB), serialize {:.4f}s, '
+            'peak memory {:.1f} MiB\n'.format(
+                save, result['deserialize'], result['deserialize_binary'], result['binary_size'] / 2 ** 10,
+                result['serialize'], result['peak_memory'] / 2 ** 20))
+        out.write('{:>20} {:>10} {:>12} {:>12} {:>12} {:>12} {:>14} {:>10}\n'.format(
+            'definition', 'evaluated', 'order (ms)', 'init (ms)', 'tick (ms)', 'ticks/s', 'gates/s', 'peak KiB'))
+        for name, r in result['definitions'].items():
+            out.write('{:>20} {:>10} {:>12.3f} {:>12.3f} {:>12.3f} {:>12.1f} {:>14.0f} {:>10.1f}\n'.format(
+                name, r['gates'], r['update_order'] * 1e3, r['init_state'] * 1e3, r['tick'] * 1e3,
+                r['ticks_per_sec'], r['gates_per_sec'], r['peak_memory'] / 2 ** 10))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the simulator on the bundled save files')
+    parser.add_argument('--saves', nargs='+', default=SAVES)
+    parser.add_argument('--definitions', nargs='+', default=None, help='Only benchmark these definitions')
+    parser.add_argument('--min-time', type=float, default=0.05, help='Minimum time spent timing each operation')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Compare the results against a baseline JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='Allowed slowdown relative to the baseline')
+    parser.add_argument('--min-difference', type=float, default=1e-4,
+        help='Smallest slowdown in seconds that counts as a regression')
+    args = parser.parse_args()
+
+    results = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'saves': {}
+    }
+    for path in args.saves:
+        results['saves'][os.path.basename(path)] = benchmark_save(path, args.min_time, args.definitions)
+    print_results(results)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions, missing = compare(results, baseline, args.tolerance, args.min_difference)
+        for timing in missing:
+            print('Not in the baseline: ' + timing)
+        for regression in regressions:
+            print('Regression: ' + regression)
+        if len(regressions) != 0:
+            sys.exit(1)
+        print('No regressions beyond {:.0%}'.format(args.tolerance))
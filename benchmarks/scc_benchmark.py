@@ -0,0 +1,57 @@
+'''
+Benchmark DirectedGraph.get_strongly_connected_components on large random graphs
+
+Run from the repository root:
+    python -m benchmarks.scc_benchmark [--sizes 1000 10000 100000] [--degree 2] [--seed 0]
+'''
+from gates.utils.graph import DirectedGraph
+import argparse
+import random
+import time
+
+def random_graph(num_vertices, degree, rng):
+    '''
+    Build a graph with num_vertices vertices and about degree * num_vertices random edges
+    '''
+    graph = DirectedGraph()
+    for v in range(num_vertices):
+        graph.add_vertex(v)
+    for _ in range(int(degree * num_vertices)):
+        graph.add_edge(rng.randrange(num_vertices), rng.randrange(num_vertices))
+    return graph
+
+def chain_graph(num_vertices):
+    '''
+    Build a single path through num_vertices vertices, the worst case for a recursive depth first search
+    '''
+    graph = DirectedGraph()
+    for v in range(num_vertices):
+        graph.add_vertex(v)
+    for v in range(num_vertices - 1):
+        graph.add_edge(v, v + 1)
+    return graph
+
+def time_call(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark strongly connected components on large graphs')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 300000])
+    parser.add_argument('--degree', type=float, default=1.5, help='Average number of outgoing edges per vertex')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print('{:>8} {:>10} {:>10} {:>12} {:>14} {:>14}'.format('graph', 'vertices', 'edges', 'time (s)', 'components', 'vertices/s'))
+    for num_vertices in args.sizes:
+        for kind in ('random', 'chain'):
+            if kind == 'random':
+                graph = random_graph(num_vertices, args.degree, rng)
+            else:
+                graph = chain_graph(num_vertices)
+            num_edges = sum(len(successors) for successors in graph._from_dict.values())
+            scc_time, components = time_call(graph.get_strongly_connected_components)
+            print('{:>8} {:>10} {:>10} {:>12.4f} {:>14} {:>14.0f}'.format(
+                kind, num_vertices, num_edges, scc_time, len(components), num_vertices / scc_time))
@@ -0,0 +1,16 @@
+'''
+Convert a save between the JSON and binary formats
+
+The format of the source is detected automatically, so the same command converts in either direction:
+    python convert_save.py saves/counters.json counters.lgb
+    python convert_save.py counters.lgb counters.json
+'''
+from gates.utils import binary
+import argparse
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert a save between the JSON and binary formats')
+    parser.add_argument('src', help='Save to convert')
+    parser.add_argument('dst', help='Path to write the converted save to')
+    args = parser.parse_args()
+    binary.convert(args.src, args.dst)
@@ -1,27 +1,27 @@
 from gates.gate import Gate
+from gates.utils.bus import pack, unpack
 import copy
 
 class Constant(Gate):
+    __slots__ = ('_state',)
+
     def __init__(self, dim, state=None):
         super().__init__([], [dim], name='Constant')
         if state is None:
             self._reset_state()
+        elif Gate.PACKED_BUSES:
+            self._state = [pack(value) for value in state]
         else:
             self._state = state
     
     def _reset_state(self):
-        state = []
-        if self._output_dims[0] == 1:
-            state.append(Gate.DEFAULT_VALUE)
-        else:
-            state.append([Gate.DEFAULT_VALUE] * self._output_dims[0])
-        self._state = state
+        self._state = [Gate._init_value(self._output_dims[0])]
 
     def __call__(self, inputs, state=None):
         return self._state
 
     def serialize(self):
-        return {'dim': self._output_dims[0], 'state': self._state}
+        return {'dim': self._output_dims[0], 'state': [unpack(value) for value in self._state]}
 
     def deserialize(obj):
         return Constant(**obj)
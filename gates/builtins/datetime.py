@@ -1,11 +1,17 @@
-from gates.gate import Gate
+from gates.gate import Gate, GateShape
+from gates.utils.bus import Bus
 import time
 
 class Datetime(Gate):
+    __slots__ = ()
+    _SHAPE = GateShape.get((), (64,), name='Datetime')
+
     def __init__(self):
-        super().__init__((), (64,), name='Datetime')
+        super().__init__(shape=Datetime._SHAPE)
 
     def __call__(self, inputs, state=None):
+        if Gate.PACKED_BUSES:
+            return [Bus(64, int(time.time()))]
         timestamp = [int(bit) for bit in bin(int(time.time()))[2:]]
         pad = [0]*(64 - len(timestamp))
         return [pad + timestamp]
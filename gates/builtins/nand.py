@@ -1,8 +1,11 @@
-from gates.gate import Gate
+from gates.gate import Gate, GateShape
 
 class Nand(Gate):
+    __slots__ = ()
+    _SHAPE = GateShape.get((1, 1), (1,), name='NAND')
+
     def __init__(self):
-        super().__init__((1, 1), (1,), name='NAND')
+        super().__init__(shape=Nand._SHAPE)
 
     def __call__(self, inputs, state=None):
         if type(inputs[0]) != int or type(inputs[1]) != int:
@@ -1,45 +1,172 @@
-from gates.gate import Gate
+from gates.gate import Gate, GateShape
+from gates.utils.bus import Bus
 import copy
 
+class ReshaperShape(GateShape):
+    '''
+    The shape of a reshaper, with its routing, which is fixed by the dimensions and so worked out once per shape
+    rather than on every call or for every reshaper
+    '''
+    __slots__ = ('_routing', '_segments', '_single_inputs', '_single_outputs', '_packed_segments', '_aliases')
+
+    def __init__(self, input_dims, output_dims, input_labels=None, output_labels=None, name=None):
+        super().__init__(input_dims, output_dims, input_labels, output_labels, name)
+        self._routing, self._segments = ReshaperShape._route(input_dims, output_dims)
+        self._single_inputs = all(dim == 1 for dim in input_dims)
+        self._single_outputs = all(dim == 1 for dim in output_dims)
+
+        # Segments of the packed representation as (input index, shift, mask, length) tuples, and for every output
+        # the index of the input it is an exact copy of, or None
+        self._packed_segments = []
+        self._aliases = []
+        for output_dim, segments in zip(output_dims, self._segments):
+            packed_segments = []
+            for input_idx, start, stop in segments:
+                packed_segments.append((input_idx, input_dims[input_idx] - stop, (1 << (stop - start)) - 1, stop - start))
+            self._packed_segments.append(tuple(packed_segments))
+            alias = len(segments) == 1 and output_dim > 1 and input_dims[segments[0][0]] == output_dim
+            self._aliases.append(segments[0][0] if alias else None)
+
+    @staticmethod
+    def _route(input_dims, output_dims):
+        '''
+        Return the bit-routing map, giving for every bit of every output the (input index, bit index) pair it is
+        read from, and the same map as (input index, start, stop) segments of consecutive bits of the same input
+        '''
+        bits = [(input_idx, bit_idx) for input_idx, dim in enumerate(input_dims) for bit_idx in range(dim)]
+        routing = []
+        segments = []
+        i = 0
+        for output_dim in output_dims:
+            output_bits = tuple(bits[i:i+output_dim])
+            i += output_dim
+            output_segments = []
+            for input_idx, bit_idx in output_bits:
+                if len(output_segments) != 0 and output_segments[-1][0] == input_idx:
+                    output_segments[-1][2] = bit_idx + 1
+                else:
+                    output_segments.append([input_idx, bit_idx, bit_idx + 1])
+            routing.append(output_bits)
+            segments.append(tuple(tuple(segment) for segment in output_segments))
+        return tuple(routing), tuple(segments)
+
 class Reshaper(Gate):
+    __slots__ = ()
+
     def __init__(self, input_dims, output_dims, input_labels=None, output_labels=None):
         if sum(input_dims) != sum(output_dims):
             raise ValueError('Mismatched input and output dimensions')
-        super().__init__(input_dims, output_dims, input_labels, output_labels, name='Reshaper')
+        super().__init__(shape=ReshaperShape.get(input_dims, output_dims, input_labels, output_labels, name='Reshaper'))
 
     def __call__(self, inputs, state=None):
-        flattened_inputs = []
-        for input, dim in zip(inputs, self._input_dims):
-            if dim == 1:
-                flattened_inputs.append(input)
-            else:
-                if input is not None:
-                    flattened_inputs += input
+        if Gate.PACKED_BUSES:
+            return self._call_packed(inputs)
+
+        # Outputs are always new lists, since lists of bits can be modified in place
+        shape = self._shape
+        input_dims = shape._input_dims
+        outputs = []
+        for output_dim, segments in zip(shape._output_dims, shape._segments):
+            if output_dim == 1:
+                input_idx, start, _ = segments[0]
+                input = inputs[input_idx]
+                if input_dims[input_idx] == 1 or input is None:
+                    outputs.append(input)
                 else:
-                    flattened_inputs += [None] * dim
+                    outputs.append(input[start])
+                continue
+
+            output = []
+            for input_idx, start, stop in segments:
+                input = inputs[input_idx]
+                if input_dims[input_idx] == 1:
+                    output.append(input)
+                elif input is None:
+                    output += [None] * (stop - start)
+                else:
+                    output += input[start:stop]
+            outputs.append(output)
+        return outputs
+
+    def _call_packed(self, inputs):
+        '''
+        Reshape by shifting and masking ints instead of concatenating and slicing lists
+        Buses are immutable, so outputs that are exact copies of an input are passed through without copying
+        '''
+        shape = self._shape
+        if shape._single_inputs:
+            bus = Bus.from_bits(inputs)
+            if shape._single_outputs:
+                return bus.to_bits()
+            value, unknown = bus._value, bus._unknown
+            shift = bus._dim
+            outputs = []
+            for output_dim in shape._output_dims:
+                shift -= output_dim
+                if output_dim == 1:
+                    outputs.append(None if (unknown >> shift) & 1 else (value >> shift) & 1)
+                else:
+                    outputs.append(Bus(output_dim, value >> shift, unknown >> shift))
+            return outputs
+        if shape._single_outputs:
+            value, unknown = self._concat_packed(inputs)
+            return Bus(len(shape._output_dims), value, unknown).to_bits()
 
-        i = 0
         outputs = []
-        for output_dim in self._output_dims:
+        for output_dim, segments, alias in zip(shape._output_dims, shape._packed_segments, shape._aliases):
+            if alias is not None and type(inputs[alias]) == Bus:
+                outputs.append(inputs[alias])
+                continue
+
+            value = unknown = 0
+            for input_idx, shift, mask, length in segments:
+                input = inputs[input_idx]
+                value <<= length
+                unknown <<= length
+                if type(input) == int:
+                    value |= input
+                elif input is None:
+                    unknown |= mask
+                else:
+                    if type(input) != Bus:
+                        input = Bus.from_bits(input)
+                    value |= (input._value >> shift) & mask
+                    unknown |= (input._unknown >> shift) & mask
             if output_dim == 1:
-                outputs.append(flattened_inputs[i])
+                outputs.append(None if unknown else value)
             else:
-                curr_output = flattened_inputs[i:i+output_dim]
-                # if None in curr_output:
-                #     outputs.append(None)
-                # else:
-                #     outputs.append(curr_output)
-                outputs.append(curr_output)
-            i += output_dim
-        
+                outputs.append(Bus._normalized(output_dim, value, unknown))
         return outputs
 
+    def _concat_packed(self, inputs):
+        '''
+        Return the value and mask of unknown bits of the concatenated inputs
+        '''
+        value = unknown = 0
+        for input, dim in zip(inputs, self._shape._input_dims):
+            value <<= dim
+            unknown <<= dim
+            if dim == 1:
+                if type(input) != int:
+                    unknown |= 1
+                else:
+                    value |= input
+            elif input is None:
+                unknown |= (1 << dim) - 1
+            else:
+                if type(input) != Bus:
+                    input = Bus.from_bits(input)
+                value |= input._value
+                unknown |= input._unknown
+        return value, unknown
+
     def serialize(self):
+        # Copies, since the lists of the shape are shared with every reshaper of the same shape
         return {
-            'input_dims': self._input_dims,
-            'output_dims': self._output_dims,
-            'input_labels': self._input_labels,
-            'output_labels': self._output_labels
+            'input_dims': list(self._input_dims),
+            'output_dims': list(self._output_dims),
+            'input_labels': list(self._input_labels),
+            'output_labels': list(self._output_labels)
         }
     
     def deserialize(obj):
@@ -54,4 +181,11 @@ class Reshaper(Gate):
         )
 
     def _duplicate_state(self, state):
-        return None
\ No newline at end of file
+        return None
+
+    @property
+    def routing(self):
+        '''
+        For every output, a tuple of the (input index, bit index) pairs its bits are read from
+        '''
+        return self._shape._routing
\ No newline at end of file
@@ -1,9 +1,12 @@
-from gates.gate import Gate
+from gates.gate import Gate, GateShape
 import copy
 
 class Sink(Gate):
+    __slots__ = ()
+
     def __init__(self, dims, labels=None):
-        super().__init__(dims, [], input_labels=labels, name='Sink')
+        # The shape is not interned, since it holds the dims and labels of a definition, which edits them in place
+        super().__init__(shape=GateShape(dims, [], input_labels=labels, name='Sink'))
 
     def _init_state(self):
         return super()._init_inputs()
@@ -1,18 +1,15 @@
-from gates.gate import Gate
+from gates.gate import Gate, GateShape
 import copy
 
 class Source(Gate):
+    __slots__ = ()
+
     def __init__(self, dims, labels=None):
-        super().__init__([], dims, output_labels=labels, name='Source')
+        # The shape is not interned, since it holds the dims and labels of a definition, which edits them in place
+        super().__init__(shape=GateShape([], dims, output_labels=labels, name='Source'))
     
     def _init_state(self):
-        state = []
-        for output_dim in self._output_dims:
-            if output_dim == 1:
-                state.append(Gate.DEFAULT_VALUE)
-            else:
-                state.append([Gate.DEFAULT_VALUE] * output_dim)
-        return state
+        return [Gate._init_value(output_dim) for output_dim in self._output_dims]
 
     def __call__(self, inputs, state=None):
         return state
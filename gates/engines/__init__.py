@@ -0,0 +1,5 @@
+from gates.engines.netlist import Netlist, get_netlist
+from gates.engines.netlist_engine import NetlistEngine
+from gates.engines.bitsliced import BitslicedEngine, evaluate_vectors
+from gates.engines.codegen import CodegenEngine
+from gates.engines.event_driven import EventDrivenEngine
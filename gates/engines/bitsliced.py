@@ -0,0 +1,174 @@
+from gates.engines.netlist import NAND_TABLE, UNKNOWN, get_netlist, port_bits
+
+CHAR_BITS = {'0': 0, '1': 1, 'x': None}
+
+class BitslicedEngine:
+    '''
+    Evaluates many independent input vectors at once by running a definition's netlist with bitwise operations.
+
+    Every slot holds two Python ints used as bitmasks, one bit per lane: the values of the slot and a mask of
+    the lanes in which the value is known. A NAND is then computed for every lane with a handful of big-int
+    operations. Each lane has its own copy of the definition's state, so stateful gates are supported per lane.
+    '''
+    def __init__(self, definition, num_lanes, netlist=None):
+        if num_lanes < 1:
+            raise ValueError('Invalid number of lanes: {}'.format(num_lanes))
+        if netlist is None:
+            netlist = get_netlist(definition)
+        self._definition = definition
+        self._netlist = netlist
+        self._num_lanes = num_lanes
+        self._mask = (1 << num_lanes) - 1
+
+        # Convert the schedule to (is nand, a, b, out) tuples
+        self._ops = [(table is NAND_TABLE, a, b, out) for table, a, b, out in netlist._ops]
+
+        self._values = [0] * netlist._num_slots
+        self._known = [0] * netlist._num_slots
+        self.load_state()
+
+    def _broadcast(self, slot, bit):
+        '''
+        Set a slot to the same bit in every lane
+        '''
+        self._values[slot] = self._mask if bit == 1 else 0
+        self._known[slot] = 0 if bit == UNKNOWN else self._mask
+
+    def load_state(self, state=None):
+        '''
+        Copy a state into every lane, defaulting to the definition's state
+        '''
+        if state is None:
+            state = self._definition._state
+        values = self._netlist.init_values()
+        self._netlist.load_state(values, state, self._netlist.bind_state(state))
+        for slot, bit in enumerate(values):
+            self._broadcast(slot, bit)
+
+    def lane_values(self, lane):
+        '''
+        Return the values of a single lane in the same format used by NetlistEngine
+        '''
+        values = self._netlist.init_values()
+        for slot in range(len(values)):
+            if (self._known[slot] >> lane) & 1:
+                values[slot] = (self._values[slot] >> lane) & 1
+            else:
+                values[slot] = UNKNOWN
+        return values
+
+    def store_state(self, lane, state=None):
+        '''
+        Copy the state of a single lane into a state, defaulting to the definition's state
+        '''
+        if state is None:
+            state = self._definition._state
+        self._netlist.store_state(self.lane_values(lane), state, self._netlist.bind_state(state))
+
+    def set_inputs(self, vectors):
+        '''
+        Set the definition's inputs for every lane
+        params:
+            vectors     List with one entry per lane, each holding the definition's inputs in the interpreter's format
+        '''
+        if len(vectors) != self._num_lanes:
+            raise ValueError('Expected {} input vectors, got {}'.format(self._num_lanes, len(vectors)))
+        for idx, port in enumerate(self._netlist._inputs):
+            # Transpose the vectors into one column of bits per slot, with the last lane first
+            columns = zip(*[port_bits(port, inputs[idx]) for inputs in reversed(vectors)])
+            for slot, column in zip(port, columns):
+                self._values[slot] = int(''.join(['1' if bit == 1 else '0' for bit in column]), 2)
+                if UNKNOWN in column:
+                    self._known[slot] = int(''.join(['0' if bit == UNKNOWN else '1' for bit in column]), 2)
+                else:
+                    self._known[slot] = self._mask
+
+    def _lane_chars(self, slot):
+        '''
+        Return a string with one character ('0', '1' or 'x' for unknown) per lane for the given slot
+        '''
+        width = '0{}b'.format(self._num_lanes)
+        chars = format(self._values[slot], width)[::-1]
+        known = self._known[slot]
+        if known != self._mask:
+            known_chars = format(known, width)[::-1]
+            chars = ''.join([c if k == '1' else 'x' for c, k in zip(chars, known_chars)])
+        return chars
+
+    def get_outputs(self):
+        '''
+        Return the definition's outputs for every lane in the interpreter's format
+        '''
+        outputs = [[] for _ in range(self._num_lanes)]
+        for port in self._netlist._outputs:
+            # Transpose the port's slots into one row of bits per lane
+            rows = zip(*[self._lane_chars(slot) for slot in port])
+            for lane_outputs, row in zip(outputs, rows):
+                bits = [CHAR_BITS[c] for c in row]
+                lane_outputs.append(bits[0] if len(port) == 1 else bits)
+        return outputs
+
+    def tick(self, num_ticks=1):
+        '''
+        Advance every lane by num_ticks ticks
+        '''
+        values, known = self._values, self._known
+        ops = self._ops
+        for _ in range(num_ticks):
+            for slot, bit in self._netlist.refresh_bits():
+                self._broadcast(slot, bit)
+            for is_nand, a, b, out in ops:
+                if is_nand:
+                    k = known[a] & known[b]
+                    values[out] = ~(values[a] & values[b]) & k
+                    known[out] = k
+                else:
+                    values[out] = values[a]
+                    known[out] = known[a]
+
+    def run_sequences(self, sequences):
+        '''
+        Run one sequence of inputs per lane, one tick per input, and return the outputs after every tick
+        Shorter sequences hold their last input. Returns a list with one list of outputs per lane
+        '''
+        if len(sequences) != self._num_lanes:
+            raise ValueError('Expected {} sequences, got {}'.format(self._num_lanes, len(sequences)))
+        num_ticks = max(len(sequence) for sequence in sequences)
+        traces = [[] for _ in sequences]
+        for t in range(num_ticks):
+            self.set_inputs([sequence[min(t, len(sequence) - 1)] for sequence in sequences])
+            self.tick()
+            for trace, outputs in zip(traces, self.get_outputs()):
+                trace.append(outputs)
+        return traces
+
+    @property
+    def num_lanes(self):
+        return self._num_lanes
+
+    @property
+    def netlist(self):
+        return self._netlist
+
+    @property
+    def definition(self):
+        return self._definition
+
+def evaluate_vectors(definition, vectors, num_ticks=1, lanes=None):
+    '''
+    Evaluate a definition for every input vector, starting each from the definition's current state
+    Vectors are processed in batches of at most lanes vectors. Returns one list of outputs per vector
+    '''
+    if len(vectors) == 0:
+        return []
+    if lanes is None:
+        lanes = len(vectors)
+    netlist = get_netlist(definition)
+    outputs = []
+    for i in range(0, len(vectors), lanes):
+        batch = vectors[i:i+lanes]
+        engine = BitslicedEngine(definition, len(batch), netlist)
+        engine.set_inputs(batch)
+        engine.tick(num_ticks)
+        outputs += engine.get_outputs()
+    return outputs
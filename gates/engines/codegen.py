@@ -0,0 +1,105 @@
+from gates.engines.netlist import NAND_TABLE, UNKNOWN, get_netlist
+from gates.engines.netlist_engine import NetlistEngine
+import hashlib
+import weakref
+import time
+
+# Code objects indexed by a hash of the generated source, shared by netlists with the same structure
+_code_cache = {}
+
+# Functions indexed by netlist
+_functions = weakref.WeakKeyDictionary()
+
+def generate_source(netlist, name='run'):
+    '''
+    Generate the source for a function run(v, n) that evaluates the netlist's schedule n times.
+
+    Every slot becomes a local variable and every NAND a 1 - (a & b) expression. Slots that are read before
+    they are written (inputs, constants and the outputs of cut gates) are loaded from v once, carried across
+    iterations in their locals and written back to v along with every other slot at the end.
+    The function returns False without doing anything if any of the loaded values is unknown.
+    '''
+    # Find the slots whose values have to be loaded from v
+    live_in = []
+    written = set()
+    for table, a, b, out in netlist._ops:
+        operands = (a, b) if table is NAND_TABLE else (a,)
+        for slot in operands:
+            if slot not in written and slot not in live_in:
+                live_in.append(slot)
+        written.add(out)
+    for port in netlist._outputs:
+        for slot in port:
+            if slot not in written and slot not in live_in:
+                live_in.append(slot)
+    datetime_slots = [slot for port in netlist._datetimes for slot in port]
+    live_in = [slot for slot in live_in if slot not in datetime_slots]
+
+    lines = ['def {}(v, n):'.format(name)]
+    lines.append('    if n < 1:')
+    lines.append('        return True')
+    for slot in live_in:
+        lines.append('    s{} = v[{}]'.format(slot, slot))
+    if len(live_in) != 0:
+        lines.append('    if {} in ({},):'.format(UNKNOWN, ', '.join('s{}'.format(slot) for slot in live_in)))
+        lines.append('        return False')
+    lines.append('    for _ in range(n):')
+    if len(datetime_slots) != 0:
+        lines.append('        t = int(time())')
+        for port in netlist._datetimes:
+            for i, slot in enumerate(port):
+                lines.append('        s{} = (t >> {}) & 1'.format(slot, len(port) - 1 - i))
+    for table, a, b, out in netlist._ops:
+        if table is NAND_TABLE:
+            lines.append('        s{} = 1 - (s{} & s{})'.format(out, a, b))
+        else:
+            lines.append('        s{} = s{}'.format(out, a))
+    if len(netlist._ops) == 0 and len(datetime_slots) == 0:
+        lines.append('        pass')
+    for slot in sorted(written.union(datetime_slots)):
+        lines.append('    v[{}] = s{}'.format(slot, slot))
+    lines.append('    return True')
+    return '\n'.join(lines) + '\n'
+
+def get_function(netlist):
+    '''
+    Return the generated function for a netlist, compiling its source only if no netlist with the same
+    structure was compiled before
+    '''
+    function = _functions.get(netlist, None)
+    if function is None:
+        source = generate_source(netlist)
+        key = hashlib.sha1(source.encode()).hexdigest()
+        code = _code_cache.get(key, None)
+        if code is None:
+            code = compile(source, '<netlist {}>'.format(netlist._definition._name), 'exec')
+            _code_cache[key] = code
+        namespace = {'time': time.time}
+        exec(code, namespace)
+        function = namespace['run']
+        _functions[netlist] = function
+    return function
+
+class CodegenEngine(NetlistEngine):
+    '''
+    Runs a definition's netlist through a generated straight-line Python function.
+
+    The netlist and the generated function are cached per definition and reused until the definition or one
+    of its dependencies changes. Whenever a value the function depends on is unknown (None), the engine falls
+    back to evaluating the netlist's schedule directly.
+    '''
+    def __init__(self, definition, netlist=None):
+        if netlist is None:
+            netlist = get_netlist(definition)
+        super().__init__(definition, netlist)
+        self._function = get_function(netlist)
+
+    def tick(self, num_ticks=1, store=True):
+        '''
+        Advance the simulation by num_ticks ticks
+        '''
+        self._netlist.refresh(self._values)
+        if not self._function(self._values, num_ticks):
+            self._netlist.run(self._values, num_ticks)
+        if store:
+            self.store_state()
@@ -0,0 +1,143 @@
+from gates.engines.netlist import NAND_TABLE, get_netlist
+from gates.engines.netlist_engine import NetlistEngine
+import heapq
+
+class EventDrivenEngine(NetlistEngine):
+    '''
+    Runs a definition's netlist by only re-evaluating the operations whose operands changed.
+
+    Each slot keeps the list of operations that read it (its fanout). Within a tick, operations are popped
+    from a work queue in schedule order. When an operation changes its output, the readers later in the
+    schedule are queued for the current tick, while readers at or before it (which read the previous tick's
+    value through a cut edge) are queued for the next tick. This gives the same values as evaluating the whole
+    schedule every tick, at a cost proportional to the number of wires that change.
+
+    Storing the values back into the definition's state is incremental too: only the bindings holding a slot that
+    changed since the last store are written back.
+    '''
+    def __init__(self, definition, netlist=None):
+        if netlist is None:
+            netlist = get_netlist(definition)
+
+        # Index the operations that read each slot
+        self._readers = [[] for _ in range(netlist._num_slots)]
+        for i, (table, a, b, out) in enumerate(netlist._ops):
+            self._readers[a].append(i)
+            if table is NAND_TABLE and b != a:
+                self._readers[b].append(i)
+
+        self._dirty = set(range(len(netlist._ops)))  # Operations to evaluate on the next tick
+        self._loaded = None                          # Slots written by load_state
+        self._num_evaluated = 0                      # Number of operations evaluated so far
+        self._changed = set()                        # Slots that changed since the state was last stored
+        self._slot_bindings = {}                     # Indexed by slot. Stores the indices of the bindings holding it
+        self._store_all = True                       # Whether the next store writes back every binding
+        super().__init__(definition, netlist)
+
+    def _set_slot(self, slot, value):
+        '''
+        Set a slot from outside the schedule, queueing its readers for the next tick if it changed
+        '''
+        if self._values[slot] != value:
+            self._values[slot] = value
+            self._dirty.update(self._readers[slot])
+            self._changed.add(slot)
+
+    def load_state(self):
+        '''
+        Copy the definition's state into the engine, queueing only the readers of values that changed
+        '''
+        first_load = self._loaded is None
+        values = self._values
+        self._values = bytearray(values)
+        super().load_state()
+        values, self._values = self._values, values
+
+        # Only the slots of the inputs and the loaded bindings can change
+        self._loaded = [slot for port in self._netlist._inputs for slot in port]
+        for _, _, _, ports, load in self._bound:
+            if load:
+                self._loaded += [slot for port in ports for slot in port]
+        if first_load:
+            self._values = values
+        else:
+            for slot in self._loaded:
+                self._set_slot(slot, values[slot])
+
+        self._slot_bindings = {}
+        for idx, (_, _, _, ports, _) in enumerate(self._bound):
+            for port in ports:
+                for slot in port:
+                    self._slot_bindings.setdefault(slot, []).append(idx)
+        # The bindings that are not loaded may not match the values yet
+        self._store_all = True
+
+    def store_state(self):
+        '''
+        Copy the values that changed since the last store back into the definition's state
+        '''
+        if self._store_all:
+            super().store_state()
+            self._store_all = False
+        else:
+            slot_bindings = self._slot_bindings
+            indices = {idx for slot in self._changed if slot in slot_bindings for idx in slot_bindings[slot]}
+            self._netlist.store_state(self._values, self._definition._state, [self._bound[idx] for idx in indices])
+        self._changed = set()
+
+    def restore_values(self, values):
+        '''
+        Put back values returned by save_values, after which every operation is evaluated again
+        '''
+        super().restore_values(values)
+        self._dirty = set(range(len(self._netlist._ops)))
+        self._store_all = True
+
+    def set_inputs(self, inputs):
+        '''
+        Set the definition's inputs without going through its state
+        '''
+        values = bytearray(self._values)
+        self._netlist.write_inputs(values, inputs)
+        for port in self._netlist._inputs:
+            for slot in port:
+                self._set_slot(slot, values[slot])
+
+    def tick(self, num_ticks=1, store=True):
+        '''
+        Advance the simulation by num_ticks ticks
+        '''
+        values = self._values
+        ops = self._netlist._ops
+        readers = self._readers
+        changed = self._changed
+        for _ in range(num_ticks):
+            for slot, bit in self._netlist.refresh_bits():
+                self._set_slot(slot, bit)
+
+            # Operations queued for the next tick are stored in a new set while this one is processed
+            scheduled = self._dirty
+            self._dirty = set()
+            queue = list(scheduled)
+            heapq.heapify(queue)
+            self._num_evaluated += len(queue)
+            while len(queue) != 0:
+                i = heapq.heappop(queue)
+                table, a, b, out = ops[i]
+                value = table[values[a]][values[b]]
+                if values[out] != value:
+                    values[out] = value
+                    changed.add(out)
+                    for j in readers[out]:
+                        if j <= i:
+                            self._dirty.add(j)
+                        elif j not in scheduled:
+                            scheduled.add(j)
+                            heapq.heappush(queue, j)
+                            self._num_evaluated += 1
+        if store:
+            self.store_state()
+
+    @property
+    def num_evaluated(self):
+        return self._num_evaluated
@@ -0,0 +1,411 @@
+from gates.builtins import Nand, Reshaper, Constant, Datetime, Source, Sink
+from gates.gate_definition import CompoundGate
+from gates.gate import Gate
+from gates.state_store import OBJECT, VALUES
+from gates.utils.bus import Bus
+import weakref
+import time
+
+UNKNOWN = 2       # Value used in place of None for a single bit
+ZERO_SLOT = 0     # Slot that always holds a 0, used for unconnected inputs
+UNKNOWN_SLOT = 1  # Slot that always holds UNKNOWN, used for inputs whose source has no value
+
+# Lookup tables indexed by the values of an operation's two operands
+NAND_TABLE = ((1, 1, UNKNOWN), (1, 0, UNKNOWN), (UNKNOWN, UNKNOWN, UNKNOWN))
+COPY_TABLE = ((0, 0, 0), (1, 1, 1), (UNKNOWN, UNKNOWN, UNKNOWN))
+
+# Netlists compiled by get_netlist, indexed by definition. Stores (stamp, netlist) pairs
+_netlists = weakref.WeakKeyDictionary()
+
+# Kinds of state bindings
+OUTPUTS = 0  # The stored outputs of a gate
+SOURCE = 1   # The state of a source gate, which is also its outputs
+SINK = 2     # The state of a sink gate, which holds its last inputs
+
+class Netlist:
+    '''
+    A definition flattened down to its NAND, Reshaper, Constant, Datetime, Source and Sink primitives.
+
+    Every bit of every wire is given an index (a slot) into a flat array of values. Ports are tuples of slots,
+    one slot per bit. Reshapers and compound gate boundaries are resolved at compile time by aliasing slots
+    wherever that does not change what a reader observes, so the evaluation schedule only contains NANDs and
+    the few copies needed to preserve the interpreter's semantics for feedback (cut) edges.
+
+    Each operation in the schedule is a (table, a, b, out) tuple and is evaluated as
+        values[out] = table[values[a]][values[b]]
+    '''
+    def __init__(self, definition):
+        self._definition = definition
+        self._num_slots = 2
+        self._ops = []          # The evaluation schedule
+        self._constants = []    # List of (constant gate, port) pairs refreshed at the start of every tick
+        self._datetimes = []    # List of ports that receive the current timestamp at the start of every tick
+        self._inputs = None     # Ports for the definition's inputs
+        self._outputs = None    # Ports for the definition's outputs
+        self._bindings = []     # List of (kind, path, uid, ports, load) tuples tying slots to the nested state
+        self._num_gates = 0     # Number of primitive gates evaluated per tick
+        self._layout = None     # Layout of the state stores last bound by bind_layout, with its bindings below
+        self._layout_bindings = None
+
+        self._pending = set()   # Slots that will be written later in the schedule
+        self._outputs = self._compile_instance(definition, None, (), True)
+        del self._pending
+
+    def _allocate(self, dim, pending=False):
+        '''
+        Allocate a port with dim slots
+        '''
+        port = tuple(range(self._num_slots, self._num_slots + dim))
+        self._num_slots += dim
+        if pending:
+            self._pending.update(port)
+        return port
+
+    def _copy(self, src_ports, dst_ports):
+        '''
+        Append copy operations from one list of ports to another
+        '''
+        for src_port, dst_port in zip(src_ports, dst_ports):
+            for src, dst in zip(src_port, dst_port):
+                self._ops.append((COPY_TABLE, src, ZERO_SLOT, dst))
+
+    def _route(self, ports, own_ports):
+        '''
+        Return ports that alias the given ones if it is safe to do so, otherwise copy them into dedicated ports
+        '''
+        if own_ports is None:
+            # Aliasing is only safe if none of the slots will be overwritten later in the tick
+            if not any(slot in self._pending for port in ports for slot in port):
+                return ports
+            own_ports = [self._allocate(len(port)) for port in ports]
+        self._copy(ports, own_ports)
+        return own_ports
+
+    def _gather_inputs(self, definition, gate, plan, ports):
+        '''
+        Resolve the ports connected to each of a gate's inputs using its gather plan
+        '''
+        inputs = [(ZERO_SLOT,) * dim for dim in gate._input_dims]
+        for predecessor_slot, output_idx, input_idx, _ in plan:
+            predecessor_ports = ports.get(definition._order[predecessor_slot], None)
+            if predecessor_ports is None:
+                # Predecessor has neither been computed nor stored, so its outputs are unknown
+                inputs[input_idx] = (UNKNOWN_SLOT,) * gate._input_dims[input_idx]
+            else:
+                inputs[input_idx] = predecessor_ports[output_idx]
+        return inputs
+
+    def _compile_instance(self, definition, input_ports, path, top):
+        '''
+        Flatten a definition, returning the ports connected to its sink
+        '''
+        definition._update_order()
+        source_uid, sink_uid = definition._source._uid, definition._sink._uid
+
+        if top:
+            input_ports = [self._allocate(dim) for dim in definition._input_dims]
+            self._inputs = input_ports
+        ports = {source_uid: input_ports}
+
+        # The outputs of cut gates are read before they are computed, so they need dedicated slots up front
+        for gate_uid in definition._cut_gates:
+            if top or gate_uid in definition._rooted_gates:
+                gate = definition._gates[gate_uid]
+                ports[gate_uid] = [self._allocate(dim, pending=True) for dim in gate._output_dims]
+                self._bindings.append((OUTPUTS, path, gate_uid, ports[gate_uid], True))
+
+        final = [(ZERO_SLOT,) * dim for dim in definition._output_dims]
+        for gate_uid, plan in zip(definition._order, definition._gather_plans):
+            # The top level definition evaluates every gate, instances only evaluate those connected to the sink
+            if gate_uid == source_uid or not (top or gate_uid in definition._rooted_gates):
+                continue
+
+            gate = definition._gates[gate_uid]
+            inputs = self._gather_inputs(definition, gate, plan, ports)
+            if gate_uid == sink_uid:
+                final = inputs
+                continue
+
+            own_ports = ports.get(gate_uid, None)
+            gate_ports = self._compile_gate(gate, inputs, own_ports, path)
+            if own_ports is None:
+                # Outputs that are not read before they are computed only ever need to be stored
+                ports[gate_uid] = gate_ports
+                self._bindings.append((OUTPUTS, path, gate_uid, gate_ports, False))
+            else:
+                for port in own_ports:
+                    self._pending.difference_update(port)
+        return final
+
+    def _compile_gate(self, gate, inputs, own_ports, path):
+        '''
+        Append the operations for a single gate to the schedule and return its output ports
+        '''
+        if isinstance(gate, Nand):
+            self._num_gates += 1
+            (a,), (b,) = inputs
+            if own_ports is None:
+                own_ports = [self._allocate(1)]
+            self._ops.append((NAND_TABLE, a, b, own_ports[0][0]))
+            return own_ports
+        elif isinstance(gate, Reshaper):
+            ports = [tuple(inputs[input_idx][bit_idx] for input_idx, bit_idx in bits) for bits in gate.routing]
+            return self._route(ports, own_ports)
+        elif isinstance(gate, CompoundGate):
+            ports = self._compile_instance(gate._definition, inputs, path + (gate._uid,), False)
+            return self._route(ports, own_ports)
+        elif isinstance(gate, Constant):
+            self._num_gates += 1
+            ports = own_ports or [self._allocate(dim) for dim in gate._output_dims]
+            self._constants.append((gate, ports))
+            return ports
+        elif isinstance(gate, Datetime):
+            self._num_gates += 1
+            ports = own_ports or [self._allocate(dim) for dim in gate._output_dims]
+            self._datetimes.append(ports[0])
+            return ports
+        elif isinstance(gate, Source):
+            ports = own_ports or [self._allocate(dim) for dim in gate._output_dims]
+            self._bindings.append((SOURCE, path, gate._uid, ports, True))
+            return ports
+        elif isinstance(gate, Sink):
+            self._num_gates += 1
+            state_ports = [self._allocate(dim) for dim in gate._input_dims]
+            self._copy(inputs, state_ports)
+            self._bindings.append((SINK, path, gate._uid, state_ports, True))
+            return []
+        else:
+            raise ValueError('Cannot compile {}'.format(gate))
+
+    def init_values(self):
+        '''
+        Return a new array of values for the netlist with every slot unknown
+        '''
+        values = bytearray([UNKNOWN]) * self._num_slots
+        values[ZERO_SLOT] = 0
+        return values
+
+    def bind_state(self, state):
+        '''
+        Resolve the netlist's bindings against a definition's state, keeping only those present in the state
+        Returns a list of (kind, nested state, uid, ports, load) tuples
+        '''
+        bound = []
+        nested_states = {(): state}
+        for kind, path, uid, ports, load in self._bindings:
+            # Follow the path of compound gate uids down to the nested state
+            for i in range(len(path)):
+                if path[:i+1] not in nested_states:
+                    parent_state = nested_states[path[:i]]
+                    if parent_state is None or path[i] not in parent_state:
+                        nested_states[path[:i+1]] = None
+                    else:
+                        nested_states[path[:i+1]] = parent_state[path[i]][0]
+            nested_state = nested_states[path]
+            if nested_state is None or uid not in nested_state:
+                continue
+
+            # The interpreter only updates stored outputs that are not None
+            gate_state, gate_outputs = nested_state[uid]
+            if kind == OUTPUTS and gate_outputs is None:
+                continue
+            if kind != OUTPUTS and gate_state is None:
+                continue
+            bound.append((kind, nested_state, uid, ports, load))
+        return bound
+
+    def bind_layout(self, layout):
+        '''
+        Resolve the netlist's bindings against the layout of a state store, as bind_state does against a state
+        Returns (loaded, stored) lists of (slot, offset) pairs for the bits copied from the store's buffer before a
+        tick and back into it after, or None if a bound value is not stored as bits in the buffer. The result for
+        the last layout is kept, since the stores of a running definition share their layout
+        '''
+        if layout is not self._layout:
+            self._layout_bindings = self._bind_layout(layout)
+            self._layout = layout
+        return self._layout_bindings
+
+    def _bind_layout(self, layout):
+        def pairs(ports, specs):
+            if specs is None or len(specs) != len(ports):
+                return None
+            result = []
+            for port, (kind, offset, dim) in zip(ports, specs):
+                if kind == OBJECT or dim != len(port):
+                    return None
+                result += zip(port, range(offset, offset + dim))
+            return result
+
+        loaded = pairs(self._inputs, layout._offsets.get(((), 'inputs'), None))
+        stored = pairs(self._outputs, layout._offsets.get(((), 'outputs'), None))
+        if loaded is None or stored is None:
+            return None
+        for kind, path, uid, ports, load in self._bindings:
+            entry = layout.get_entry(path, uid)
+            if entry is None:
+                continue
+            state_spec, value_specs = entry
+
+            # The interpreter only updates stored outputs that are not None, as in bind_state
+            if kind == OUTPUTS:
+                if value_specs is None:
+                    continue
+                specs = value_specs
+            else:
+                if state_spec is None:
+                    continue
+                if state_spec[0] != VALUES:
+                    return None
+                specs = state_spec[1]
+
+            bound = pairs(ports, specs)
+            if bound is None:
+                return None
+            if load:
+                loaded += bound
+            if kind != SOURCE:
+                stored += bound
+        return loaded, stored
+
+    def load_state(self, values, state, bound):
+        '''
+        Copy a definition's state into an array of values
+        '''
+        self.write_inputs(values, state['inputs'])
+        for kind, nested_state, uid, ports, load in bound:
+            if load:
+                gate_state, gate_outputs = nested_state[uid]
+                for port, value in zip(ports, gate_outputs if kind == OUTPUTS else gate_state):
+                    write_port(values, port, value)
+
+    def store_state(self, values, state, bound):
+        '''
+        Copy an array of values back into a definition's state
+        '''
+        for kind, nested_state, uid, ports, _ in bound:
+            if kind == OUTPUTS:
+                nested_state[uid] = (nested_state[uid][0], [read_port(values, port) for port in ports])
+            elif kind == SINK:
+                gate_state = nested_state[uid][0]
+                for i, port in enumerate(ports):
+                    gate_state[i] = read_port(values, port)
+        state['outputs'] = self.read_outputs(values)
+
+    def read_outputs(self, values):
+        '''
+        Return the definition's outputs in the same format as the interpreter
+        '''
+        return [read_port(values, port) for port in self._outputs]
+
+    def write_inputs(self, values, inputs):
+        '''
+        Set the definition's inputs
+        '''
+        for port, value in zip(self._inputs, inputs):
+            write_port(values, port, value)
+
+    def refresh_bits(self):
+        '''
+        Return a list of (slot, bit) pairs holding the current outputs of constants and datetimes
+        '''
+        refreshed = []
+        for gate, ports in self._constants:
+            for port, value in zip(ports, gate._state):
+                refreshed += zip(port, port_bits(port, value))
+        if len(self._datetimes) != 0:
+            timestamp = int(time.time())
+            bits = [(timestamp >> i) & 1 for i in range(63, -1, -1)]
+            for port in self._datetimes:
+                refreshed += zip(port, bits)
+        return refreshed
+
+    def refresh(self, values):
+        '''
+        Update the slots of constants and datetimes
+        '''
+        for slot, bit in self.refresh_bits():
+            values[slot] = bit
+
+    def run(self, values, num_ticks=1):
+        '''
+        Evaluate the schedule num_ticks times
+        '''
+        ops = self._ops
+        for _ in range(num_ticks):
+            self.refresh(values)
+            for table, a, b, out in ops:
+                values[out] = table[values[a]][values[b]]
+
+    @property
+    def definition(self):
+        return self._definition
+
+    @property
+    def combinational(self):
+        '''
+        Whether the netlist has no feedback, i.e. no output is ever read before it is computed
+        '''
+        return not any(kind == OUTPUTS and load for kind, _, _, _, load in self._bindings)
+
+    @property
+    def num_slots(self):
+        return self._num_slots
+
+    @property
+    def num_gates(self):
+        return self._num_gates
+
+    @property
+    def ops(self):
+        return self._ops
+
+    @property
+    def inputs(self):
+        return tuple(self._inputs)
+
+    @property
+    def outputs(self):
+        return tuple(self._outputs)
+
+def port_bits(port, value):
+    '''
+    Split a wire value in the interpreter's format (an int, a list of ints or None) into one bit per slot
+    '''
+    if len(port) == 1:
+        bits = (value,)
+    elif value is None:
+        bits = (None,) * len(port)
+    else:
+        bits = value
+    return [bit if type(bit) == int else UNKNOWN for bit in bits]
+
+def write_port(values, port, value):
+    '''
+    Write a wire value in the interpreter's format into a port
+    '''
+    for slot, bit in zip(port, port_bits(port, value)):
+        values[slot] = bit
+
+def read_port(values, port):
+    '''
+    Read a port's value in the interpreter's format
+    '''
+    if len(port) == 1:
+        bit = values[port[0]]
+        return None if bit == UNKNOWN else bit
+    bits = [None if values[slot] == UNKNOWN else values[slot] for slot in port]
+    return Bus.from_bits(bits) if Gate.PACKED_BUSES else bits
+
+def get_netlist(definition):
+    '''
+    Return a netlist for the definition, reusing the last one compiled unless the definition or one of its
+    dependencies has changed since
+    '''
+    stamp = definition._get_stamp()
+    cached = _netlists.get(definition, None)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    netlist = Netlist(definition)
+    _netlists[definition] = (stamp, netlist)
+    return netlist
@@ -0,0 +1,151 @@
+from gates.engines.netlist import Netlist
+
+class NetlistEngine:
+    '''
+    Runs a definition's ticks against its compiled netlist instead of interpreting its gates.
+
+    The engine keeps its own array of values. The definition's state is copied in when the engine is created
+    or when load_state is called, and copied back out after every call to tick.
+    '''
+    def __init__(self, definition, netlist=None):
+        if netlist is None:
+            netlist = Netlist(definition)
+        self._definition = definition
+        self._netlist = netlist
+        self._values = netlist.init_values()
+        self._bound = None
+        self.load_state()
+
+    def load_state(self):
+        '''
+        Copy the definition's state into the engine, e.g. after its inputs were changed
+        '''
+        self._bound = self._netlist.bind_state(self._definition._state)
+        self._netlist.load_state(self._values, self._definition._state, self._bound)
+
+    def store_state(self):
+        '''
+        Copy the engine's values back into the definition's state
+        '''
+        self._netlist.store_state(self._values, self._definition._state, self._bound)
+
+    def set_inputs(self, inputs):
+        '''
+        Set the definition's inputs without going through its state
+        '''
+        self._netlist.write_inputs(self._values, inputs)
+
+    def save_values(self):
+        '''
+        Return a copy of the engine's values, which restore_values puts back
+        '''
+        return bytes(self._values)
+
+    def restore_values(self, values):
+        '''
+        Put back values returned by save_values
+        '''
+        self._values[:] = values
+
+    def tick(self, num_ticks=1, store=True):
+        '''
+        Advance the simulation by num_ticks ticks
+        '''
+        self._netlist.run(self._values, num_ticks)
+        if store:
+            self.store_state()
+
+    def _detects_cycles(self, detect_cycles):
+        '''
+        Values only determine the following ticks when no datetimes are involved
+        '''
+        return detect_cycles and len(self._netlist._datetimes) == 0
+
+    def _find_cycle(self, num_ticks, step, limit):
+        '''
+        Run at most limit of num_ticks ticks, step ticks at a time, until the values repeat
+        Uses Brent's cycle detection algorithm on the values after every step. Returns the number of ticks left to run
+        and the number of ticks after which the values repeat, or None if they did not
+        '''
+        saved = bytes(self._values)
+        power = distance = 1
+        while num_ticks >= step and limit >= step:
+            self.tick(step, store=False)
+            num_ticks -= step
+            limit -= step
+            values = bytes(self._values)
+            if values == saved:
+                return num_ticks, distance * step
+            if distance == power:
+                saved = values
+                power *= 2
+                distance = 0
+            distance += 1
+        return num_ticks, None
+
+    def run(self, num_ticks, detect_cycles=True, check_interval=64):
+        '''
+        Advance the simulation by num_ticks ticks and store the result in the definition's state
+        With detect_cycles set, the values are compared against those of earlier ticks, after every tick for the first
+        check_interval ticks and then every check_interval ticks. Once they repeat, the simulation is periodic, so only
+        the remainder of the ticks modulo the cycle length needs to be run. Returns the cycle length if one was found
+        (the exact period if it was found within the first check_interval ticks, a multiple of it otherwise), or None
+        '''
+        if num_ticks < 1:
+            return None
+        period = None
+        if self._detects_cycles(detect_cycles):
+            num_ticks, period = self._find_cycle(num_ticks, 1, check_interval)
+            if period is None:
+                num_ticks, period = self._find_cycle(num_ticks, check_interval, num_ticks)
+            if period is not None:
+                num_ticks %= period
+        if num_ticks > 0:
+            self.tick(num_ticks, store=False)
+        self.store_state()
+        return period
+
+    def run_until(self, predicate, max_ticks=None, detect_cycles=True):
+        '''
+        Tick until predicate(outputs) holds, then store the result in the definition's state
+        The predicate is checked before the first tick and after every tick. Returns the number of ticks that were run,
+        or None if max_ticks ran out or the values entered a cycle in which the predicate never holds
+        '''
+        if predicate(self._definition._state['outputs']):
+            return 0
+        detect_cycles = self._detects_cycles(detect_cycles)
+        saved = bytes(self._values)
+        power = distance = 1
+        num_ticks = 0
+        result = None
+        while max_ticks is None or num_ticks < max_ticks:
+            self.tick(store=False)
+            num_ticks += 1
+            if predicate(self.outputs):
+                result = num_ticks
+                break
+            if detect_cycles:
+                # Every state of a detected cycle has already been checked
+                values = bytes(self._values)
+                if values == saved:
+                    break
+                if distance == power:
+                    saved = values
+                    power *= 2
+                    distance = 0
+                distance += 1
+        if num_ticks > 0:
+            self.store_state()
+        return result
+
+    @property
+    def outputs(self):
+        return self._netlist.read_outputs(self._values)
+
+    @property
+    def netlist(self):
+        return self._netlist
+
+    @property
+    def definition(self):
+        return self._definition
@@ -0,0 +1,110 @@
+from gates.engines.netlist import Netlist, NAND_TABLE
+import numpy as np
+
+class VectorizedEvaluator:
+    '''
+    Evaluates a combinational definition for a whole array of input vectors at once using NumPy.
+
+    The netlist's schedule is grouped into levels such that every operation only depends on operations from
+    earlier levels. Each level is then evaluated as a single ~(a & b) over gathered rows of a
+    (num_slots, num_vectors) array. Reshapers were already resolved into slot aliases by the netlist, so they
+    cost nothing.
+
+    Inputs and outputs are flattened into rows of bits: every input (or output) of the definition in order,
+    with buses contributing one column per bit. Unknown (None) values are not tracked and read as 0.
+    '''
+    def __init__(self, definition, netlist=None):
+        if netlist is None:
+            netlist = Netlist(definition)
+        if not netlist.combinational:
+            raise ValueError('{} is not combinational'.format(definition._name))
+        self._definition = definition
+        self._netlist = netlist
+        self._input_slots = np.array([slot for port in netlist._inputs for slot in port], dtype=np.intp)
+        self._output_slots = np.array([slot for port in netlist._outputs for slot in port], dtype=np.intp)
+
+        # Standalone sources hold their values in the definition's state
+        values = netlist.init_values()
+        netlist.load_state(values, definition._state, netlist.bind_state(definition._state))
+        self._initial = np.frombuffer(bytes(values), dtype=np.uint8) == 1
+
+        # Assign each operation a level one higher than the operations it depends on
+        level = [0] * netlist._num_slots
+        levels = {}
+        for table, a, b, out in netlist._ops:
+            is_nand = table is NAND_TABLE
+            if is_nand:
+                level[out] = max(level[a], level[b]) + 1
+            else:
+                level[out] = level[a] + 1
+            if (level[out], is_nand) not in levels:
+                levels[level[out], is_nand] = ([], [], [])
+            a_slots, b_slots, out_slots = levels[level[out], is_nand]
+            a_slots.append(a)
+            b_slots.append(b)
+            out_slots.append(out)
+
+        self._levels = []
+        for key in sorted(levels.keys()):
+            a_slots, b_slots, out_slots = levels[key]
+            self._levels.append((
+                key[1],
+                np.array(a_slots, dtype=np.intp),
+                np.array(b_slots, dtype=np.intp),
+                np.array(out_slots, dtype=np.intp)
+            ))
+
+    def evaluate(self, inputs, chunk_size=65536):
+        '''
+        Evaluate the definition for every row of inputs
+        params:
+            inputs      Array of shape (num_vectors, input_width) holding 0s and 1s
+            chunk_size  Maximum number of vectors evaluated at once, bounding memory use
+        Returns an array of shape (num_vectors, output_width)
+        '''
+        inputs = np.asarray(inputs).astype(bool)
+        if inputs.ndim != 2 or inputs.shape[1] != self.input_width:
+            raise ValueError('Expected an array of shape (num_vectors, {}), got {}'.format(self.input_width, inputs.shape))
+
+        # Constants and datetimes are the same for every vector
+        initial = self._initial.copy()
+        for slot, bit in self._netlist.refresh_bits():
+            initial[slot] = bit == 1
+
+        num_vectors = inputs.shape[0]
+        outputs = np.empty((num_vectors, self.output_width), dtype=np.uint8)
+        for start in range(0, num_vectors, chunk_size):
+            chunk = inputs[start:start+chunk_size]
+            values = np.empty((len(initial), len(chunk)), dtype=bool)
+            values[:] = initial[:, None]
+            values[self._input_slots] = chunk.T
+            for is_nand, a, b, out in self._levels:
+                if is_nand:
+                    values[out] = ~(values[a] & values[b])
+                else:
+                    values[out] = values[a]
+            outputs[start:start+chunk_size] = values[self._output_slots].T
+        return outputs
+
+    def __call__(self, inputs, chunk_size=65536):
+        return self.evaluate(inputs, chunk_size=chunk_size)
+
+    @property
+    def input_width(self):
+        return len(self._input_slots)
+
+    @property
+    def output_width(self):
+        return len(self._output_slots)
+
+    @property
+    def num_levels(self):
+        return len(self._levels)
+
+    @property
+    def netlist(self):
+        return self._netlist
+
+    @property
+    def definition(self):
+        return self._definition
@@ -1,8 +1,16 @@
 from abc import ABC, abstractmethod
+from gates.utils.bus import Bus
 
-class Gate(ABC):
-    DEFAULT_VALUE = 0
-    _num_gates = 0
+class GateShape:
+    '''
+    The dims, labels and name of a gate. Gates only hold a reference to their shape, which is shared by every gate with
+    the same one: builtin gates get an interned shape from GateShape.get, while compound gates use their definition,
+    which has the same attributes and keeps them up to date as its interface is edited.
+
+    Interned shapes are shared, so their lists must not be modified in place.
+    '''
+    __slots__ = ('_input_dims', '_output_dims', '_input_labels', '_output_labels', '_name')
+    _interned = {}  # Indexed by the class and every attribute of a shape as tuples. Stores the shared shape
 
     def __init__(self, input_dims, output_dims, input_labels=None, output_labels=None, name=None):
         self._input_dims = input_dims
@@ -20,10 +28,59 @@ class Gate(ABC):
 
         self._name = name
 
+    @classmethod
+    def get(cls, input_dims, output_dims, input_labels=None, output_labels=None, name=None):
+        '''
+        Return the shared shape with the given attributes, creating it on first use
+        '''
+        if input_labels is None:
+            input_labels = ('',) * len(input_dims)
+        if output_labels is None:
+            output_labels = ('',) * len(output_dims)
+        key = (cls, tuple(input_dims), tuple(output_dims), tuple(input_labels), tuple(output_labels), name)
+        shape = GateShape._interned.get(key, None)
+        if shape is None:
+            shape = cls(list(input_dims), list(output_dims), list(input_labels), list(output_labels), name)
+            GateShape._interned[key] = shape
+        return shape
+
+class Gate(ABC):
+    DEFAULT_VALUE = 0
+    PACKED_BUSES = False  # Whether buses wider than one bit are represented as Bus objects instead of lists of bits
+    _num_gates = 0
+
+    # Gates are small and numerous, so they only hold their shape and uid, see GateShape
+    __slots__ = ('_shape', '_uid')
+
+    def __init__(self, input_dims=None, output_dims=None, input_labels=None, output_labels=None, name=None, shape=None):
+        if shape is None:
+            shape = GateShape.get(input_dims, output_dims, input_labels, output_labels, name)
+        self._shape = shape
+
         # Assign a unique ID to each gate
         self._uid = Gate._num_gates
         Gate._num_gates += 1
 
+    @property
+    def _input_dims(self):
+        return self._shape._input_dims
+
+    @property
+    def _output_dims(self):
+        return self._shape._output_dims
+
+    @property
+    def _input_labels(self):
+        return self._shape._input_labels
+
+    @property
+    def _output_labels(self):
+        return self._shape._output_labels
+
+    @property
+    def _name(self):
+        return self._shape._name
+
     def _init_inputs(self):
         '''
         Return an initial input for the gate
@@ -33,9 +90,20 @@ class Gate(ABC):
             if input_dim == 1:
                 inputs.append(Gate.DEFAULT_VALUE)
             else:
-                inputs.append([Gate.DEFAULT_VALUE] * input_dim)
+                inputs.append(Gate._init_value(input_dim))
         return inputs
 
+    @staticmethod
+    def _init_value(dim):
+        '''
+        Return an initial value for a wire of the given dimension
+        '''
+        if dim == 1:
+            return Gate.DEFAULT_VALUE
+        elif Gate.PACKED_BUSES:
+            return Bus(dim, (1 << dim) - 1 if Gate.DEFAULT_VALUE else 0)
+        return [Gate.DEFAULT_VALUE] * dim
+
     def _init_state(self):
         '''
         Return an initial state for the gate
@@ -1,24 +1,28 @@
 from gates.gate import Gate
-from gates.builtins import Sink, Source
+from gates.builtins import Nand, Reshaper, Sink, Source
 from gates.utils import DirectedGraph, hybridmethod, OrderedSet
-from collections import deque
+from gates.utils.bus import Bus, pack_values, unpack_values
+from gates.state_store import StateStore, StoreView
+from collections import deque, OrderedDict
 import copy
 
 class CompoundGate(Gate):
+    __slots__ = ('_definition',)
+
     def __init__(self, definition):
+        # The definition is the shape of its instances, so they follow any change to its name or interface
         self._definition = definition
-        super().__init__(
-            definition._input_dims,
-            definition._output_dims,
-            input_labels=definition._input_labels,
-            output_labels=definition._output_labels,
-            name=definition._name
-        )
+        super().__init__(shape=definition)
 
     def _init_state(self):
         return self._definition._init_state()
     
     def __call__(self, inputs, state=None):
+        # Stateless instances of combinational definitions can be answered from the definition's truth table
+        if state is None:
+            outputs = self._definition._lookup_truth_table(inputs)
+            if outputs is not None:
+                return outputs
         return self._definition._process_state(inputs, state=state)
         # try:
         #     return self._definition._process_state(inputs, state=state)
@@ -42,6 +46,8 @@ class GateDefinition:
     Represents the definition for a custom gate. Instances of custom gates are of type CompoundGate.
     '''
     _num_definitions = 0
+    TRUTH_TABLE_BITS = 8     # Truth tables of definitions with at most this many input bits are enumerated in full
+    TRUTH_TABLE_SIZE = 4096  # Maximum number of entries cached for definitions with more input bits
 
     def __init__(self, input_dims, output_dims, name, project, input_labels=None, output_labels=None):
         self._input_dims = list(input_dims)
@@ -70,6 +76,7 @@ class GateDefinition:
 
         # Maintain the definition's state
         self._state = {}
+        self._version = 0  # Incremented whenever the definition's structure or interface changes
 
         # Represents the input (source) and output (sink) to the overall gate
         self._source = Source(self._input_dims, self._input_labels)
@@ -83,9 +90,19 @@ class GateDefinition:
         self._stateful_gates = None # A set of gate uids corresponding to gates that require a state to be saved
         self._rooted_gates = None   # A set of gate uids corresponding to gates that connect to the sink
         self._reorder = True        # Flag set whenever the graph representing the definition's internal structure changes
-        # TODO: look into refactoring the directed graph code to update the order instead of recomputing it
+
+        # How to gather the inputs of each gate, see _build_gather_plans
+        self._slots = None          # A dict mapping gate uids to their index in the evaluation order
+        self._gather_plans = None   # A list holding the gather plan of each gate in the evaluation order
+        self._plan_version = None   # The version of the definition the gather plans were built for
+
+        # Outputs of the definition indexed by its packed input bits, see _lookup_truth_table
+        self._truth_table = None          # None if the definition is not purely combinational
+        self._truth_table_stamp = None    # The stamp of the definition the truth table was built for, see _get_stamp
+        self._truth_table_version = None  # The version of the project the stamp was last checked against
 
         self._instance_uids = OrderedSet()
+        self._state_layout = None  # Layout of the last snapshot of the state, see snapshot
 
     def add_gate(self, gate, state=None, outputs=None):
         '''
@@ -103,6 +120,7 @@ class GateDefinition:
         else:
             self._gate_types[gate._name].add(gate._uid)
         self._reorder = True
+        self._changed()
 
         # Add gate
         self._graph.add_vertex(gate._uid)
@@ -123,6 +141,48 @@ class GateDefinition:
             if outputs is None:
                 outputs = gate(gate._init_inputs(), gate_state)
             self._state[gate._uid] = (gate_state, outputs)
+
+    def add_gates(self, gates):
+        '''
+        Add several gates to the definition at once
+        All gates are validated before any of them is added, so the definition is left unchanged if one is invalid,
+        and dependencies are checked once per new gate type rather than once per gate
+        '''
+        gates = list(gates)
+        uids = set()
+        new_types = {}  # Used as an ordered set of the gate types the definition does not depend on yet
+        for gate in gates:
+            if gate._uid in self._gates or gate._uid in uids:
+                raise ValueError('{} is already in the definition'.format(gate))
+            uids.add(gate._uid)
+            if gate._name not in self._gate_types:
+                new_types[gate._name] = None
+
+        # Adding a dependency cannot make another one recursive unless it is recursive itself, so they are checked
+        # against the current dependency graph before any is added
+        for name in new_types:
+            if self._project._check_dependency(self._name, name):
+                raise ValueError('Recursive definition: {} depends on {}'.format(name, self._name))
+        for name in new_types:
+            self._project._add_dependency(self._name, name)
+            self._gate_types[name] = OrderedSet()
+
+        # Instances of the same definition start out with the same state and outputs, so they are only computed once
+        initial = {}  # Indexed by definition name. Stores the initial state and outputs of its instances
+        for gate in gates:
+            self._gate_types[gate._name].add(gate._uid)
+            self._graph.add_vertex(gate._uid)
+            self._gates[gate._uid] = gate
+            if isinstance(gate, CompoundGate):
+                if gate._name not in initial:
+                    gate_state = gate._init_state()
+                    initial[gate._name] = (gate_state, gate(gate._init_inputs(), gate_state))
+                self._state[gate._uid] = copy.deepcopy(initial[gate._name])
+            else:
+                gate_state = gate._init_state()
+                self._state[gate._uid] = (gate_state, gate(gate._init_inputs(), gate_state))
+        self._reorder = True
+        self._changed()
     
     def remove_gate(self, gate):
         '''
@@ -138,7 +198,8 @@ class GateDefinition:
             self._project._remove_dependency(self._name, gate._name)
 
         # Remove from connections
-        for predecessor in self._graph.get_direct_predecessors(gate._uid):
+        predecessors = list(self._graph.get_direct_predecessors(gate._uid))
+        for predecessor in predecessors:
             del self._connections[predecessor, gate._uid]
 
         # Remove to connections
@@ -151,6 +212,10 @@ class GateDefinition:
         self._graph.remove_vertex(gate._uid)
         del self._gates[gate._uid]
         self._reorder = True
+        self._changed()
+        if self._graph.is_order_tracked():
+            self._rooted_gates.discard(gate._uid)
+            self._unroot_gates(predecessors)
 
         # Update definition's state
         if gate._uid in self._state:
@@ -185,6 +250,17 @@ class GateDefinition:
         if input_idx >= len(to_gate._input_dims):
             raise ValueError('Invalid input index {} for {}'.format(input_idx, to_gate))
 
+    def _validate_dims(self, from_pair, to_pair):
+        '''
+        Check whether the dimensions of a gate's output and a gate's input match
+        '''
+        from_gate, output_idx = from_pair
+        input_idx, to_gate = to_pair
+        from_dim = from_gate._output_dims[output_idx]
+        to_dim = to_gate._input_dims[input_idx]
+        if from_dim != to_dim:
+            raise ValueError(f'{self._name}. Mismatched dimensions. ({from_gate._name}:{from_gate._uid}, {output_idx}) has dimension {from_dim} while ({input_idx}, {to_gate._name}:{to_gate._uid}) has dimension {to_dim}')
+
     def add_connection(self, from_pair, to_pair):
         '''
         Add a connection from a gate to a gate if it does not already exist
@@ -194,26 +270,61 @@ class GateDefinition:
         '''
         self._validate_from_pair(from_pair)
         self._validate_to_pair(to_pair)
+        self._validate_dims(from_pair, to_pair)
 
         # Unpack input pairs
         from_gate, output_idx = from_pair
         input_idx, to_gate = to_pair
 
-        # Validate matching input output dimensions
-        from_dim = from_gate._output_dims[output_idx]
-        to_dim = to_gate._input_dims[input_idx]
-        if from_dim != to_dim:
-            raise ValueError(f'{self._name}. Mismatched dimensions. ({from_gate._name}:{from_gate._uid}, {output_idx}) has dimension {from_dim} while ({input_idx}, {to_gate._name}:{to_gate._uid}) has dimension {to_dim}')
-
         # If a connection between the two gates does not yet exist, create it
         key = (from_gate._uid, to_gate._uid)
         if key not in self._connections:
-            self._reorder = True  # Edge has been created
             self._graph.add_edge(*key)
             self._connections[key] = OrderedSet()
+            self._edge_added(*key)
 
         # Add the output index and input index to the connection
         self._connections[key].add((output_idx, input_idx))
+        self._changed()
+
+    def add_connections(self, connections):
+        '''
+        Add several connections at once
+        params:
+            connections     Iterable of (from_pair, to_pair) tuples, each holding the arguments of add_connection
+        All connections are validated before any of them is added, so the definition is left unchanged if one is
+        invalid. Instead of being updated after every new edge, the evaluation order is recomputed once when needed
+        '''
+        pairs = {}  # Indexed by a pair of uids (from, to). Stores a list of output index, input index tuples
+        for from_pair, to_pair in connections:
+            self._validate_from_pair(from_pair)
+            self._validate_to_pair(to_pair)
+            self._validate_dims(from_pair, to_pair)
+            key = (from_pair[0]._uid, to_pair[1]._uid)
+            if key not in pairs:
+                pairs[key] = []
+            pairs[key].append((from_pair[1], to_pair[0]))
+        self._insert_connections(pairs.items())
+
+    def _insert_connections(self, connections):
+        '''
+        Add connections without validating them
+        params:
+            connections     Iterable of ((from uid, to uid), pairs) tuples, where pairs holds output index, input index tuples
+        The graph stops maintaining its order incrementally as soon as a new edge is added, so the order is recomputed
+        from scratch on the next tick, which is faster than updating it after each of many new edges
+        '''
+        for key, pairs in connections:
+            if key not in self._connections:
+                if self._graph.is_order_tracked():
+                    self._graph.untrack_order()
+                self._graph.add_edge(*key)
+                self._connections[key] = OrderedSet()
+            connection = self._connections[key]
+            for pair in pairs:
+                connection.add(pair)
+        self._reorder = True
+        self._changed()
 
     def remove_connection(self, from_pair, to_pair):
         '''
@@ -232,12 +343,13 @@ class GateDefinition:
         # Remove the output index and input index from the connection
         key = (from_gate._uid, to_gate._uid)
         self._connections[key].discard((output_idx, input_idx))
+        self._changed()
 
         # If the connection between the two gates no longer connects any outputs to inputs, delete it
         if len(self._connections[key]) == 0:
-            self._reorder = True  # Edge has been deleted
             del self._connections[key]
             self._graph.remove_edge(*key)
+            self._edge_removed(*key)
     
     def clear_gate_input(self, to_pair):
         '''
@@ -247,18 +359,20 @@ class GateDefinition:
         self._validate_to_pair(to_pair)
 
         to_idx, to_gate = to_pair
-        for predecessor in self._graph.get_direct_predecessors(to_gate._uid):
+        self._changed()
+        for predecessor in list(self._graph.get_direct_predecessors(to_gate._uid)):
             key = predecessor, to_gate._uid
 
             # Remove connections using the output specified
-            for output_idx, input_idx in self._connections[key]:
+            for output_idx, input_idx in list(self._connections[key]):
                 if input_idx == to_idx:
                     self._connections[key].discard((output_idx, input_idx))
             
             # If the connection between the two gates no longer connects any outputs to inputs, delete it
             if len(self._connections[key]) == 0:
-                self._reorder = True  # Edge has been deleted
                 del self._connections[key]
+                self._graph.remove_edge(*key)
+                self._edge_removed(*key)
 
     def clear_gate_output(self, from_pair):
         '''
@@ -269,18 +383,77 @@ class GateDefinition:
         self._validate_from_pair(from_pair)
 
         from_gate, from_idx = from_pair
-        for successor in self._graph.get_direct_successors(from_gate._uid):
+        self._changed()
+        for successor in list(self._graph.get_direct_successors(from_gate._uid)):
             key = from_gate._uid, successor
 
             # Remove connections using the input specified
-            for output_idx, input_idx in self._connections[key]:
+            for output_idx, input_idx in list(self._connections[key]):
                 if output_idx == from_idx:
                     self._connections[key].discard((output_idx, input_idx))
             
             # If the connection between the two gates no longer connects any outputs to inputs, delete it
             if len(self._connections[key]) == 0:
-                self._reorder = True  # Edge has been deleted
                 del self._connections[key]
+                self._graph.remove_edge(*key)
+                self._edge_removed(*key)
+
+    def _edge_added(self, v, w):
+        '''
+        Update the evaluation order after an edge from gate uid v to gate uid w was added to the graph
+        '''
+        self._reorder = True
+        if self._graph.is_order_tracked() and w in self._rooted_gates and v not in self._rooted_gates:
+            # v and all its predecessors now connect to the sink
+            self._rooted_gates.add(v)
+            stack = [v]
+            while len(stack) != 0:
+                uid = stack.pop()
+                for predecessor_uid in self._graph.get_direct_predecessors(uid):
+                    if predecessor_uid not in self._rooted_gates:
+                        self._rooted_gates.add(predecessor_uid)
+                        stack.append(predecessor_uid)
+
+    def _edge_removed(self, v, w):
+        '''
+        Update the evaluation order after an edge from gate uid v to gate uid w was removed from the graph
+        '''
+        self._reorder = True
+        if self._graph.is_order_tracked():
+            self._unroot_gates([v])
+
+    def _unroot_gates(self, uids):
+        '''
+        After edges leaving the given gate uids were removed, remove those gates and their predecessors from the rooted
+        gates if they no longer connect to the sink
+        '''
+        # Every predecessor of a rooted gate is rooted and may have connected to the sink through the removed edges
+        affected = set(uid for uid in uids if uid in self._rooted_gates)
+        stack = list(affected)
+        while len(stack) != 0:
+            uid = stack.pop()
+            for predecessor_uid in self._graph.get_direct_predecessors(uid):
+                if predecessor_uid not in affected:
+                    affected.add(predecessor_uid)
+                    stack.append(predecessor_uid)
+
+        # Affected gates with a successor that is still rooted connect to the sink, and so do their predecessors
+        stack = []
+        for uid in affected:
+            for successor_uid in self._graph.get_direct_successors(uid):
+                if successor_uid in self._rooted_gates and successor_uid not in affected:
+                    stack.append(uid)
+                    break
+        connected = set(stack)
+        while len(stack) != 0:
+            uid = stack.pop()
+            for predecessor_uid in self._graph.get_direct_predecessors(uid):
+                if predecessor_uid in affected and predecessor_uid not in connected:
+                    connected.add(predecessor_uid)
+                    stack.append(predecessor_uid)
+
+        for uid in affected - connected:
+            self._rooted_gates.discard(uid)
 
     def tie_input_to(self, source_idx, to_pair):
         '''
@@ -346,6 +519,8 @@ class GateDefinition:
         '''
         Move all of the given gate's incoming connections after idx to the right by 1
         '''
+        self._changed()
+
         # Move all connections after idx
         for predecessor_uid in self._graph.get_direct_predecessors(gate._uid):
             new_pairs = OrderedSet()
@@ -359,6 +534,8 @@ class GateDefinition:
         '''
         Move all of the given gate's outgoing connections after idx to the right by 1
         '''
+        self._changed()
+
         # Move all connections after idx
         for successor_uid in self._graph.get_direct_successors(gate._uid):
             new_pairs = OrderedSet()
@@ -372,6 +549,8 @@ class GateDefinition:
         '''
         Move all of the given gate's incoming connections after idx to the left by 1, removing any connections at idx
         '''
+        self._changed()
+
         # Move all connections after idx
         for predecessor_uid in self._graph.get_direct_predecessors(gate._uid):
             new_pairs = OrderedSet()
@@ -387,6 +566,8 @@ class GateDefinition:
         '''
         Move all of the given gate's outgoing connections after idx to the left by 1, removing any connections at idx
         '''
+        self._changed()
+
         # Move all connections after idx
         for successor_uid in self._graph.get_direct_successors(gate._uid):
             new_pairs = OrderedSet()
@@ -398,56 +579,49 @@ class GateDefinition:
                 new_pairs.add((output_idx, input_idx))
             self._connections[gate._uid, successor_uid] = new_pairs
 
-    def _run_on_type_states(self, definitions, proc, states=None):
-        if states is None:
-            states = [self._state]
-
-        definition = definitions[-1]
-        if len(definitions) == 1:
-            for state in states:
-                for uid in state:
-                    if uid in definition._instance_uids:
-                        state[uid] = proc(state[uid])
-            for state in states:
-                for uid in list(state.keys()):
-                    if uid in definition._instance_uids:
-                        gate_state, outputs = state[uid]
-                        if gate_state is not None and len(gate_state) == 0:
-                            gate_state = None
-                        if gate_state is None and outputs is None:
-                            del state[uid]
-                        else:
-                            state[uid] = (gate_state, outputs)
-        else:
-            new_states = []
-            for state in states:
-                for uid in state:
-                    if uid in definition._instance_uids:
-                        gate_state = state[uid][0]
-                        if gate_state is not None:
-                            new_states.append(gate_state)
-            self._run_on_type_states(definitions[:-1], proc, new_states)
-            for state in states:
-                for uid in list(state.keys()):
-                    if uid in definition._instance_uids:
-                        gate_state, outputs = state[uid]
-                        if gate_state is not None and len(gate_state) == 0:
-                            gate_state = None
-                        if gate_state is None and outputs is None:
-                            del state[uid]
-                        else:
-                            state[uid] = (gate_state, outputs)
+    def _run_on_type_states(self, definition, nested, proc):
+        '''
+        Replace the state of every instance of the given definition found in this definition's state, at any depth,
+        with the result of running proc on it
+        nested holds the uids of the instances whose states may contain such states. Only their states are searched,
+        and each of them once, then emptied states are dropped from the innermost out
+        '''
+        instance_uids = definition._instance_uids
+        visited = []
+        stack = [self._state]
+        while len(stack) != 0:
+            state = stack.pop()
+            visited.append(state)
+            for uid in state:
+                if uid in instance_uids:
+                    state[uid] = proc(state[uid])
+                elif uid in nested:
+                    gate_state = state[uid][0]
+                    if gate_state is not None:
+                        stack.append(gate_state)
+
+        # States are visited before the states nested in them, so going backwards cleans up the innermost ones first
+        for state in reversed(visited):
+            for uid in list(state.keys()):
+                if uid in instance_uids or uid in nested:
+                    gate_state, outputs = state[uid]
+                    if gate_state is not None and len(gate_state) == 0:
+                        gate_state = None
+                    if gate_state is None and outputs is None:
+                        del state[uid]
+                    else:
+                        state[uid] = (gate_state, outputs)
 
     def _inserted_input(self, definition, idx):
         for uid in self._gate_types[definition._name]:
             self._shift_incoming_right(self._gates[uid], idx)
     
-    def _inserted_output(self, definitions, idx):
-        if len(definitions) == 1:
-            for uid in self._gate_types[definitions[0]._name]:
+    def _inserted_output(self, definition, idx, nested):
+        if definition._name in self._gate_types:
+            for uid in self._gate_types[definition._name]:
                 self._shift_outgoing_right(self._gates[uid], idx)
         
-        dim = definitions[0]._output_dims[idx]
+        dim = definition._output_dims[idx]
         def proc(state):
             _, outputs = state
             if outputs is not None:
@@ -458,15 +632,15 @@ class GateDefinition:
                 outputs.insert(idx, new_output)
             return state
 
-        self._run_on_type_states(definitions, proc)
+        self._run_on_type_states(definition, nested, proc)
 
     def _removed_input(self, definition, idx):
         for uid in self._gate_types[definition._name]:
             self._shift_incoming_left(self._gates[uid], idx)
     
-    def _removed_output(self, definitions, idx):
-        if len(definitions) == 1:
-            for uid in self._gate_types[definitions[0]._name]:
+    def _removed_output(self, definition, idx, nested):
+        if definition._name in self._gate_types:
+            for uid in self._gate_types[definition._name]:
                 self._shift_outgoing_left(self._gates[uid], idx)
 
         def proc(state):
@@ -474,15 +648,15 @@ class GateDefinition:
             if outputs is not None:
                 outputs.pop(idx)
             return state
-        self._run_on_type_states(definitions, proc)
+        self._run_on_type_states(definition, nested, proc)
     
-    def _remove_uid(self, definitions, uid):
+    def _remove_uid(self, definition, uid, nested):
         def proc(state):
             gate_state, _  = state
             if gate_state is not None and uid in gate_state:
                 del gate_state[uid]
             return state
-        self._run_on_type_states(definitions, proc)
+        self._run_on_type_states(definition, nested, proc)
 
     def insert_input(self, idx, dim, label=''):
         '''
@@ -493,6 +667,7 @@ class GateDefinition:
             raise ValueError('Invalid insertion index: {}'.format(idx))
 
         # Update input dimensions
+        self._changed()
         self._input_dims.insert(idx, dim)
         self._input_labels.insert(idx, label)
         self._num_inputs += 1
@@ -515,6 +690,7 @@ class GateDefinition:
             raise ValueError('Invalid insertion index: {}'.format(idx))
 
         # Update output dimensions
+        self._changed()
         self._output_dims.insert(idx, dim)
         self._output_labels.insert(idx, label)
         self._num_outputs += 1
@@ -550,6 +726,7 @@ class GateDefinition:
             raise ValueError('Second given swap index is invalid: {}'.format(idx1))
         
         # Swap connections from idx0 to idx1 and vice versa
+        self._changed()
         for successor_uid in self._graph.get_direct_successors(self._source._uid):
             key = (self._source._uid, successor_uid)
             new_connections = OrderedSet()
@@ -583,6 +760,7 @@ class GateDefinition:
             raise ValueError('Second given swap index is invalid: {}'.format(idx1))
 
         # Swap connections from idx0 to idx1 and vice versa
+        self._changed()
         for predecessor_uid in self._graph.get_direct_predecessors(self._sink._uid):
             key = (predecessor_uid, self._source._uid)
             new_connections = OrderedSet()
@@ -614,6 +792,7 @@ class GateDefinition:
             raise ValueError('Input index is invalid: {}'.format(idx))
 
         # Update input dimensions
+        self._changed()
         self._input_dims.pop(idx)
         self._input_labels.pop(idx)
         self._num_inputs -= 1
@@ -632,6 +811,7 @@ class GateDefinition:
             raise ValueError('Output index is invalid: {}'.format(idx))
 
         # Update output dimensions
+        self._changed()
         self._output_dims.pop(idx)
         self._output_labels.pop(idx)
         self._num_outputs -= 1
@@ -668,6 +848,7 @@ class GateDefinition:
         if old_dim != dim:
             self.clear_input(idx)
         self._input_dims[idx] = dim
+        self._changed()
     
     def reshape_output(self, idx, dim):
         '''
@@ -679,6 +860,7 @@ class GateDefinition:
         if old_dim != dim:
             self.clear_output(idx)
         self._output_dims[idx] = dim
+        self._changed()
 
     def rename_input(self, idx, label=''):
         '''
@@ -704,8 +886,15 @@ class GateDefinition:
     def _update_order(self):
         # Compute a new evaluation order if necessary
         if self._reorder:
-            old_cut_gates = self._cut_gates or OrderedSet()
-            old_rooted_gates = self._rooted_gates or OrderedSet()
+            order = self._graph.get_tracked_order()
+            if order is not None:
+                # The graph has stayed acyclic since the order was last computed, so the order it maintained
+                # incrementally is valid, no gates are cut, and the rooted gates were updated along with each edit
+                self._order = order
+                self._reorder = False
+                self._build_gather_plans()
+                return
+
             self._order, cut_edges = self._graph.get_order(self._source._uid)
             self._cut_gates = OrderedSet()
             for (v, _) in cut_edges:
@@ -714,12 +903,157 @@ class GateDefinition:
             self._rooted_gates.add(self._sink._uid)  # Add sink
             self._reorder = False
 
-            # for old_rooted_gate_uid in (old_rooted_gates - self._rooted_gates):
-            #     self._project._remove_uid(self, old_rooted_gate_uid)
-            # print(f'{self._name}: Cut gates removed {old_cut_gates - self._cut_gates}')
-            # print(f'{self._name}: Cut gates added {self._cut_gates - old_cut_gates}')
-            # print(f'{self._name}: Rooted gates removed {old_rooted_gates - self._rooted_gates}')
-            # print(f'{self._name}: Rooted gates added {self._rooted_gates - old_rooted_gates}')
+            # Which gates are cut depends on the whole graph, so the order is only maintained incrementally while
+            # there is nothing to cut
+            if len(cut_edges) == 0:
+                self._graph.track_order(self._order)
+            else:
+                self._graph.untrack_order()
+            self._build_gather_plans()
+        elif self._plan_version != self._version:
+            # Connections between gates that were already connected changed
+            self._build_gather_plans()
+
+    def _build_gather_plans(self):
+        '''
+        Precompute how each gate in the evaluation order gathers its inputs
+        The gather plan of a gate is a tuple with one (slot, output index, input index, live) entry per connection
+        to its inputs, where slot is the index of the predecessor in the order. Live is True when the predecessor is
+        evaluated earlier in the same pass (or is the source), in which case its current outputs are read, and False
+        when its outputs from the previous pass have to be read from the state instead
+        '''
+        self._slots = {gate_uid: slot for slot, gate_uid in enumerate(self._order)}
+        self._gather_plans = []
+        source_uid = self._source._uid
+        graph = self._graph.get_snapshot()
+        for slot, gate_uid in enumerate(self._order):
+            plan = []
+            for predecessor_uid in graph.get_direct_predecessors(gate_uid):
+                predecessor_slot = self._slots[predecessor_uid]
+                live = predecessor_uid == source_uid or predecessor_slot < slot
+                for output_idx, input_idx in self._connections[predecessor_uid, gate_uid]:
+                    plan.append((predecessor_slot, output_idx, input_idx, live))
+            self._gather_plans.append(tuple(plan))
+        self._plan_version = self._version
+
+    def _changed(self):
+        '''
+        Record a change to the definition's structure or interface
+        '''
+        self._version += 1
+        self._project._version += 1
+
+    def _is_combinational(self):
+        '''
+        Return whether the outputs of the definition's instances only depend on their inputs, i.e. whether it has
+        no cut gates and the gates connected to its sink are all NANDs, reshapers or combinational definitions
+        '''
+        self._update_order()
+        if len(self._cut_gates) != 0:
+            return False
+        for gate_uid in self._rooted_gates:
+            if gate_uid == self._source._uid or gate_uid == self._sink._uid:
+                continue
+            gate = self._gates[gate_uid]
+            if isinstance(gate, CompoundGate):
+                if not gate._definition._is_combinational():
+                    return False
+            elif not isinstance(gate, (Nand, Reshaper)):
+                return False
+        return True
+
+    def _pack_inputs(self, inputs):
+        '''
+        Pack inputs into an int, first input first, or return None if any of the bits is unknown
+        '''
+        packed = 0
+        for value in inputs:
+            if isinstance(value, list):
+                for bit in value:
+                    if bit is None:
+                        return None
+                    packed = (packed << 1) | bit
+            elif value is None:
+                return None
+            elif type(value) == Bus:
+                if value._unknown != 0:
+                    return None
+                packed = (packed << value._dim) | value._value
+            else:
+                packed = (packed << 1) | value
+        return packed
+
+    def _unpack_inputs(self, packed):
+        '''
+        Inverse of _pack_inputs
+        '''
+        inputs = []
+        shift = sum(self._input_dims)
+        for dim in self._input_dims:
+            shift -= dim
+            if dim != 1 and Gate.PACKED_BUSES:
+                inputs.append(Bus(dim, packed >> shift))
+                continue
+            bits = [(packed >> (shift + dim - 1 - i)) & 1 for i in range(dim)]
+            inputs.append(bits[0] if dim == 1 else bits)
+        return inputs
+
+    def _lookup_truth_table(self, inputs):
+        '''
+        Return the outputs of a stateless instance for the given inputs from the truth table, or None if the
+        definition is not purely combinational or any input is unknown
+        The truth table is rebuilt lazily after the definition or one it depends on changes, which is only checked
+        once the project changed. Narrow definitions are enumerated in full, wider ones keep the most recently used
+        entries up to TRUTH_TABLE_SIZE
+        '''
+        if self._truth_table_version != self._project._version:
+            if self._truth_table_stamp != self._get_stamp():
+                self._build_truth_table()
+            self._truth_table_version = self._project._version
+        if self._truth_table is None:
+            return None
+
+        packed = self._pack_inputs(inputs)
+        if packed is None:
+            return None
+        outputs = self._truth_table.get(packed, None)
+        if outputs is None:
+            # Only tables of wide definitions can miss
+            outputs = self._process_state(inputs)
+            self._truth_table[packed] = outputs
+            if len(self._truth_table) > GateDefinition.TRUTH_TABLE_SIZE:
+                self._truth_table.popitem(last=False)
+        elif isinstance(self._truth_table, OrderedDict):
+            self._truth_table.move_to_end(packed)
+
+        # Copy buses so that changes to the returned outputs do not leak into the table. Packed buses are immutable
+        return [list(value) if isinstance(value, list) else value for value in outputs]
+
+    def _build_truth_table(self):
+        '''
+        Rebuild the truth table, or drop it if the definition is not purely combinational, see _lookup_truth_table
+        '''
+        self._truth_table = None
+        if self._is_combinational():
+            num_bits = sum(self._input_dims)
+            if num_bits <= GateDefinition.TRUTH_TABLE_BITS:
+                self._truth_table = {}
+                for packed in range(1 << num_bits):
+                    self._truth_table[packed] = self._process_state(self._unpack_inputs(packed))
+            else:
+                self._truth_table = OrderedDict()
+        self._truth_table_stamp = self._get_stamp()
+
+    def _get_stamp(self):
+        '''
+        Return a value that changes whenever the structure of the definition or any definition it depends on changes
+        '''
+        stamp = [(id(self), self._version)]
+        for name in self._project._dependency_graph.get_all_successors(self._name):
+            definition = self._project._definitions[name]
+            if isinstance(definition, GateDefinition):
+                stamp.append((id(definition), definition._version))
+        return tuple(stamp)
 
     def _init_state(self):
         '''
@@ -768,13 +1102,19 @@ class GateDefinition:
             state = {}
 
         # Evaluate each gate to compute the final output
-        outputs = {self._source._uid: inputs}
-        for gate_uid in self._order:
+        order = self._order
+        source_slot = self._slots[self._source._uid]
+        sink_slot = self._slots[self._sink._uid]
+        outputs = [None] * len(order)
+        outputs[source_slot] = inputs
+        final = None
+        for slot, plan in enumerate(self._gather_plans):
             # Skip over the rest of the code for the source since we don't need to do any computation for it
-            if gate_uid == self._source._uid:
+            if slot == source_slot:
                 continue
 
             # Skip over gates that are not connected
+            gate_uid = order[slot]
             if gate_uid not in self._rooted_gates and not all:
                 continue
 
@@ -783,26 +1123,21 @@ class GateDefinition:
 
             # Get the inputs to the gate from its predecessors
             gate_inputs = gate._init_inputs()
-            for predecessor_uid in self._graph.get_direct_predecessors(gate_uid):
-                for output_idx, input_idx in self._connections[predecessor_uid, gate_uid]:
-                    if predecessor_uid in outputs:
-                        # Predecessor's outputs were already computed
-                        gate_inputs[input_idx] = outputs[predecessor_uid][output_idx]
-                    elif predecessor_uid in state:
-                        # Predecessor's outputs have not yet been computed, grab the previous ones from the state
-                        stored_outputs = state[predecessor_uid][1]
-                        if stored_outputs is None:
-                            gate_inputs[input_idx] = None
-                        else:
-                            gate_inputs[input_idx] = stored_outputs[output_idx]
-                    else:
+            for predecessor_slot, output_idx, input_idx, live in plan:
+                if live:
+                    # Predecessor's outputs were already computed
+                    gate_inputs[input_idx] = outputs[predecessor_slot][output_idx]
+                else:
+                    # Predecessor's outputs have not yet been computed, grab the previous ones from the state
+                    predecessor_state = state.get(order[predecessor_slot], None)
+                    if predecessor_state is None or predecessor_state[1] is None:
                         gate_inputs[input_idx] = None
-                        # print(f'Invalid state in {self._name}, could not find gate {predecessor_uid}')
-                        # raise ValueError(f'Invalid state in {self._name}, could not find gate {predecessor_uid}')
+                    else:
+                        gate_inputs[input_idx] = predecessor_state[1][output_idx]
 
             # Save outputs
-            if gate_uid == self._sink._uid:
-                outputs['final'] = gate_inputs
+            if slot == sink_slot:
+                final = gate_inputs
             else:
                 # Update state if necessary
                 if gate_uid in state:
@@ -814,12 +1149,28 @@ class GateDefinition:
                         state[gate_uid] = (gate_state, gate_outputs)
                 else:
                     gate_outputs = gate(gate_inputs)
-                outputs[gate_uid] = gate_outputs
-        return outputs['final']
+                outputs[slot] = gate_outputs
+        return final
 
     def tick(self):
         self._state['outputs'] = self._process_state(self._state['inputs'], self._state, all=True)
 
+    def run(self, num_ticks, detect_cycles=True, check_interval=64):
+        '''
+        Advance the state by num_ticks ticks on a compiled netlist, skipping ahead once the state repeats
+        Returns the length of the cycle the state entered, or None. See NetlistEngine.run
+        '''
+        from gates.engines.codegen import CodegenEngine  # The engines depend on this module
+        return CodegenEngine(self).run(num_ticks, detect_cycles=detect_cycles, check_interval=check_interval)
+
+    def run_until(self, predicate, max_ticks=None, detect_cycles=True):
+        '''
+        Tick on a compiled netlist until predicate(outputs) holds
+        Returns the number of ticks run, or None if the predicate can no longer hold. See NetlistEngine.run_until
+        '''
+        from gates.engines.codegen import CodegenEngine  # The engines depend on this module
+        return CodegenEngine(self).run_until(predicate, max_ticks=max_ticks, detect_cycles=detect_cycles)
+
     def serialize(self):
         # Serialize gates
         gates = {}
@@ -861,26 +1212,28 @@ class GateDefinition:
             if type(key) == int:
                 # Handle invalid states
                 if key in self._gates:
-                    obj[key] = (self._gates[key].serialize_state(value[0]), value[1])
+                    obj[key] = (self._gates[key].serialize_state(value[0]), unpack_values(value[1]))
                 else:
-                    obj[key] = (None, value[1])
+                    obj[key] = (None, unpack_values(value[1]))
             else:
-                obj[key] = value
+                obj[key] = unpack_values(value)
         return obj
     
     @hybridmethod
     @staticmethod
     def deserialize_state(obj, gates, project):
+        # Buses are always serialized as lists of bits
+        values = pack_values if Gate.PACKED_BUSES else (lambda values: values)
         state = {
-            'inputs': obj['inputs'],
-            'outputs': obj['outputs']
+            'inputs': values(obj['inputs']),
+            'outputs': values(obj['outputs'])
         }
         for key, value in obj.items():
             if type(key) == int:
                 gate_state, gate_outputs = value
                 gate = gates[key]
                 definition = project._definitions[gate._name]
-                state[gate._uid] = definition.deserialize_state(gate_state), gate_outputs
+                state[gate._uid] = definition.deserialize_state(gate_state), values(gate_outputs)
         return state
 
     @deserialize_state.instancemethod
@@ -888,21 +1241,24 @@ class GateDefinition:
         if obj is None:
             return None
 
+        values = pack_values if Gate.PACKED_BUSES else (lambda values: values)
         state = {}
         for gate_uid, (gate_state, gate_outputs) in obj.items():
             if gate_uid in self._gates:
                 gate = self._gates[gate_uid]
                 definition = self._project._definitions[gate._name]
-                state[gate_uid] = (definition.deserialize_state(gate_state), gate_outputs)
+                state[gate_uid] = (definition.deserialize_state(gate_state), values(gate_outputs))
             else:
-                state[gate_uid] = (gate_state, gate_outputs)
+                state[gate_uid] = (gate_state, values(gate_outputs))
         return state
 
     @hybridmethod
     @staticmethod
-    def deserialize(obj, project, gates):
+    def deserialize(obj, project, gates, validate=True):
         '''
         Deserialize a definition
+        Without validate, the save is trusted: gates and connections are added in bulk without checking them one by
+        one, see _load_gates and _load_connections
         '''
         source_uid, sink_uid = obj['source'], obj['sink']
         definition = GateDefinition(
@@ -912,6 +1268,12 @@ class GateDefinition:
             output_labels=obj['output_labels']
         )
 
+        if not validate:
+            definition._load_gates(obj, gates)
+            definition._load_connections(obj['connections'], gates)
+            definition._load_state(obj['state'], gates)
+            return definition
+
         # Create gates
         for gate_type, uids in obj['gate_types'].items():
             for uid in uids:
@@ -933,10 +1295,56 @@ class GateDefinition:
                 for pair in pairs:
                     output_idx, input_idx = pair
                     definition.add_connection((from_gate, output_idx), (input_idx, to_gate))
-        
-        # Create a new state object where old gate uids are replaced with new ones
+
+        definition._load_state(obj['state'], gates)
+        return definition
+
+    def _load_gates(self, obj, gates):
+        '''
+        Add the gates of a serialized definition without validating them one by one or computing their states and
+        outputs, which are restored from the saved state afterwards. Dependencies are still checked once per gate type
+        '''
+        source_uid, sink_uid = obj['source'], obj['sink']
+        for gate_type, uids in obj['gate_types'].items():
+            gate_definition = self._project._definitions[gate_type]
+            for uid in uids:
+                if uid == source_uid:
+                    gates[uid] = self._source
+                    continue
+                elif uid == sink_uid:
+                    gates[uid] = self._sink
+                    continue
+
+                if gate_type not in self._gate_types:
+                    if self._project._check_dependency(self._name, gate_type):
+                        raise ValueError('Recursive definition: {} depends on {}'.format(gate_type, self._name))
+                    self._project._add_dependency(self._name, gate_type)
+                    self._gate_types[gate_type] = OrderedSet()
+                serialized_gate = obj['gates'].get(uid, obj['gates'].get(str(uid), None))
+                gate = gate_definition.deserialize(serialized_gate)
+                gates[uid] = gate
+                self._gate_types[gate_type].add(gate._uid)
+                self._graph.add_vertex(gate._uid)
+                self._gates[gate._uid] = gate
+        self._reorder = True
+        self._changed()
+
+    def _load_connections(self, connections, gates):
+        '''
+        Add the connections of a serialized definition without validating them one by one
+        '''
+        self._insert_connections(
+            ((gates[int(from_uid)]._uid, gates[int(to_uid)]._uid), [tuple(pair) for pair in pairs])
+            for from_uid, value in connections.items()
+            for to_uid, pairs in value.items()
+        )
+
+    def _load_state(self, obj, gates):
+        '''
+        Restore a serialized state, replacing the saved gate uids with those of the new gates
+        '''
         state = {}
-        stack = deque([(obj['state'], state)])
+        stack = deque([(obj, state)])
         while len(stack) != 0:
             old_state, new_state = stack.pop()
             for key, value in old_state.items():
@@ -962,14 +1370,13 @@ class GateDefinition:
                     new_state[key] = value
 
         # Deserialize state
-        definition._state = GateDefinition.deserialize_state(state, definition._gates, project)
+        self._state = GateDefinition.deserialize_state(state, self._gates, self._project)
 
         # If inputs/outputs were not stored, initialize them
-        if definition._state['inputs'] == []:
-            definition._state['inputs'] = definition._source._init_state()
-        if definition._state['outputs'] == []:
-            definition._state['outputs'] = definition._sink._init_state()
-        return definition
+        if self._state['inputs'] == []:
+            self._state['inputs'] = self._source._init_state()
+        if self._state['outputs'] == []:
+            self._state['outputs'] = self._sink._init_state()
 
     @deserialize.instancemethod
     def deserialize(self, obj):
@@ -1022,6 +1429,23 @@ class GateDefinition:
     def graph(self):
         return self._graph
 
+    @property
+    def order(self):
+        self._update_order()
+        return self._order
+
+    @property
+    def gather_plans(self):
+        self._update_order()
+        return self._gather_plans
+
+    def get_gather_plan(self, uid):
+        '''
+        Get the gather plan of a gate given its uid, see _build_gather_plans
+        '''
+        self._update_order()
+        return self._gather_plans[self._slots[uid]]
+
     def get_gate_predecessors(self, uid):
         '''
         Return the direct predecessors for a gate given its uid
@@ -1125,12 +1549,74 @@ class GateDefinition:
         else:
             self._state[gate._uid] = (gate_state, gate(gate._init_inputs(), gate_state))
     
+    def get_state_store(self, layout=None):
+        '''
+        Return a copy of the definition's state packed into a flat buffer, see gates.state_store
+        Passing the layout of an earlier store skips recomputing it, as long as no gate was added or removed since
+        '''
+        return StateStore.from_state(self._state, layout)
+
+    def set_state_store(self, store):
+        '''
+        Replace the definition's state with the one held in a store
+        '''
+        self._state = store.to_state()
+
+    def tick_store(self, store):
+        '''
+        Tick the state held in a store in place, as tick does for the definition's own state
+        The bits of the state are copied between the store's buffer and the definition's compiled netlist at offsets
+        resolved once per layout, so no dict of the state is rebuilt. States holding values other than bits are
+        ticked by the interpreter through a StoreView instead
+        '''
+        from gates.engines.codegen import get_function, get_netlist  # The engines depend on this module
+        netlist = get_netlist(self)
+        bound = netlist.bind_layout(store.layout)
+        if bound is None:
+            outputs = self._process_state(store.read((), 'inputs'), StoreView(store), all=True)
+            store.write((), 'outputs', outputs)
+            return
+
+        loaded, stored = bound
+        buffer = store.values
+        values = netlist.init_values()
+        for slot, offset in loaded:
+            values[slot] = buffer[offset]
+        netlist.refresh(values)
+        if not get_function(netlist)(values, 1):
+            netlist.run(values)
+        for slot, offset in stored:
+            buffer[offset] = values[slot]
+
+    def snapshot(self):
+        '''
+        Return a read-only snapshot of the definition's state, which restore puts back
+        Snapshots share the layout of the state for as long as its shape stays the same, so taking one only copies the
+        bits of the state rather than its whole tree, see gates.state_store
+        '''
+        if self._state_layout is not None:
+            try:
+                return StateStore.from_state(self._state, self._state_layout).freeze()
+            except ValueError:
+                # The shape of the state changed since the layout was computed
+                pass
+        store = StateStore.from_state(self._state)
+        self._state_layout = store.layout
+        return store.freeze()
+
+    def restore(self, snapshot):
+        '''
+        Put back the state from a snapshot
+        '''
+        self.set_state_store(snapshot)
+
     def reset_state(self):
         # Reset state of all gates
         self._state = {}
         for gate in self._gates.values():
             self.reset_gate_state(gate)
         self._reorder = True  # Reevaluate the order
+        self._changed()
     
     def repair_state(self):
         pass
@@ -1138,12 +1624,12 @@ class GateDefinition:
         #     if key != 'inputs' and key != 'outputs':
         #         gate_state, outputs = state
 
-    def _repair_instances(self, definitions):
+    def _repair_instances(self, definition, nested):
         def proc(_):
-            gate_state = definitions[0]._init_state()
-            inputs = definitions[0]._init_inputs()
-            return (gate_state, definitions[0]._process_state(inputs, gate_state))
-        self._run_on_type_states(definitions, proc)
+            gate_state = definition._init_state()
+            inputs = definition._init_inputs()
+            return (gate_state, definition._process_state(inputs, gate_state))
+        self._run_on_type_states(definition, nested, proc)
 
     def repair_instances(self):
         self._project.repair_instances(self)
@@ -0,0 +1,201 @@
+from gates.gate_definition import GateDefinition, CompoundGate
+import time
+
+class Profiler:
+    '''
+    Records where the time spent ticking definitions goes, per definition name and per compound gate uid.
+
+    While enabled, GateDefinition.tick and CompoundGate.__call__ are replaced with versions that time each call
+    and GateDefinition._process_state with one that counts the gates it evaluates. Disabling the profiler puts the
+    original methods back, so profiling costs nothing while disabled. Only one profiler can be enabled at a time.
+
+    For every definition and every compound gate, the profiler records the number of calls, the cumulative time
+    (including nested definitions), the self time (excluding them) and the number of gates evaluated directly,
+    not counting the source and sink. Calls answered from a truth table count as calls that evaluate no gates, and
+    the gates evaluated to build a truth table are not counted, although the time spent building it is. A compound
+    gate is called once per instance of the definition it belongs to, so its statistics cover all of those instances.
+
+    Usage:
+        with Profiler() as profiler:
+            definition.tick()
+        profiler.write_collapsed('ticks.folded')
+    '''
+    _enabled = None  # The profiler that is currently enabled
+
+    # Indices into the lists holding statistics
+    CALLS = 0
+    CUMULATIVE = 1
+    SELF = 2
+    GATES = 3
+
+    def __init__(self):
+        self._originals = None
+        self.reset()
+
+    def reset(self):
+        '''
+        Clear all recorded statistics
+        '''
+        self._definitions = {}  # Indexed by definition name. Stores [calls, cumulative time, self time, gates]
+        self._gates = {}        # Indexed by gate uid. Stores [calls, cumulative time, self time, gates]
+        self._gate_names = {}   # Indexed by gate uid. Stores the name of the gate's definition
+        self._stacks = {}       # Indexed by tuples of definition names. Stores the self time spent in that stack
+        self._stack = []        # Frames being timed, each a list of [name, uid, start time, time in children, gates]
+        self._suspended = 0     # Number of truth tables being built, during which no gates are counted
+
+    def enable(self):
+        '''
+        Start recording
+        '''
+        if Profiler._enabled is self:
+            return
+        if Profiler._enabled is not None:
+            raise ValueError('Another profiler is already enabled')
+        Profiler._enabled = self
+        self._originals = (
+            GateDefinition.tick, GateDefinition._process_state, GateDefinition._build_truth_table, CompoundGate.__call__
+        )
+        tick, process_state, build_truth_table, call = self._originals
+        profiler = self
+
+        def profiled_tick(definition):
+            profiler._enter(definition._name, None)
+            try:
+                return tick(definition)
+            finally:
+                profiler._exit()
+
+        def profiled_process_state(definition, inputs, state=None, all=False):
+            if len(profiler._stack) != 0 and profiler._suspended == 0:
+                definition._update_order()
+                if all:
+                    num_gates = len(definition._order) - 2  # Neither the source nor the sink is evaluated
+                else:
+                    num_gates = len(definition._rooted_gates) - 1  # The sink is always rooted
+                    if definition._source._uid in definition._rooted_gates:
+                        num_gates -= 1
+                profiler._stack[-1][4] += num_gates
+            return process_state(definition, inputs, state=state, all=all)
+
+        def profiled_build_truth_table(definition):
+            # Enumerating a truth table evaluates the definition for every input, which no tick asked for
+            profiler._suspended += 1
+            try:
+                return build_truth_table(definition)
+            finally:
+                profiler._suspended -= 1
+
+        def profiled_call(gate, inputs, state=None):
+            profiler._enter(gate._name, gate._uid)
+            try:
+                return call(gate, inputs, state=state)
+            finally:
+                profiler._exit()
+
+        GateDefinition.tick = profiled_tick
+        GateDefinition._process_state = profiled_process_state
+        GateDefinition._build_truth_table = profiled_build_truth_table
+        CompoundGate.__call__ = profiled_call
+
+    def disable(self):
+        '''
+        Stop recording and restore the original methods
+        '''
+        if Profiler._enabled is not self:
+            return
+        (GateDefinition.tick, GateDefinition._process_state, GateDefinition._build_truth_table,
+            CompoundGate.__call__) = self._originals
+        self._originals = None
+        Profiler._enabled = None
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *args):
+        self.disable()
+
+    def _enter(self, name, uid):
+        self._stack.append([name, uid, time.perf_counter(), 0.0, 0])
+
+    def _exit(self):
+        name, uid, start, child_time, num_gates = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        if len(self._stack) != 0:
+            self._stack[-1][3] += elapsed
+
+        stats = [(self._definitions, name)]
+        if uid is not None:
+            stats.append((self._gates, uid))
+            self._gate_names[uid] = name
+        for table, key in stats:
+            if key not in table:
+                table[key] = [0, 0.0, 0.0, 0]
+            entry = table[key]
+            entry[Profiler.CALLS] += 1
+            entry[Profiler.CUMULATIVE] += elapsed
+            entry[Profiler.SELF] += elapsed - child_time
+            entry[Profiler.GATES] += num_gates
+
+        path = tuple(frame[0] for frame in self._stack) + (name,)
+        self._stacks[path] = self._stacks.get(path, 0.0) + elapsed - child_time
+
+    def _rows(self, table, sort):
+        index = {
+            'calls': Profiler.CALLS, 'cumulative': Profiler.CUMULATIVE, 'self': Profiler.SELF, 'gates': Profiler.GATES
+        }
+        if sort not in index:
+            raise ValueError('Invalid sort key: {}'.format(sort))
+        rows = [
+            (key, calls, cumulative, self_time, gates) for key, (calls, cumulative, self_time, gates) in table.items()
+        ]
+        rows.sort(key=lambda row: row[index[sort] + 1], reverse=True)
+        return rows
+
+    def get_definition_stats(self, sort='self'):
+        '''
+        Return a list of (name, calls, cumulative time, self time, gates evaluated) tuples, one per definition
+        sorted by the given field in decreasing order
+        '''
+        return self._rows(self._definitions, sort)
+
+    def get_gate_stats(self, sort='self'):
+        '''
+        Return a list of (uid, calls, cumulative time, self time, gates evaluated) tuples, one per compound gate
+        sorted by the given field in decreasing order
+        '''
+        return self._rows(self._gates, sort)
+
+    def get_gate_name(self, uid):
+        '''
+        Return the definition name of a profiled compound gate given its uid
+        '''
+        return self._gate_names[uid]
+
+    def collapsed(self):
+        '''
+        Return the self time of every stack of definitions in the collapsed stack format used by flame graph tools,
+        one "outer;inner;innermost microseconds" line per stack
+        '''
+        lines = []
+        for path, self_time in self._stacks.items():
+            lines.append('{} {}'.format(';'.join(path), int(round(self_time * 1e6))))
+        return '\n'.join(lines) + '\n' if len(lines) != 0 else ''
+
+    def write_collapsed(self, path):
+        '''
+        Write the collapsed stacks to a file, e.g. for flamegraph.pl or speedscope
+        '''
+        with open(path, 'w') as f:
+            f.write(self.collapsed())
+
+    def __str__(self):
+        '''
+        Format the statistics of every definition as a table
+        '''
+        lines = [
+            '{:>24} {:>10} {:>14} {:>14} {:>12}'.format('definition', 'calls', 'cumulative (s)', 'self (s)', 'gates')
+        ]
+        for name, calls, cumulative, self_time, gates in self.get_definition_stats():
+            lines.append('{:>24} {:>10} {:>14.6f} {:>14.6f} {:>12}'.format(name, calls, cumulative, self_time, gates))
+        return '\n'.join(lines)
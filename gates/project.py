@@ -1,25 +1,83 @@
 from gates.utils.graph import DirectedGraph
 from gates.utils.serialize import ProgramEncoder
+from gates.utils import binary
 from gates.builtins import Nand, Reshaper, Sink, Source, Datetime, Constant
 from gates.gate_definition import GateDefinition
+from collections.abc import MutableMapping
 import json
 
+class Definitions(MutableMapping):
+    '''
+    Maps names to the definitions of a project.
+
+    In a lazily loaded project, definitions that have not been materialized yet are kept serialized under their
+    name, with None as a placeholder in the underlying dict so that membership tests and iterating over the names work
+    as usual without materializing anything. Looking one up materializes it, so the None placeholders are never given
+    out: iterating over the values or items, copying with dict(...), pop and setdefault all materialize the definitions
+    they return.
+    '''
+    def __init__(self, project, definitions):
+        self._definitions = dict(definitions)  # Indexed by name. Stores the definitions, or None if not materialized
+        self._project = project
+        self._serialized = {}  # Indexed by name. Stores the serialized definitions that have not been materialized yet
+
+    def add_serialized(self, name, obj):
+        '''
+        Add a definition to be materialized on first access
+        '''
+        self._serialized[name] = obj
+        self._definitions[name] = None
+
+    def is_materialized(self, name):
+        return name not in self._serialized
+
+    def __getitem__(self, name):
+        if name in self._serialized:
+            self._project._materialize(name)
+        return self._definitions[name]
+
+    def __setitem__(self, name, definition):
+        self._serialized.pop(name, None)
+        self._definitions[name] = definition
+
+    def __delitem__(self, name):
+        del self._definitions[name]
+        self._serialized.pop(name, None)
+
+    def __contains__(self, name):
+        return name in self._definitions
+
+    def __iter__(self):
+        return iter(self._definitions)
+
+    def __len__(self):
+        return len(self._definitions)
+
+    def __repr__(self):
+        # Names only, since showing the definitions would materialize them
+        return '{}({})'.format(type(self).__name__, list(self._definitions))
+
 class Project:
     BUILTIN_GATES = ['NAND', 'Reshaper', 'Constant', 'Datetime', 'Source', 'Sink']
 
     def __init__(self, name):
         self.name = name
-        self._definitions = {
+        self._definitions = Definitions(self, {
             'NAND': Nand,
             'Reshaper': Reshaper,
             'Constant': Constant,
             'Datetime': Datetime,
             'Source': Source,
             'Sink': Sink
-        }
+        })
         self._dependency_graph = DirectedGraph()
+        self._version = 0  # Incremented whenever any definition in the project changes
         for name in self._definitions.keys():
             self._dependency_graph.add_vertex(name)
+
+        # How to materialize the definitions of a lazily loaded project, see deserialize
+        self._loaded_gates = None  # Map from saved gate uids to the new gates shared by all materialized definitions
+        self._validate = True      # Whether to validate the definitions as they are materialized
     
     def get_gate_names(self):
         return self._definitions.keys()
@@ -65,16 +123,11 @@ class Project:
         else:
             definition = self._definitions[name]
 
-            # Replace the old name with the new one in the definitions that depend on it
+            # Replace the old name with the new one in the definitions that depend on it. Their gates read their name
+            # from the definition, which is renamed below
             predecessors = self._dependency_graph.get_direct_predecessors(name)
             for predecessor in predecessors:
                 pred_definition = self._definitions[predecessor]
-
-                # Replace the name of each gate
-                for gate_uid in pred_definition._gate_types[name]:
-                    pred_definition._gates[gate_uid]._name = new_name
-
-                # Replace the name used by the predecessor definition
                 pred_definition._gate_types[new_name] = pred_definition._gate_types[name]
                 del pred_definition._gate_types[name]
             self._definitions[new_name] = self._definitions[name]
@@ -107,21 +160,27 @@ class Project:
     def _get_dependees(self, definition):
         return [self._definitions[predecessor] for predecessor in self._dependency_graph.get_direct_predecessors(definition._name)]
 
-    def _run_on_dependees(self, definition, proc, acc=[]):
+    def _run_on_dependees(self, definition, proc):
         '''
-        Run the function proc on all dependees of the given definition
+        Run the function proc once on every definition that depends on the given definition, directly or not
+        proc is called with the dependee and the uids of the instances of every dependee, which are the instances
+        whose states can hold the states of instances of the given definition. Each dependee is visited once however
+        many paths through the dependency graph lead to it
         '''
-        for dependee in self._get_dependees(definition):
-            proc(dependee, acc + [definition])
-            self._run_on_dependees(dependee, proc, acc + [definition])
+        dependees = [self._definitions[name] for name in self._dependency_graph.get_all_predecessors(definition._name)]
+        nested = set()
+        for dependee in dependees:
+            nested.update(dependee._instance_uids)
+        for dependee in dependees:
+            proc(dependee, nested)
 
     def _inserted_input(self, definition, idx):
         for dependee in self._get_dependees(definition):
             dependee._inserted_input(definition, idx)
 
     def _inserted_output(self, definition, idx):
-        def helper(definition, acc):
-            definition._inserted_output(acc, idx)
+        def helper(dependee, nested):
+            dependee._inserted_output(definition, idx, nested)
         self._run_on_dependees(definition, helper)
 
     def _removed_input(self, definition, idx):
@@ -129,18 +188,18 @@ class Project:
             dependee._removed_input(definition, idx)
 
     def _removed_output(self, definition, idx):
-        def helper(definition, acc):
-            definition._removed_output(acc, idx)
+        def helper(dependee, nested):
+            dependee._removed_output(definition, idx, nested)
         self._run_on_dependees(definition, helper)
     
     def _remove_uid(self, definition, uid):
-        def helper(definition, acc):
-            definition._remove_uid(acc, uid)
+        def helper(dependee, nested):
+            dependee._remove_uid(definition, uid, nested)
         self._run_on_dependees(definition, helper)
 
     def repair_instances(self, definition):
-        def helper(definition, acc):
-            definition._repair_instances(acc)
+        def helper(dependee, nested):
+            dependee._repair_instances(definition, nested)
         self._run_on_dependees(definition, helper)
 
     def __getitem__(self, *args, **kwargs):
@@ -158,21 +217,91 @@ class Project:
             'dependency_graph': self._dependency_graph.serialize()
         }
 
-    def deserialize(obj, gates={}):
+    def deserialize(obj, gates=None, validate=True, lazy=False):
+        '''
+        Deserialize a project. Without validate, the save is trusted and definitions are built in bulk
+        With lazy, definitions are only materialized when they are first accessed, together with the definitions they
+        depend on. Their dependencies are known from their gate types, so the dependency graph is complete right away
+        gates is filled with a map from the saved gate uids to the new gates, and kept by lazily loaded projects
+        '''
+        if gates is None:
+            gates = {}
         project = Project(obj['name'])
         dependency_graph = DirectedGraph.deserialize(obj['dependency_graph'])
         order = dependency_graph.get_order('NAND')[0]
+        if lazy:
+            project._loaded_gates = gates
+            project._validate = validate
+            for gate_type in reversed(order):
+                if gate_type not in project._definitions:
+                    project._dependency_graph.add_vertex(gate_type)
+                    project._definitions.add_serialized(gate_type, obj['definitions'][gate_type])
+            for name, serialized in project._definitions._serialized.items():
+                # In the order the definition adds them once built, starting with its sink and source
+                project._dependency_graph.add_edge(name, 'Sink')
+                project._dependency_graph.add_edge(name, 'Source')
+                for gate_type in serialized['gate_types']:
+                    project._dependency_graph.add_edge(name, gate_type)
+            return project
+
         for gate_type in reversed(order):
             if gate_type not in project._definitions:
                 project._dependency_graph.add_vertex(gate_type)
-                definition = GateDefinition.deserialize(obj['definitions'][gate_type], project, gates)
+                definition = GateDefinition.deserialize(obj['definitions'][gate_type], project, gates, validate=validate)
                 project._definitions[gate_type] = definition
         return project
+
+    def _materialize(self, name):
+        '''
+        Build a definition of a lazily loaded project, after the definitions it depends on
+        '''
+        for gate_type in self._dependency_graph.get_direct_successors(name):
+            if not self._definitions.is_materialized(gate_type):
+                self._materialize(gate_type)
+        obj = self._definitions._serialized[name]
+        definition = GateDefinition.deserialize(obj, self, self._loaded_gates, validate=self._validate)
+        self._definitions[name] = definition
+
+    def _materialize_all(self):
+        '''
+        Build every definition of a lazily loaded project that has not been materialized yet
+        '''
+        for name in list(self._definitions._serialized):
+            if not self._definitions.is_materialized(name):
+                self._materialize(name)
+
+    def is_materialized(self, name):
+        '''
+        Check whether a definition has been built, which is always the case unless the project was loaded lazily
+        '''
+        return self._definitions.is_materialized(name)
     
     def save(self, dir):
         with open(dir, 'w') as f:
             json.dump(self.serialize(), f, cls=ProgramEncoder, indent=4)
     
-    def load(dir):
+    def load(dir, lazy=False):
         with open(dir, 'r') as f:
-            return Project.deserialize(json.load(f))
\ No newline at end of file
+            return Project.deserialize(json.load(f), {}, lazy=lazy)
+
+    def save_binary(self, dir):
+        '''
+        Save the project in the binary format, see gates.utils.binary
+        '''
+        with open(dir, 'wb') as f:
+            f.write(binary.dumps(self.serialize()))
+
+    def load_binary(dir, gates=None, lazy=False):
+        '''
+        Load a project saved in the binary format. Binary saves are only ever written from valid projects, so the
+        definitions are built in bulk without validating every gate and connection
+        '''
+        with open(dir, 'rb') as f:
+            return Project.deserialize_binary(f.read(), gates, lazy=lazy)
+
+    def deserialize_binary(data, gates=None, lazy=False):
+        '''
+        Deserialize a project from a binary save, either of a bare project or of a save written by the app
+        '''
+        obj = binary.loads(data, int_keys=True)
+        return Project.deserialize(obj['project'] if 'project' in obj else obj, gates, validate=False, lazy=lazy)
\ No newline at end of file
@@ -0,0 +1,439 @@
+from gates.utils.bus import Bus
+from collections import deque
+import copy
+
+UNKNOWN = 2  # Byte used in place of None for a single bit, as in gates.engines.netlist
+
+# Kinds of values
+BIT = 0     # A single bit: 0, 1 or None
+BITS = 1    # A list of bits
+BUS = 2     # A packed bus, see gates.utils.bus
+OBJECT = 3  # Anything else, which is kept as a Python object next to the buffer
+
+# Kinds of entries in a state dict and of gate states
+PAIR = 0    # A gate's (state, outputs) pair
+VALUES = 1  # A list of values, such as the inputs and outputs of a definition or the state of a sink
+DICT = 2    # The state of a compound gate, which is a state dict itself
+
+class StateLayout:
+    '''
+    The shape of a definition's state: which entries it holds at every level of nesting and where each of their bits
+    is stored in a flat buffer, see StateStore.
+
+    A layout is computed once from a state and can be shared by every state with the same shape, such as the states
+    of a running definition from one tick to the next, as long as no gate is added or removed in the meantime.
+    Every value is addressed by the path of compound gate uids leading to the state dict holding it and by its key in
+    that dict, which is either a gate uid (for the gate's outputs) or 'inputs' or 'outputs' at the top level.
+    '''
+    def __init__(self, state):
+        self._size = 0          # Number of bytes in the buffer
+        self._num_objects = 0   # Number of values that are kept as Python objects
+        self._offsets = {}      # Indexed by (path, key). Stores a tuple of (kind, offset, dim) specs, one per value
+        self._entries = {}      # Indexed by (path, key). Stores the (state spec, value specs) of every gate's entry
+        self._root = self._layout_dict(state, ())
+
+    def _layout_dict(self, state, path):
+        '''
+        Lay out a state dict as a tuple of (key, kind, state spec, value specs) entries
+        '''
+        entries = []
+        for key, value in state.items():
+            if key == 'inputs' or key == 'outputs':
+                kind, state_spec, value_specs = VALUES, None, self._layout_values(value)
+            else:
+                gate_state, outputs = value
+                if gate_state is None:
+                    state_spec = None
+                elif isinstance(gate_state, dict):
+                    state_spec = (DICT, self._layout_dict(gate_state, path + (key,)))
+                elif isinstance(gate_state, list):
+                    state_spec = (VALUES, self._layout_values(gate_state))
+                else:
+                    state_spec = (OBJECT, self._layout_object())
+                kind, value_specs = PAIR, self._layout_values(outputs)
+            entries.append((key, kind, state_spec, value_specs))
+            if kind == PAIR:
+                self._entries[path, key] = (state_spec, value_specs)
+            if value_specs is not None:
+                self._offsets[path, key] = value_specs
+        return tuple(entries)
+
+    def _layout_values(self, values):
+        if values is None:
+            return None
+        return tuple(self._layout_value(value) for value in values)
+
+    def _layout_value(self, value):
+        if value is None or (type(value) == int and 0 <= value <= 1):
+            return self._allocate(BIT, 1)
+        if type(value) == Bus:
+            return self._allocate(BUS, value.dim)
+        if type(value) == list and all(bit is None or (type(bit) == int and 0 <= bit <= 1) for bit in value):
+            return self._allocate(BITS, len(value))
+        return (OBJECT, self._layout_object(), None)
+
+    def _allocate(self, kind, dim):
+        spec = (kind, self._size, dim)
+        self._size += dim
+        return spec
+
+    def _layout_object(self):
+        self._num_objects += 1
+        return self._num_objects - 1
+
+    def write(self, state, values, objects):
+        '''
+        Copy the bits of a state with this layout into a buffer, and its other values into a list of objects
+        Raises a ValueError if the state does not have the shape of the layout
+        '''
+        try:
+            self._write_dict(self._root, state, values, objects)
+        except (KeyError, TypeError) as e:
+            raise ValueError('State does not match the layout') from e
+
+    def _write_dict(self, entries, state, values, objects):
+        if len(state) != len(entries):
+            raise ValueError('State does not match the layout')
+        for key, kind, state_spec, value_specs in entries:
+            if kind == VALUES:
+                self._write_values(value_specs, state[key], values, objects)
+                continue
+            gate_state, outputs = state[key]
+            self._write_gate_state(state_spec, gate_state, values, objects)
+            self._write_values(value_specs, outputs, values, objects)
+
+    def _write_gate_state(self, state_spec, gate_state, values, objects):
+        if state_spec is None:
+            if gate_state is not None:
+                raise ValueError('State does not match the layout')
+        elif state_spec[0] == DICT:
+            self._write_dict(state_spec[1], gate_state, values, objects)
+        elif state_spec[0] == VALUES:
+            self._write_values(state_spec[1], gate_state, values, objects)
+        else:
+            objects[state_spec[1]] = copy.deepcopy(gate_state)
+
+    def _write_values(self, specs, items, values, objects):
+        if specs is None or items is None:
+            if specs is not items:
+                raise ValueError('State does not match the layout')
+            return
+        if len(items) != len(specs):
+            raise ValueError('State does not match the layout')
+        for (kind, offset, dim), item in zip(specs, items):
+            if kind == BIT:
+                values[offset] = UNKNOWN if item is None else item
+            elif kind == OBJECT:
+                objects[offset] = copy.deepcopy(item)
+            else:
+                # Check the representation and length of buses, which the buffer would otherwise silently absorb
+                if type(item) != (Bus if kind == BUS else list) or len(item) != dim:
+                    raise ValueError('State does not match the layout')
+                if kind == BUS:
+                    item = item.to_bits()
+                try:
+                    values[offset:offset + dim] = bytes(item)
+                except TypeError:
+                    # Some bits are unknown
+                    values[offset:offset + dim] = bytes([UNKNOWN if bit is None else bit for bit in item])
+
+    def read(self, values, objects, buses=True):
+        '''
+        Rebuild a state with this layout from a buffer and a list of objects
+        Without buses, packed buses are rebuilt as lists of bits, as in serialized states
+        '''
+        return self._read_dict(self._root, values, objects, buses)
+
+    def _read_dict(self, entries, values, objects, buses):
+        state = {}
+        for key, kind, state_spec, value_specs in entries:
+            if kind == VALUES:
+                state[key] = self._read_values(value_specs, values, objects, buses)
+                continue
+            gate_state = self._read_gate_state(state_spec, values, objects, buses)
+            state[key] = (gate_state, self._read_values(value_specs, values, objects, buses))
+        return state
+
+    def _read_gate_state(self, state_spec, values, objects, buses):
+        if state_spec is None:
+            return None
+        elif state_spec[0] == DICT:
+            return self._read_dict(state_spec[1], values, objects, buses)
+        elif state_spec[0] == VALUES:
+            return self._read_values(state_spec[1], values, objects, buses)
+        return copy.deepcopy(objects[state_spec[1]])
+
+    def _read_values(self, specs, values, objects, buses):
+        if specs is None:
+            return None
+        items = []
+        for kind, offset, dim in specs:
+            if kind == BIT:
+                bit = values[offset]
+                items.append(None if bit == UNKNOWN else bit)
+            elif kind == OBJECT:
+                items.append(copy.deepcopy(objects[offset]))
+            else:
+                chunk = values[offset:offset + dim]
+                bits = list(chunk)
+                if UNKNOWN in chunk:
+                    bits = [None if bit == UNKNOWN else bit for bit in bits]
+                items.append(Bus.from_bits(bits) if kind == BUS and buses else bits)
+        return items
+
+    def get_specs(self, path, key):
+        '''
+        Return the (kind, offset, dim) spec of every value stored under a key of the state dict at the given path
+        '''
+        if (path, key) not in self._offsets:
+            raise ValueError('No values stored for {} at {}'.format(key, path))
+        return self._offsets[path, key]
+
+    def get_entry(self, path, key):
+        '''
+        Return the (state spec, value specs) of the entry of a gate in the state dict at the given path, or None if
+        the state dict holds no entry for it
+        '''
+        return self._entries.get((path, key), None)
+
+    def __eq__(self, other):
+        return isinstance(other, StateLayout) and self._root == other._root
+
+    def __hash__(self):
+        return hash(self._root)
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def num_objects(self):
+        return self._num_objects
+
+class StateStore:
+    '''
+    A definition's state held in a single flat buffer with one byte per bit (0, 1 or UNKNOWN), laid out by a
+    StateLayout, instead of a tree of dicts, tuples and lists.
+
+    Converting a state to a store and back is lossless, both for the states definitions tick on (see from_state and
+    to_state) and for serialized states (see from_serialized and to_serialized). Copying a store only copies its
+    buffer, and stores of states with the same shape share their layout.
+
+    A store can also be ticked in place, on the definition's compiled netlist, without unpacking it, see
+    GateDefinition.tick_store.
+
+    Usage:
+        store = definition.get_state_store()
+        definition.tick()
+        definition.set_state_store(store)  # Back to the state before the tick
+        definition.tick_store(store)       # Ticks the store, leaving the definition's own state as it is
+    '''
+    def __init__(self, layout, values=None, objects=None):
+        self._layout = layout
+        self._values = bytearray(layout.size) if values is None else values
+        self._objects = [None] * layout.num_objects if objects is None else objects
+
+    @staticmethod
+    def from_state(state, layout=None):
+        '''
+        Pack a state, reusing the given layout if there is one
+        Raises a ValueError if the state does not have the shape of the given layout
+        '''
+        if layout is None:
+            layout = StateLayout(state)
+        store = StateStore(layout)
+        layout.write(state, store._values, store._objects)
+        return store
+
+    @staticmethod
+    def from_serialized(obj, layout=None):
+        '''
+        Pack a serialized state, as returned by GateDefinition.serialize_state
+        '''
+        return StateStore.from_state(obj, layout)
+
+    def update(self, state):
+        '''
+        Overwrite the store with a state of the same shape
+        '''
+        self._layout.write(state, self._values, self._objects)
+
+    def to_state(self):
+        '''
+        Rebuild the state, with multi-bit values in the representation they were stored in
+        '''
+        return self._layout.read(self._values, self._objects)
+
+    def to_serialized(self):
+        '''
+        Rebuild the state in the format of GateDefinition.serialize_state, with buses as lists of bits
+        '''
+        return self._layout.read(self._values, self._objects, buses=False)
+
+    def read(self, path, key):
+        '''
+        Read the values stored under a key of the state dict at the given path of compound gate uids: the outputs
+        of a gate if key is its uid, or the definition's inputs or outputs if key is 'inputs' or 'outputs'
+        '''
+        return self._layout._read_values(self._layout.get_specs(path, key), self._values, self._objects, True)
+
+    def write(self, path, key, items):
+        '''
+        Overwrite the values stored under a key of the state dict at the given path, see read
+        '''
+        specs = self._layout.get_specs(path, key)
+        if len(items) != len(specs):
+            raise ValueError('Expected {} values for {} at {}, got {}'.format(len(specs), key, path, len(items)))
+        self._layout._write_values(specs, items, self._values, self._objects)
+
+    def read_gate(self, path, uid):
+        '''
+        Rebuild the (state, outputs) pair of a gate in the state dict at the given path, see read
+        '''
+        state_spec, value_specs = self._get_entry(path, uid)
+        layout = self._layout
+        return (
+            layout._read_gate_state(state_spec, self._values, self._objects, True),
+            layout._read_values(value_specs, self._values, self._objects, True)
+        )
+
+    def write_gate(self, path, uid, pair):
+        '''
+        Overwrite the (state, outputs) pair of a gate in the state dict at the given path, see read
+        Raises a ValueError if the pair does not have the shape it was laid out with
+        '''
+        state_spec, value_specs = self._get_entry(path, uid)
+        gate_state, outputs = pair
+        try:
+            self._layout._write_gate_state(state_spec, gate_state, self._values, self._objects)
+            self._layout._write_values(value_specs, outputs, self._values, self._objects)
+        except (KeyError, TypeError) as e:
+            raise ValueError('State does not match the layout') from e
+
+    def _get_entry(self, path, uid):
+        entry = self._layout.get_entry(path, uid)
+        if entry is None:
+            raise ValueError('No state stored for gate {} at {}'.format(uid, path))
+        return entry
+
+    def copy(self):
+        '''
+        Return an independent store sharing this store's layout
+        '''
+        return StateStore(self._layout, bytearray(self._values), copy.deepcopy(self._objects))
+
+    def freeze(self):
+        '''
+        Return a read-only copy of the store, whose buffer is immutable, as used for snapshots
+        '''
+        return StateStore(self._layout, bytes(self._values), self._objects)
+
+    def __eq__(self, other):
+        if not isinstance(other, StateStore):
+            return NotImplemented
+        return (self._layout is other._layout or self._layout == other._layout) and \
+            self._values == other._values and self._objects == other._objects
+
+    @property
+    def layout(self):
+        return self._layout
+
+    @property
+    def values(self):
+        return self._values
+
+    @property
+    def nbytes(self):
+        return len(self._values)
+
+class StoreView:
+    '''
+    The state dict at a path of a store, as seen by GateDefinition._process_state, which can tick on it in place of a
+    state dict. Every read and write of a gate's entry goes through the store's buffer, see StateStore.read_gate and
+    write_gate, so the store stays the only copy of the state. GateDefinition.tick_store uses it for states holding
+    values that its netlist cannot bind to the buffer.
+
+    Only the entries of gates are exposed, as the interpreter passes the inputs and outputs of a definition separately
+    '''
+    __slots__ = ('_store', '_path')
+
+    def __init__(self, store, path=()):
+        self._store = store
+        self._path = path
+
+    def __contains__(self, uid):
+        return self._store._layout.get_entry(self._path, uid) is not None
+
+    def __getitem__(self, uid):
+        return self._store.read_gate(self._path, uid)
+
+    def __setitem__(self, uid, pair):
+        self._store.write_gate(self._path, uid, pair)
+
+    def get(self, uid, default=None):
+        if uid not in self:
+            return default
+        return self._store.read_gate(self._path, uid)
+
+class History:
+    '''
+    A bounded ring of snapshots of a definition's state, one taken before every tick, so that a simulation can be
+    rewound by up to size ticks without replaying it from a reset.
+
+    Snapshots are read-only stores sharing the layout of the definition's state (see GateDefinition.snapshot), so
+    each one only holds the bits of the state, and a snapshot identical to the previous one shares its buffer.
+
+    Usage:
+        history = History(definition, 64)
+        history.tick(100)
+        history.rewind(10)  # The definition is back in the state it was in 10 ticks ago
+    '''
+    def __init__(self, definition, size):
+        if size < 1:
+            raise ValueError('History size must be positive, got {}'.format(size))
+        self._definition = definition
+        self._snapshots = deque(maxlen=size)
+
+    def record(self):
+        '''
+        Take a snapshot of the definition's current state, dropping the oldest one if the history is full
+        '''
+        snapshot = self._definition.snapshot()
+        if len(self._snapshots) != 0 and self._snapshots[-1] == snapshot:
+            snapshot = self._snapshots[-1]
+        self._snapshots.append(snapshot)
+
+    def tick(self, num_ticks=1):
+        '''
+        Tick the definition num_ticks times, recording its state before every tick
+        '''
+        for _ in range(num_ticks):
+            self.record()
+            self._definition.tick()
+
+    def rewind(self, num_ticks=1):
+        '''
+        Restore the state the definition was in num_ticks ticks ago, forgetting the snapshots taken since
+        '''
+        if num_ticks < 1 or num_ticks > len(self._snapshots):
+            raise ValueError('Cannot rewind {} ticks, {} recorded'.format(num_ticks, len(self._snapshots)))
+        for _ in range(num_ticks - 1):
+            self._snapshots.pop()
+        self._definition.restore(self._snapshots.pop())
+
+    def clear(self):
+        self._snapshots.clear()
+
+    def __len__(self):
+        return len(self._snapshots)
+
+    @property
+    def size(self):
+        return self._snapshots.maxlen
+
+    @property
+    def snapshots(self):
+        '''
+        The recorded snapshots, oldest first
+        '''
+        return tuple(self._snapshots)
@@ -1,4 +1,5 @@
-from gates.utils.graph import DirectedGraph
+from gates.utils.graph import DirectedGraph, GraphSnapshot
 from gates.utils.hybridmethod import hybridmethod
 from gates.utils.serialize import ProgramEncoder
-from gates.utils.orderedset import OrderedSet
\ No newline at end of file
+from gates.utils.orderedset import OrderedSet
+from gates.utils.bus import Bus
\ No newline at end of file
@@ -0,0 +1,471 @@
+'''
+Compact, versioned binary encoding of saves
+
+A binary save starts with MAGIC, the format version and the kind of save (a bare project as written by
+Project.serialize, or a save written by the app, which holds the project under 'project'). A table of every string
+in the save follows, then the body. Integers are unsigned LEB128 varints, zigzag encoded first where they may be
+negative, and strings are written as their index in the string table.
+
+Definitions are written field by field: dims as lists of varints, gate types as lists of uids and connections as
+nested tables of (output index, input index) varint pairs. Everything else, including states, is written as tagged
+values, where lists of bits take three varints (their length, known bits and unknown bits) and dict keys that are
+uids are written as varints rather than strings.
+
+Decoding gives back exactly what json.load gives for the equivalent JSON save, so converting in either direction is
+lossless. With int_keys set, the uids keying the gates, connections and states of definitions are given as ints
+instead, as in the output of Project.serialize. Keys anywhere else stay strings even if they are made of digits, since
+they may be names, such as those of definitions in the dependency graph.
+
+Convert saves from the command line with convert_save.py.
+'''
+from gates.utils.orderedset import OrderedSet
+from gates.utils.serialize import ProgramEncoder
+from gates.utils.bus import Bus
+import struct
+import json
+
+MAGIC = b'LGSV'
+VERSION = 1
+EXTENSION = '.lgb'  # Extension used for binary saves
+
+# Kinds of saves
+PROJECT = 0    # A bare project
+FULL_SAVE = 1  # A save written by the app, holding the project under 'project'
+
+# Tags of values
+NONE, FALSE, TRUE, INT, FLOAT, STRING, LIST, DICT, BITS = range(9)
+
+# Encodings of definitions
+GENERIC = 0     # Written as a tagged value, for definitions that do not have the expected fields
+DEFINITION = 1  # Written field by field
+
+DEFINITION_KEYS = (
+    'name', 'input_dims', 'output_dims', 'input_labels', 'output_labels',
+    'source', 'sink', 'gates', 'gate_types', 'connections', 'state'
+)
+
+FLOAT_FORMAT = struct.Struct('<d')
+
+def _uid_key(key):
+    '''
+    Return a dict key as an int if it is a uid, either an int or a string holding one, otherwise None
+    '''
+    if type(key) == int and key >= 0:
+        return key
+    if type(key) == str and key.isdigit() and key.isascii() and str(int(key)) == key:
+        return int(key)
+    return None
+
+def _bits(value):
+    '''
+    Return a list of bits packed into (value, unknown mask) ints, or None if it is not a list of bits
+    '''
+    if len(value) < 2:
+        return None
+    packed = unknown = 0
+    for bit in value:
+        packed <<= 1
+        unknown <<= 1
+        if bit is None:
+            unknown |= 1
+        elif type(bit) == int and (bit == 0 or bit == 1):
+            packed |= bit
+        else:
+            return None
+    return packed, unknown
+
+class Encoder:
+    '''
+    Writes a save into a buffer, collecting its strings into a table
+    '''
+    def __init__(self):
+        self._strings = {}
+        self._buffer = bytearray()
+
+    def write_uint(self, n):
+        if type(n) != int or n < 0:
+            raise ValueError('Expected a non-negative int, got {}'.format(n))
+        buffer = self._buffer
+        while n >= 0x80:
+            buffer.append((n & 0x7f) | 0x80)
+            n >>= 7
+        buffer.append(n)
+
+    def write_int(self, n):
+        self.write_uint(n << 1 if n >= 0 else ((-n) << 1) - 1)
+
+    def write_string(self, s):
+        if type(s) != str:
+            raise ValueError('Expected a string, got {}'.format(s))
+        idx = self._strings.get(s, None)
+        if idx is None:
+            idx = len(self._strings)
+            self._strings[s] = idx
+        self.write_uint(idx)
+
+    def write_uints(self, values):
+        self.write_uint(len(values))
+        for value in values:
+            self.write_uint(value)
+
+    def write_key(self, key):
+        '''
+        Write a dict key, uids as odd varints and strings as even ones
+        '''
+        uid = _uid_key(key)
+        if uid is not None:
+            self.write_uint((uid << 1) | 1)
+        elif type(key) == str:
+            idx = self._strings.get(key, None)
+            if idx is None:
+                idx = len(self._strings)
+                self._strings[key] = idx
+            self.write_uint(idx << 1)
+        else:
+            raise ValueError('Cannot encode dict key {}'.format(key))
+
+    def write_value(self, value):
+        '''
+        Write any value that can be encoded as JSON by ProgramEncoder
+        '''
+        buffer = self._buffer
+        if value is None:
+            buffer.append(NONE)
+        elif value is False:
+            buffer.append(FALSE)
+        elif value is True:
+            buffer.append(TRUE)
+        elif type(value) == int:
+            buffer.append(INT)
+            self.write_int(value)
+        elif type(value) == float:
+            buffer.append(FLOAT)
+            buffer += FLOAT_FORMAT.pack(value)
+        elif type(value) == str:
+            buffer.append(STRING)
+            self.write_string(value)
+        elif type(value) == Bus:
+            buffer.append(BITS)
+            self.write_uint(value.dim)
+            self.write_uint(value.value)
+            self.write_uint(value.unknown)
+        elif isinstance(value, (list, tuple, OrderedSet)):
+            bits = _bits(value) if type(value) == list else None
+            if bits is not None:
+                buffer.append(BITS)
+                self.write_uint(len(value))
+                self.write_uint(bits[0])
+                self.write_uint(bits[1])
+            else:
+                buffer.append(LIST)
+                self.write_uint(len(value))
+                for item in value:
+                    self.write_value(item)
+        elif isinstance(value, dict):
+            buffer.append(DICT)
+            self.write_uint(len(value))
+            for key, item in value.items():
+                self.write_key(key)
+                self.write_value(item)
+        else:
+            raise ValueError('Cannot encode {}'.format(value))
+
+    def write_definition(self, obj):
+        '''
+        Write a serialized definition field by field, falling back to a tagged value if it has unexpected fields
+        '''
+        start = len(self._buffer)
+        if type(obj) == dict and tuple(obj.keys()) == DEFINITION_KEYS:
+            self._buffer.append(DEFINITION)
+            try:
+                self._write_definition_fields(obj)
+                return
+            except (ValueError, TypeError, AttributeError):
+                del self._buffer[start:]
+        self._buffer.append(GENERIC)
+        self.write_value(obj)
+
+    def _write_definition_fields(self, obj):
+        self.write_value(obj['name'])
+        self.write_uints(obj['input_dims'])
+        self.write_uints(obj['output_dims'])
+        self.write_value(obj['input_labels'])
+        self.write_value(obj['output_labels'])
+        self.write_uint(obj['source'])
+        self.write_uint(obj['sink'])
+        self.write_value(obj['gates'])
+
+        self.write_uint(len(obj['gate_types']))
+        for gate_type, uids in obj['gate_types'].items():
+            self.write_string(gate_type)
+            self.write_uints(uids)
+
+        # Connection tables as from uid -> to uid -> (output index, input index) pairs
+        self.write_uint(len(obj['connections']))
+        for from_uid, value in obj['connections'].items():
+            self.write_uid(from_uid)
+            self.write_uint(len(value))
+            for to_uid, pairs in value.items():
+                self.write_uid(to_uid)
+                self.write_uint(len(pairs))
+                for pair in pairs:
+                    output_idx, input_idx = pair
+                    if type(pair) not in (list, tuple):
+                        raise ValueError('Expected a pair, got {}'.format(pair))
+                    self.write_uint(output_idx)
+                    self.write_uint(input_idx)
+
+        self.write_value(obj['state'])
+
+    def write_uid(self, key):
+        uid = _uid_key(key)
+        if uid is None:
+            raise ValueError('Expected a uid, got {}'.format(key))
+        self.write_uint(uid)
+
+    def write_project(self, obj):
+        if type(obj) != dict or tuple(obj.keys()) != ('name', 'definitions', 'dependency_graph'):
+            raise ValueError('Not a serialized project')
+        self.write_value(obj['name'])
+        self.write_uint(len(obj['definitions']))
+        for name, definition in obj['definitions'].items():
+            self.write_string(name)
+            self.write_definition(definition)
+        self.write_value(obj['dependency_graph'])
+
+    def getvalue(self, kind):
+        '''
+        Return the complete save: the header, the string table and the body
+        '''
+        body = self._buffer
+        self._buffer = bytearray(MAGIC)
+        self.write_uint(VERSION)
+        self.write_uint(kind)
+        self.write_uint(len(self._strings))
+        for s in self._strings:
+            encoded = s.encode('utf-8')
+            self.write_uint(len(encoded))
+            self._buffer += encoded
+        self._buffer += body
+        return bytes(self._buffer)
+
+class Decoder:
+    '''
+    Reads a save written by Encoder
+    '''
+    def __init__(self, data, int_keys=False):
+        if not is_binary(data):
+            raise ValueError('Not a binary save')
+        self._data = data
+        self._pos = len(MAGIC)
+        self._int_keys = int_keys
+        version = self.read_uint()
+        if version > VERSION:
+            raise ValueError('Unsupported binary save version {}, expected at most {}'.format(version, VERSION))
+        self._kind = self.read_uint()
+
+        self._strings = []
+        for _ in range(self.read_uint()):
+            length = self.read_uint()
+            self._strings.append(data[self._pos:self._pos + length].decode('utf-8'))
+            self._pos += length
+
+    def read_uint(self):
+        data = self._data
+        pos = self._pos
+        byte = data[pos]
+        pos += 1
+        n = byte & 0x7f
+        shift = 7
+        while byte & 0x80:
+            byte = data[pos]
+            pos += 1
+            n |= (byte & 0x7f) << shift
+            shift += 7
+        self._pos = pos
+        return n
+
+    def read_int(self):
+        n = self.read_uint()
+        return -((n + 1) >> 1) if n & 1 else n >> 1
+
+    def read_string(self):
+        return self._strings[self.read_uint()]
+
+    def read_uints(self):
+        return [self.read_uint() for _ in range(self.read_uint())]
+
+    def read_uid(self):
+        uid = self.read_uint()
+        return uid if self._int_keys else str(uid)
+
+    def read_key(self, int_keys=False):
+        key = self.read_uint()
+        if key & 1:
+            return key >> 1 if int_keys else str(key >> 1)
+        return self._strings[key >> 1]
+
+    def read_uid_dict(self):
+        '''
+        Read a dict keyed by uids, such as the gates of a definition, with int_keys giving its keys as ints
+        '''
+        if self._data[self._pos] != DICT:
+            return self.read_value()
+        self._pos += 1
+        value = {}
+        for _ in range(self.read_uint()):
+            key = self.read_key(self._int_keys)
+            value[key] = self.read_value()
+        return value
+
+    def read_state(self):
+        '''
+        Read the state of a definition, with int_keys giving the uids keying it as ints. As in
+        GateDefinition._load_state, the state of a gate is read as a nested state if it is a dict
+        '''
+        if self._data[self._pos] != DICT:
+            return self.read_value()
+        self._pos += 1
+        state = {}
+        for _ in range(self.read_uint()):
+            key = self.read_uint()
+            if key & 1 == 0:
+                state[self._strings[key >> 1]] = self.read_value()
+                continue
+
+            key = key >> 1 if self._int_keys else str(key >> 1)
+            if self._data[self._pos] == LIST and self._data[self._pos + 1] == 2:
+                # (gate state, outputs) pairs, written as lists of length 2
+                self._pos += 2
+                state[key] = [self.read_state(), self.read_value()]
+            else:
+                state[key] = self.read_value()
+        return state
+
+    def read_value(self):
+        tag = self._data[self._pos]
+        self._pos += 1
+        if tag == NONE:
+            return None
+        elif tag == FALSE:
+            return False
+        elif tag == TRUE:
+            return True
+        elif tag == INT:
+            return self.read_int()
+        elif tag == FLOAT:
+            value, = FLOAT_FORMAT.unpack_from(self._data, self._pos)
+            self._pos += FLOAT_FORMAT.size
+            return value
+        elif tag == STRING:
+            return self.read_string()
+        elif tag == LIST:
+            return [self.read_value() for _ in range(self.read_uint())]
+        elif tag == DICT:
+            value = {}
+            for _ in range(self.read_uint()):
+                key = self.read_key()
+                value[key] = self.read_value()
+            return value
+        elif tag == BITS:
+            dim = self.read_uint()
+            return Bus(dim, self.read_uint(), self.read_uint()).to_bits()
+        raise ValueError('Invalid tag {} at byte {}'.format(tag, self._pos - 1))
+
+    def read_definition(self):
+        encoding = self._data[self._pos]
+        self._pos += 1
+        if encoding == GENERIC:
+            return self.read_value()
+        elif encoding != DEFINITION:
+            raise ValueError('Invalid definition encoding {} at byte {}'.format(encoding, self._pos - 1))
+
+        obj = {}
+        obj['name'] = self.read_value()
+        obj['input_dims'] = self.read_uints()
+        obj['output_dims'] = self.read_uints()
+        obj['input_labels'] = self.read_value()
+        obj['output_labels'] = self.read_value()
+        obj['source'] = self.read_uint()
+        obj['sink'] = self.read_uint()
+        obj['gates'] = self.read_uid_dict()
+
+        gate_types = {}
+        for _ in range(self.read_uint()):
+            gate_type = self.read_string()
+            gate_types[gate_type] = self.read_uints()
+        obj['gate_types'] = gate_types
+
+        connections = {}
+        read_uint = self.read_uint
+        for _ in range(read_uint()):
+            from_uid = self.read_uid()
+            value = {}
+            for _ in range(read_uint()):
+                to_uid = self.read_uid()
+                value[to_uid] = [[read_uint(), read_uint()] for _ in range(read_uint())]
+            connections[from_uid] = value
+        obj['connections'] = connections
+
+        obj['state'] = self.read_state()
+        return obj
+
+    def read_project(self):
+        obj = {}
+        obj['name'] = self.read_value()
+        definitions = {}
+        for _ in range(self.read_uint()):
+            name = self.read_string()
+            definitions[name] = self.read_definition()
+        obj['definitions'] = definitions
+        obj['dependency_graph'] = self.read_value()
+        return obj
+
+    def read(self):
+        if self._kind == PROJECT:
+            obj = self.read_project()
+        elif self._kind == FULL_SAVE:
+            obj = {'project': self.read_project()}
+            obj.update(self.read_value())
+        else:
+            raise ValueError('Invalid kind of save {}'.format(self._kind))
+        if self._pos != len(self._data):
+            raise ValueError('Unexpected data after the end of the save')
+        return obj
+
+def dumps(obj):
+    '''
+    Encode a save, either a serialized project or a save written by the app
+    '''
+    encoder = Encoder()
+    if type(obj) == dict and 'project' in obj:
+        encoder.write_project(obj['project'])
+        encoder.write_value({key: value for key, value in obj.items() if key != 'project'})
+        return encoder.getvalue(FULL_SAVE)
+    encoder.write_project(obj)
+    return encoder.getvalue(PROJECT)
+
+def loads(data, int_keys=False):
+    '''
+    Decode a save written by dumps
+    '''
+    return Decoder(data, int_keys=int_keys).read()
+
+def is_binary(data):
+    '''
+    Check whether the given bytes start like a binary save
+    '''
+    return data[:len(MAGIC)] == MAGIC
+
+def convert(src, dst):
+    '''
+    Convert a save from JSON to binary or from binary to JSON, depending on the format of src
+    '''
+    with open(src, 'rb') as f:
+        data = f.read()
+    if is_binary(data):
+        with open(dst, 'w') as f:
+            json.dump(loads(data), f, cls=ProgramEncoder, indent=4)
+    else:
+        with open(dst, 'wb') as f:
+            f.write(dumps(json.loads(data)))
@@ -0,0 +1,161 @@
+# Translation tables between bit values and binary digits, used to pack and unpack known bits in bulk
+_TO_DIGITS = bytes.maketrans(b'\x00\x01', b'01')
+_FROM_DIGITS = bytes.maketrans(b'01', b'\x00\x01')
+
+class Bus:
+    '''
+    An immutable multi-bit wire value packed into ints, used instead of a list of bits when Gate.PACKED_BUSES is set.
+
+    value holds the known bits and unknown has a 1 for every bit that is None. The first bit of the bus is the most
+    significant one, so the list [1, 0, None] packs into Bus(3, 0b100, 0b001). Buses support len, indexing and
+    iteration and compare equal to lists of the same bits, so code written for lists of bits keeps working, but they
+    cannot be modified in place: use replace to change a bit.
+    '''
+    __slots__ = ('_dim', '_value', '_unknown')
+
+    def __init__(self, dim, value=0, unknown=0):
+        mask = (1 << dim) - 1
+        self._dim = dim
+        self._unknown = unknown & mask
+        self._value = value & mask & ~self._unknown
+
+    @staticmethod
+    def _normalized(dim, value, unknown):
+        '''
+        Create a bus from a value and unknown mask that already fit in dim bits and have no bits in common,
+        skipping the masking done by __init__
+        '''
+        bus = object.__new__(Bus)
+        bus._dim = dim
+        bus._value = value
+        bus._unknown = unknown
+        return bus
+
+    @staticmethod
+    def from_bits(bits):
+        '''
+        Pack a list of bits, where None stands for an unknown bit
+        '''
+        if len(bits) == 0:
+            return Bus(0)
+        try:
+            return Bus(len(bits), int(bytes(bits).translate(_TO_DIGITS), 2))
+        except (TypeError, ValueError):
+            # Some bits are unknown
+            pass
+        value = unknown = 0
+        for bit in bits:
+            value <<= 1
+            unknown <<= 1
+            if type(bit) != int:
+                unknown |= 1
+            else:
+                value |= bit
+        return Bus(len(bits), value, unknown)
+
+    def to_bits(self):
+        '''
+        Unpack the bus into a list of bits
+        '''
+        if self._unknown == 0 and self._dim != 0:
+            return list(format(self._value, '0{}b'.format(self._dim)).encode().translate(_FROM_DIGITS))
+        bits = []
+        for shift in range(self._dim - 1, -1, -1):
+            bits.append(None if (self._unknown >> shift) & 1 else (self._value >> shift) & 1)
+        return bits
+
+    def replace(self, idx, bit):
+        '''
+        Return a copy of the bus with the bit at idx set to 0, 1 or None
+        '''
+        if idx < 0:
+            idx += self._dim
+        if idx < 0 or idx >= self._dim:
+            raise IndexError('Bus index out of range')
+        mask = 1 << (self._dim - 1 - idx)
+        if bit is None:
+            return Bus(self._dim, self._value, self._unknown | mask)
+        return Bus(self._dim, (self._value & ~mask) | (mask if bit else 0), self._unknown & ~mask)
+
+    @property
+    def dim(self):
+        return self._dim
+
+    @property
+    def value(self):
+        return self._value
+
+    @property
+    def unknown(self):
+        return self._unknown
+
+    @property
+    def is_known(self):
+        return self._unknown == 0
+
+    def __len__(self):
+        return self._dim
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.to_bits()[idx]
+        if idx < 0:
+            idx += self._dim
+        if idx < 0 or idx >= self._dim:
+            raise IndexError('Bus index out of range')
+        shift = self._dim - 1 - idx
+        return None if (self._unknown >> shift) & 1 else (self._value >> shift) & 1
+
+    def __iter__(self):
+        return iter(self.to_bits())
+
+    def __eq__(self, other):
+        if isinstance(other, Bus):
+            return self._dim == other._dim and self._value == other._value and self._unknown == other._unknown
+        if isinstance(other, (list, tuple)):
+            return self.to_bits() == list(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self._dim, self._value, self._unknown))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __repr__(self):
+        return 'Bus({})'.format(''.join(['x' if bit is None else str(bit) for bit in self.to_bits()]))
+
+def pack(value):
+    '''
+    Convert a wire value holding a list of bits into a Bus, leaving other values unchanged
+    '''
+    if type(value) == list:
+        return Bus.from_bits(value)
+    return value
+
+def unpack(value):
+    '''
+    Convert a wire value holding a Bus into a list of bits, leaving other values unchanged
+    '''
+    if type(value) == Bus:
+        return value.to_bits()
+    return value
+
+def pack_values(values):
+    '''
+    Pack the buses in a list of wire values such as a gate's inputs or outputs, which may be None
+    '''
+    if values is None:
+        return None
+    return [pack(value) for value in values]
+
+def unpack_values(values):
+    '''
+    Unpack the buses in a list of wire values such as a gate's inputs or outputs, which may be None
+    '''
+    if values is None:
+        return None
+    return [unpack(value) for value in values]
@@ -1,5 +1,6 @@
 from collections import deque
 from gates.utils.orderedset import OrderedSet
+from array import array
 import math
 
 class DirectedGraph():
@@ -12,7 +13,15 @@ class DirectedGraph():
         '''
         self._from_dict = {}  # For each vertex, stores the set of vertices to which there are outgoing edges
         self._to_dict = {}    # For each vertex, stores the set of vertices from which there are incoming edges
-    
+
+        # Optionally maintained topological order, see track_order
+        self._tracked_order = None  # List of vertices, with None left in place of removed vertices
+        self._positions = None      # For each vertex, stores its index in the tracked order
+        self._num_holes = 0         # Number of removed vertices still left in the tracked order
+        self._order_cache = None    # The tracked order without holes
+
+        self._snapshot = None  # Compressed snapshot of the graph, built on demand and discarded on every change
+
     def add_vertex(self, v):
         '''
         Add vertex v to the graph if it is not already in it
@@ -21,7 +30,12 @@ class DirectedGraph():
         if v not in self._from_dict and v not in self._to_dict:
             self._from_dict[v] = OrderedSet()
             self._to_dict[v] = OrderedSet()
-    
+            self._snapshot = None
+            if self._tracked_order is not None:
+                self._positions[v] = len(self._tracked_order)
+                self._tracked_order.append(v)
+                self._order_cache = None
+
     def remove_vertex(self, v):
         '''
         Remove vertex v from the graph
@@ -36,6 +50,13 @@ class DirectedGraph():
             self._from_dict[w].discard(v)
         del self._from_dict[v]
         del self._to_dict[v]
+        self._snapshot = None
+        if self._tracked_order is not None:
+            self._tracked_order[self._positions.pop(v)] = None
+            self._num_holes += 1
+            self._order_cache = None
+            if self._num_holes > len(self._positions):
+                self.track_order(self.get_tracked_order())
     
     def check_edge(self, v, w):
         '''
@@ -62,6 +83,95 @@ class DirectedGraph():
         '''
         self._from_dict[v].add(w)
         self._to_dict[w].add(v)
+        self._snapshot = None
+        if self._tracked_order is not None and (v == w or self._positions[v] > self._positions[w]):
+            if v == w or not self._reorder_edge(v, w):
+                self.untrack_order()
+
+    def track_order(self, order):
+        '''
+        Start maintaining a topological order as edges and vertices are added and removed
+        The given order must contain every vertex and respect every edge. Tracking stops as soon as an added
+        edge creates a cycle, after which get_tracked_order returns None
+        '''
+        self._tracked_order = list(order)
+        self._positions = {v: i for i, v in enumerate(self._tracked_order)}
+        self._num_holes = 0
+        self._order_cache = None
+
+    def untrack_order(self):
+        '''
+        Stop maintaining a topological order
+        '''
+        self._tracked_order = None
+        self._positions = None
+        self._num_holes = 0
+        self._order_cache = None
+
+    def is_order_tracked(self):
+        '''
+        Return whether a topological order is being maintained
+        '''
+        return self._tracked_order is not None
+
+    def get_tracked_order(self):
+        '''
+        Return the maintained topological order, or None if no order is being tracked
+        '''
+        if self._tracked_order is None:
+            return None
+        if self._order_cache is None:
+            self._order_cache = [v for v in self._tracked_order if v is not None]
+        return self._order_cache
+
+    def _reorder_edge(self, v, w):
+        '''
+        Restore the tracked order after adding an edge from v to w where v comes after w
+        Implements the Pearce-Kelly dynamic topological sort algorithm:
+            https://doi.org/10.1145/1187436.1210590
+        Return False if the edge creates a cycle, True otherwise
+
+        Runtime: O(|A|log|A|) where A is the set of vertices between w and v in the order that are reachable
+            from w or that can reach v
+        '''
+        positions = self._positions
+        lower, upper = positions[w], positions[v]
+
+        # Find the vertices reachable from w that come before v
+        forward = [w]
+        visited = {w}
+        stack = [w]
+        while len(stack) != 0:
+            x = stack.pop()
+            for y in self._from_dict[x]:
+                if y == v:
+                    return False
+                if y not in visited and positions[y] < upper:
+                    visited.add(y)
+                    forward.append(y)
+                    stack.append(y)
+
+        # Find the vertices that can reach v and come after w
+        backward = [v]
+        visited = {v}
+        stack = [v]
+        while len(stack) != 0:
+            x = stack.pop()
+            for y in self._to_dict[x]:
+                if y not in visited and positions[y] > lower:
+                    visited.add(y)
+                    backward.append(y)
+                    stack.append(y)
+
+        # Place the backward set before the forward set, reusing the positions they already occupied
+        forward.sort(key=positions.__getitem__)
+        backward.sort(key=positions.__getitem__)
+        vertices = backward + forward
+        for x, position in zip(vertices, sorted(positions[x] for x in vertices)):
+            positions[x] = position
+            self._tracked_order[position] = x
+        self._order_cache = None
+        return True
 
     def remove_edge(self, v, w):
         '''
@@ -70,6 +180,7 @@ class DirectedGraph():
         '''
         self._from_dict[v].discard(w)
         self._to_dict[w].discard(v)
+        self._snapshot = None
     
     def get_shortest_paths(self, source):
         '''
@@ -97,75 +208,76 @@ class DirectedGraph():
         '''
         Implements Tarjan's strongly connected components
         algorithm: https://en.wikipedia.org/wiki/Tarjan%27s_strongly_connected_components_algorithm
+        The depth first search uses an explicit stack, so long paths do not run into the recursion limit
         Returns components in topologically sorted order
 
         Runtime: O(|V| + |E|)
         '''
-        unvisited = OrderedSet([v for v in self._from_dict])
-        stack = deque()
-        vertex_dict = {}
-        index = 0
+        # Index the vertices so bookkeeping can be kept in flat lists
+        vertices = list(self._from_dict)
+        ids = {v: i for i, v in enumerate(vertices)}
+        successors = [[ids[w] for w in self._from_dict[v]] for v in vertices]
+
+        num_vertices = len(vertices)
+        indices = [-1] * num_vertices
+        lowlinks = [0] * num_vertices
+        on_stack = bytearray(num_vertices)
+        stack = []
         sc_components = []
-        dag_edges = []
+        index = 0
 
-        # Helper function to perform depth first search
-        def helper(v):
-            nonlocal index
-            stack.append(v)
-            vertex_dict[v] = (index, index, True, None)  # Hold index, lowlink, onstack status, and component index
+        # Start a depth first search from every unvisited vertex, latest vertices first
+        for root in range(num_vertices - 1, -1, -1):
+            if indices[root] != -1:
+                continue
+            indices[root] = lowlinks[root] = index
             index += 1
+            stack.append(root)
+            on_stack[root] = 1
 
-            # Visit every vertex that v has an edge going to
-            for w in self._from_dict[v]:
-                was_unvisited = False
-                if w in unvisited:
-                    unvisited.discard(w)
-                    helper(w)
-                    was_unvisited = True
-
-                # Update lowlink value depending on whether w was already visited and on the stack
-                v_index, v_lowlink, _, _ = vertex_dict[v]
-                w_index, w_lowlink, w_onstack, _ = vertex_dict[w]
-                if was_unvisited:
-                    vertex_dict[v] = (v_index, min(v_lowlink, w_lowlink), True, None)
-                elif w_onstack:
-                    vertex_dict[v] = (v_index, min(v_lowlink, w_index), True, None)
-                else:
-                    dag_edges.append((v, w))
-
-            # Pop vertices into a component
-            v_index, v_lowlink, _, _ = vertex_dict[v]
-            if v_index == v_lowlink:
-                comp_index = len(sc_components)
-                component = OrderedSet()
-
-                # Pop from the stack until the popped vertex is the current vertex
-                w = stack.pop()
-                w_index, w_lowlink, _, _ = vertex_dict[w]
-                vertex_dict[w] = (w_index, w_lowlink, False, comp_index)
-                component.add(w)
-                while w != v:
-                    w = stack.pop()
-                    w_index, w_lowlink, _, _ = vertex_dict[w]
-                    vertex_dict[w] = (w_index, w_lowlink, False, comp_index)
-                    component.add(w)
-                sc_components.insert(0, component)
-
-        # Ensure that every vertex is put into a component
-        while len(unvisited) != 0:
-            v = unvisited.pop()
-            helper(v)
-        
-        # Turn the graph into a DAG
-        # dag = DirectedGraph()
-        # for i in range(len(sc_components)):
-        #     dag.add_vertex(i)
-        # for v, w in dag_edges:
-        #     _, _, _, v_comp = vertex_dict[v]
-        #     _, _, _, w_comp = vertex_dict[w]
-        #     dag.add_edge(v_comp, w_comp)
-
-        # Return components
+            # Each entry holds a vertex being visited and the position of the next edge to follow
+            work = [(root, 0)]
+            while len(work) != 0:
+                v, i = work.pop()
+                edges = successors[v]
+
+                # Returning from a successor, so update the lowlink value with that of the successor
+                if i != 0:
+                    w = edges[i - 1]
+                    if lowlinks[w] < lowlinks[v]:
+                        lowlinks[v] = lowlinks[w]
+
+                # Follow edges until reaching an unvisited vertex
+                descended = False
+                while i < len(edges):
+                    w = edges[i]
+                    i += 1
+                    if indices[w] == -1:
+                        work.append((v, i))
+                        work.append((w, 0))
+                        indices[w] = lowlinks[w] = index
+                        index += 1
+                        stack.append(w)
+                        on_stack[w] = 1
+                        descended = True
+                        break
+                    elif on_stack[w] and indices[w] < lowlinks[v]:
+                        lowlinks[v] = indices[w]
+                if descended:
+                    continue
+
+                # Pop vertices into a component until the popped vertex is the current vertex
+                if lowlinks[v] == indices[v]:
+                    component = OrderedSet()
+                    w = None
+                    while w != v:
+                        w = stack.pop()
+                        on_stack[w] = 0
+                        component.add(vertices[w])
+                    sc_components.append(component)
+
+        # Components are completed in reverse topological order
+        sc_components.reverse()
         return sc_components
 
     def get_order(self, source, flattened=True):
@@ -258,6 +370,14 @@ class DirectedGraph():
 
         return rank
 
+    def get_snapshot(self):
+        '''
+        Return a frozen compressed snapshot of the graph, which is only rebuilt after the graph changes
+        '''
+        if self._snapshot is None:
+            self._snapshot = GraphSnapshot(self)
+        return self._snapshot
+
     def get_direct_successors(self, v):
         '''
         Get the direct successors of v
@@ -339,6 +459,107 @@ class DirectedGraph():
         s += '}'
         return s
 
+class NeighbourView():
+    '''
+    Read-only sequence of the neighbours of a vertex in a GraphSnapshot, backed by the snapshot's arrays
+    '''
+    def __init__(self, vertices, ids):
+        self._vertices = vertices  # List of the snapshot's vertices
+        self._ids = ids            # Memoryview over the ids of the neighbours
+
+    def __iter__(self):
+        return map(self._vertices.__getitem__, self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, idx):
+        return self._vertices[self._ids[idx]]
+
+    def __contains__(self, v):
+        return any(w == v for w in self)
+
+    def __repr__(self):
+        return 'NeighbourView({})'.format(list(self))
+
+class GraphSnapshot():
+    '''
+    Frozen compressed sparse row representation of a DirectedGraph.
+
+    Vertices are numbered in the order they were added to the graph. The successors of vertex number i are numbered
+    successor_ids[successor_offsets[i]:successor_offsets[i + 1]], and its predecessors likewise. Neighbours keep the
+    order of the graph's adjacency sets.
+    '''
+    def __init__(self, graph):
+        self._vertices = list(graph._from_dict)
+        self._ids = {v: i for i, v in enumerate(self._vertices)}
+        self._successor_offsets, self._successor_ids = self._compress(graph._from_dict)
+        self._predecessor_offsets, self._predecessor_ids = self._compress(graph._to_dict)
+
+    def _compress(self, adjacency):
+        '''
+        Pack adjacency sets into an array of offsets and a memoryview over an array of neighbour ids
+        '''
+        offsets = array('l', [0])
+        neighbours = array('l')
+        for v in self._vertices:
+            neighbours.extend([self._ids[w] for w in adjacency[v]])
+            offsets.append(len(neighbours))
+        return offsets, memoryview(neighbours)
+
+    def get_id(self, v):
+        '''
+        Get the number of vertex v
+        '''
+        return self._ids[v]
+
+    def get_successor_ids(self, i):
+        '''
+        Get a memoryview over the numbers of the direct successors of vertex number i
+        '''
+        return self._successor_ids[self._successor_offsets[i]:self._successor_offsets[i + 1]]
+
+    def get_predecessor_ids(self, i):
+        '''
+        Get a memoryview over the numbers of the direct predecessors of vertex number i
+        '''
+        return self._predecessor_ids[self._predecessor_offsets[i]:self._predecessor_offsets[i + 1]]
+
+    def get_direct_successors(self, v):
+        '''
+        Get a view of the direct successors of v
+        '''
+        return NeighbourView(self._vertices, self.get_successor_ids(self._ids[v]))
+
+    def get_direct_predecessors(self, v):
+        '''
+        Get a view of the direct predecessors of v
+        '''
+        return NeighbourView(self._vertices, self.get_predecessor_ids(self._ids[v]))
+
+    @property
+    def vertices(self):
+        return self._vertices
+
+    @property
+    def successor_offsets(self):
+        return self._successor_offsets
+
+    @property
+    def successor_ids(self):
+        return self._successor_ids
+
+    @property
+    def predecessor_offsets(self):
+        return self._predecessor_offsets
+
+    @property
+    def predecessor_ids(self):
+        return self._predecessor_ids
+
+    def __len__(self):
+        return len(self._vertices)
+
 if __name__ == '__main__':
     g = DirectedGraph()
     g.add_vertex('A')
@@ -6,6 +6,11 @@ Based on a recipe originally posted to ActiveState Recipes by Raymond Hettiger,
 and released under the MIT license.
 
 https://github.com/rspeer/ordered-set
+
+Modified to store its entries as the keys of an insertion ordered dict, so that
+adding, removing and looking up entries take constant time. The list of entries
+and their indices, which index based access needs, are only built on demand and
+are discarded whenever an entry is removed.
 """
 import itertools as it
 from typing import (
@@ -15,6 +20,7 @@ from typing import (
     Iterator,
     List,
     MutableSet,
+    Optional,
     AbstractSet,
     Sequence,
     Set,
@@ -59,19 +65,54 @@ class OrderedSet(MutableSet[T], Sequence[T]):
     An OrderedSet is a custom MutableSet that remembers its order, so that
     every entry has an index that can be looked up.
 
+    Iterating walks the keys of the underlying dict directly, so, as with a
+    dict or a set, adding or removing entries while iterating over an
+    OrderedSet raises a RuntimeError. Iterate over a copy, such as
+    list(oset), to modify the set along the way. Versions that stored the
+    entries in a list allowed this, iterating over a list that may or may not
+    have reflected the changes.
+
     Example:
         >>> OrderedSet([1, 1, 2, 3, 2])
         OrderedSet([1, 2, 3])
     """
 
+    __slots__ = ("_keys", "_items", "_map")
+
     def __init__(self, initial: OrderedSetInitializer[T] = None):
-        self.items: List[T] = []
-        self.map: Dict[T, int] = {}
-        if initial is not None:
-            # In terms of duck-typing, the default __ior__ is compatible with
-            # the types we use, but it doesn't expect all the types we
-            # support as values for `initial`.
-            self |= initial  # type: ignore
+        # The entries, in order, as the keys of a dict
+        self._keys: Dict[T, None] = {} if initial is None else dict.fromkeys(initial)
+
+        # The list of entries and the index of every entry, built on demand
+        # for index based access and discarded when an entry is removed
+        self._items: Optional[List[T]] = None
+        self._map: Optional[Dict[T, int]] = None
+
+    @property
+    def items(self) -> List[T]:
+        """
+        The list of entries, which must not be modified
+        """
+        if self._items is None:
+            self._items = list(self._keys)
+        return self._items
+
+    @property
+    def map(self) -> Dict[T, int]:
+        """
+        The index of every entry, which must not be modified
+        """
+        if self._map is None:
+            self._map = {item: idx for (idx, item) in enumerate(self.items)}
+        return self._map
+
+    def _invalidate(self) -> None:
+        """
+        Discard the list of entries and their indices after entries were
+        removed
+        """
+        self._items = None
+        self._map = None
 
     def __len__(self) -> int:
         """
@@ -83,7 +124,7 @@ class OrderedSet(MutableSet[T], Sequence[T]):
             >>> len(OrderedSet([1, 2]))
             2
         """
-        return len(self.items)
+        return len(self._keys)
 
     @overload
     def __getitem__(self, index: slice) -> "OrderedSet[T]":
@@ -141,7 +182,7 @@ class OrderedSet(MutableSet[T], Sequence[T]):
             >>> this is other
             False
         """
-        return self.__class__(self)
+        return self.__class__(self._keys)
 
     # Define the gritty details of how an OrderedSet is serialized as a pickle.
     # We leave off type annotations, because the only code that should interact
@@ -174,7 +215,7 @@ class OrderedSet(MutableSet[T], Sequence[T]):
             >>> 5 in OrderedSet([1, 3, 2])
             False
         """
-        return key in self.map
+        return key in self._keys
 
     # Technically type-incompatible with MutableSet, because we return an
     # int instead of nothing. This is also one of the things that makes
@@ -193,9 +234,16 @@ class OrderedSet(MutableSet[T], Sequence[T]):
             >>> print(oset)
             OrderedSet([3])
         """
-        if key not in self.map:
-            self.map[key] = len(self.items)
-            self.items.append(key)
+        keys = self._keys
+        if key not in keys:
+            keys[key] = None
+            # Keep the list and the indices if they were built, since the
+            # new entry goes at the end
+            if self._items is not None:
+                self._items.append(key)
+            if self._map is not None:
+                self._map[key] = len(keys) - 1
+            return len(keys) - 1
         return self.map[key]
 
     append = add
@@ -262,16 +310,20 @@ class OrderedSet(MutableSet[T], Sequence[T]):
             >>> oset.pop()
             3
         """
-        if not self.items:
+        if not self._keys:
             raise KeyError("Set is empty")
 
+        if index == -1:
+            # The last entry can be removed without moving any other
+            elem, _ = self._keys.popitem()
+            if self._items is not None:
+                self._items.pop()
+            if self._map is not None:
+                del self._map[elem]
+            return elem
+
         elem = self.items[index]
-        del self.items[index]
-        del self.map[elem]
-        if elem != -1 and elem != len(self) - 1:
-            for k, v in self.map.items():
-                if v >= index and v > 0:
-                    self.map[k] = v - 1
+        self.discard(elem)
         return elem
 
     def discard(self, key: T) -> None:
@@ -290,20 +342,16 @@ class OrderedSet(MutableSet[T], Sequence[T]):
             >>> print(oset)
             OrderedSet([1, 3])
         """
-        if key in self:
-            i = self.map[key]
-            del self.items[i]
-            del self.map[key]
-            for k, v in self.map.items():
-                if v >= i:
-                    self.map[k] = v - 1
+        if key in self._keys:
+            del self._keys[key]
+            self._invalidate()
 
     def clear(self) -> None:
         """
         Remove all items from this OrderedSet.
         """
-        del self.items[:]
-        self.map.clear()
+        self._keys.clear()
+        self._invalidate()
 
     def __iter__(self) -> Iterator[T]:
         """
@@ -311,7 +359,7 @@ class OrderedSet(MutableSet[T], Sequence[T]):
             >>> list(iter(OrderedSet([1, 2, 3])))
             [1, 2, 3]
         """
-        return iter(self.items)
+        return iter(self._keys)
 
     def __reversed__(self) -> Iterator[T]:
         """
@@ -319,7 +367,7 @@ class OrderedSet(MutableSet[T], Sequence[T]):
             >>> list(reversed(OrderedSet([1, 2, 3])))
             [3, 2, 1]
         """
-        return reversed(self.items)
+        return reversed(self._keys)
 
     def __repr__(self) -> str:
         if not self:
@@ -479,11 +527,10 @@ class OrderedSet(MutableSet[T], Sequence[T]):
 
     def _update_items(self, items: list) -> None:
         """
-        Replace the 'items' list of this OrderedSet with a new one, updating
-        self.map accordingly.
+        Replace the entries of this OrderedSet with the given list.
         """
-        self.items = items
-        self.map = {item: idx for (idx, item) in enumerate(items)}
+        self._keys = dict.fromkeys(items)
+        self._invalidate()
 
     def difference_update(self, *sets: SetLike[T]) -> None:
         """
@@ -504,7 +551,7 @@ class OrderedSet(MutableSet[T], Sequence[T]):
         for other in sets:
             items_as_set = set(other)  # type: Set[T]
             items_to_remove |= items_as_set
-        self._update_items([item for item in self.items if item not in items_to_remove])
+        self._update_items([item for item in self._keys if item not in items_to_remove])
 
     def intersection_update(self, other: SetLike[T]) -> None:
         """
@@ -519,7 +566,7 @@ class OrderedSet(MutableSet[T], Sequence[T]):
             OrderedSet([1, 3, 7])
         """
         other = set(other)
-        self._update_items([item for item in self.items if item in other])
+        self._update_items([item for item in self._keys if item in other])
 
     def symmetric_difference_update(self, other: SetLike[T]) -> None:
         """
@@ -536,5 +583,5 @@ class OrderedSet(MutableSet[T], Sequence[T]):
         items_to_add = [item for item in other if item not in self]
         items_to_remove = set(other)
         self._update_items(
-            [item for item in self.items if item not in items_to_remove] + items_to_add
+            [item for item in self._keys if item not in items_to_remove] + items_to_add
         )
\ No newline at end of file
@@ -1,10 +1,13 @@
 import json
 from gates.utils.orderedset import OrderedSet
+from gates.utils.bus import Bus
 
 class ProgramEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, OrderedSet):
             return list(obj)
+        if isinstance(obj, Bus):
+            return obj.to_bits()
         return json.JSONEncoder.default(self, obj)
 
 def json_program_obj_hook(dct):
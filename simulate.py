@@ -0,0 +1,348 @@
+'''
+Headless simulator for saved projects
+
+Loads a save (either a full save written by the app or a bare project), drives a definition's inputs from a file or
+stdin, runs it as fast as possible and streams its outputs. Nothing here imports tkinter.
+
+Examples:
+    python simulate.py saves/counters.json counter8bit --ticks 1000000
+    echo "00000000 0 1" | python simulate.py saves/counters.json counter8bit --inputs - --ticks-per-input 300
+    python simulate.py saves/counters.json Ram16bytes --inputs inputs.jsonl --output outputs.jsonl --format bits
+
+Each line of the inputs holds one value per input of the definition, either as a JSON list in the same format as the
+definition's state (e.g. [[0, 0, 0, 0, 0, 0, 0, 0], 0, 1]) or as whitespace separated strings of bits (e.g.
+00000000 0 1), where x stands for an unknown bit. Each line is applied for --ticks-per-input ticks, after which the
+outputs are written. Without inputs, the saved inputs are used for --ticks ticks and the outputs are written every
+--every ticks, or only at the end.
+
+With --sweep, each line of the file holds a whole sequence of input vectors separated by semicolons, e.g.
+00000000 0 1; 00000000 1 1; 00000000 0 1. Every sequence is run from the saved state, the sequences are shared out
+between forked worker processes (see sweep) and the outputs after every input vector are written in sequence order:
+    python simulate.py saves/counters.json counter8bit --sweep patterns.txt --ticks-per-input 300 --processes 8
+'''
+from gates import Project
+from gates.gate_definition import GateDefinition
+from gates.engines import NetlistEngine, CodegenEngine, EventDrivenEngine
+from gates.profiler import Profiler
+from gates.gate import Gate
+from gates.utils import ProgramEncoder, Bus, binary
+from gates.utils.bus import pack_values
+from tempfile import NamedTemporaryFile
+import multiprocessing
+import argparse
+import shutil
+import json
+import math
+import sys
+
+ENGINES = {
+    'interpreter': None,
+    'netlist': NetlistEngine,
+    'codegen': CodegenEngine,
+    'event': EventDrivenEngine
+}
+
+class Simulator:
+    '''
+    Runs a definition headlessly, either with the interpreter or with one of the netlist engines
+    '''
+    def __init__(self, definition, engine='codegen'):
+        if engine not in ENGINES:
+            raise ValueError('Unknown engine {}, expected one of {}'.format(engine, ', '.join(ENGINES)))
+        self._definition = definition
+        self._engine = None if ENGINES[engine] is None else ENGINES[engine](definition)
+        self._tick = 0
+
+    def set_inputs(self, inputs):
+        '''
+        Set the definition's inputs, given in the same format as its state
+        '''
+        dims = self._definition._input_dims
+        if len(inputs) != len(dims):
+            raise ValueError('Expected {} inputs, got {}'.format(len(dims), len(inputs)))
+        for idx, (dim, value) in enumerate(zip(dims, inputs)):
+            if dim == 1:
+                valid = value is None or value in (0, 1)
+            else:
+                valid = isinstance(value, (list, Bus)) and len(value) == dim and all(bit is None or bit in (0, 1) for bit in value)
+            if not valid:
+                raise ValueError('Invalid value {} for input {} of dimension {}'.format(value, idx, dim))
+        if Gate.PACKED_BUSES:
+            inputs = pack_values(inputs)
+        self._definition._state['inputs'] = inputs
+        if self._engine is not None:
+            self._engine.set_inputs(inputs)
+
+    def tick(self, num_ticks=1):
+        '''
+        Advance the simulation by num_ticks ticks
+        '''
+        if self._engine is None:
+            for _ in range(num_ticks):
+                self._definition.tick()
+        else:
+            self._engine.tick(num_ticks, store=False)
+        self._tick += num_ticks
+
+    def run(self, num_ticks):
+        '''
+        Advance the simulation by num_ticks ticks, skipping ahead once the state repeats
+        '''
+        if self._engine is None:
+            self.tick(num_ticks)
+        else:
+            self._engine.run(num_ticks)
+            self._tick += num_ticks
+
+    def store_state(self):
+        '''
+        Copy the engine's values back into the definition's state
+        '''
+        if self._engine is not None:
+            self._engine.store_state()
+
+    def snapshot(self):
+        '''
+        Return a snapshot of the simulation's state, holding the definition's state (see GateDefinition.snapshot)
+        and the engine's values if there is an engine
+        The engine's values are stored into the definition's state first, since its ticks do not store them
+        '''
+        if self._engine is None:
+            return self._definition.snapshot(), None
+        self._engine.store_state()
+        return self._definition.snapshot(), self._engine.save_values()
+
+    def restore(self, snapshot, num_ticks=0):
+        '''
+        Put back the simulation's state from a snapshot taken after num_ticks ticks
+        '''
+        state, values = snapshot
+        self._definition.restore(state)
+        if self._engine is not None:
+            # Restoring replaces the definition's state dicts, so the engine binds to the new ones
+            self._engine.load_state()
+            self._engine.restore_values(values)
+        self._tick = num_ticks
+
+    @property
+    def outputs(self):
+        if self._engine is None:
+            return self._definition._state['outputs']
+        return self._engine.outputs
+
+    @property
+    def num_ticks(self):
+        return self._tick
+
+def parse_inputs(line):
+    '''
+    Parse a line of inputs, either a JSON list or whitespace separated strings of bits
+    '''
+    line = line.strip()
+    if line.startswith('['):
+        return json.loads(line)
+    inputs = []
+    for field in line.split():
+        bits = []
+        for c in field:
+            if c not in '01x':
+                raise ValueError('Invalid bit {} in {}'.format(c, field))
+            bits.append(None if c == 'x' else int(c))
+        inputs.append(bits[0] if len(bits) == 1 else bits)
+    return inputs
+
+def format_outputs(num_ticks, outputs, fmt):
+    '''
+    Format the outputs after num_ticks ticks as a line of JSON or of whitespace separated strings of bits
+    '''
+    if fmt == 'json':
+        return json.dumps({'tick': num_ticks, 'outputs': outputs}, cls=ProgramEncoder)
+    fields = [str(num_ticks)]
+    for value in outputs:
+        bits = value if isinstance(value, (list, Bus)) else [value]
+        fields.append(''.join(['x' if bit is None else str(bit) for bit in bits]))
+    return ' '.join(fields)
+
+# The simulation run by sweep, inherited by its forked worker processes. Stores (simulator, snapshot, ticks per input)
+_sweep = None
+
+def _run_sequences(sequences):
+    '''
+    Run each sequence of input vectors from the snapshot of the current sweep, returning the outputs after every
+    input vector of every sequence
+    '''
+    simulator, snapshot, ticks_per_input = _sweep
+    traces = []
+    for sequence in sequences:
+        simulator.restore(snapshot)
+        trace = []
+        for inputs in sequence:
+            simulator.set_inputs(inputs)
+            simulator.tick(ticks_per_input)
+            trace.append([list(value) if isinstance(value, list) else value for value in simulator.outputs])
+        traces.append(trace)
+    return traces
+
+def sweep(simulator, sequences, ticks_per_input=1, processes=None):
+    '''
+    Run every sequence of input vectors from the simulation's current state, which is left unchanged, and return
+    the outputs after every input vector of every sequence, in the order of the sequences.
+
+    The sequences are split into chunks shared out between processes worker processes (by default one per core).
+    Workers are forked, so they start with the loaded project and compiled engine of the simulator without parsing
+    or compiling anything themselves, and their results are sent back through the pool's pipes. Where forking is not
+    available, or with a single process, the sequences are run in this process instead.
+    '''
+    global _sweep
+    sequences = [list(sequence) for sequence in sequences]
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes < 1:
+        raise ValueError('Number of processes must be positive, got {}'.format(processes))
+    processes = min(processes, len(sequences))
+
+    snapshot = simulator.snapshot()
+    num_ticks = simulator.num_ticks
+    _sweep = (simulator, snapshot, ticks_per_input)
+    try:
+        if processes <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            return _run_sequences(sequences)
+
+        # A few chunks per worker balance the load when some sequences take longer than others
+        size = math.ceil(len(sequences) / (processes * 4))
+        chunks = [sequences[i:i + size] for i in range(0, len(sequences), size)]
+        with multiprocessing.get_context('fork').Pool(processes) as pool:
+            results = pool.map(_run_sequences, chunks)
+        return [trace for traces in results for trace in traces]
+    finally:
+        _sweep = None
+        simulator.restore(snapshot, num_ticks)
+
+def parse_sequence(line):
+    '''
+    Parse a line holding a sequence of input vectors separated by semicolons, see parse_inputs
+    '''
+    return [parse_inputs(field) for field in line.split(';') if field.strip() != '']
+
+def load_project(path):
+    '''
+    Load a save in either the JSON or the binary format, returning the whole save object, the project and the map
+    from the saved gate uids to the new gates. The project is loaded lazily, so only the definition that is run and
+    the ones it depends on are built, unless the project is saved again
+    '''
+    with open(path, 'rb') as f:
+        data = f.read()
+    gates = {}
+    if binary.is_binary(data):
+        obj = binary.loads(data, int_keys=True)
+        project = Project.deserialize(obj['project'] if 'project' in obj else obj, gates, validate=False, lazy=True)
+    else:
+        obj = json.loads(data)
+        project = Project.deserialize(obj['project'] if 'project' in obj else obj, gates, lazy=True)
+    return obj, project, gates
+
+def save_project(path, obj, project, gates):
+    '''
+    Write the project back in the shape it was loaded in, remapping workspace positions to the new gate uids
+    Paths ending with the binary extension are written in the binary format, others as JSON
+    '''
+    if 'project' in obj:
+        obj = dict(obj)
+        obj['project'] = project.serialize()
+        workspaces = {}
+        for name, positions in obj.get('workspaces', {}).items():
+            workspaces[name] = {gates[int(uid)].uid: position for uid, position in positions.items() if int(uid) in gates}
+        obj['workspaces'] = workspaces
+    else:
+        obj = project.serialize()
+    if path.endswith(binary.EXTENSION):
+        with NamedTemporaryFile('wb', dir='.', delete=False) as temp:
+            temp.write(binary.dumps(obj))
+    else:
+        with NamedTemporaryFile('w', dir='.', delete=False) as temp:
+            json.dump(obj, temp, cls=ProgramEncoder, indent=4)
+    shutil.move(temp.name, path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a definition from a saved project without the GUI')
+    parser.add_argument('path', help='Path to a save file, in the JSON or the binary format')
+    parser.add_argument('definition', help='Name of the definition to run')
+    parser.add_argument('--inputs', help='File to read inputs from, one line per input vector, or - for stdin')
+    parser.add_argument('--ticks', type=int, default=None, help='Number of ticks to run without inputs (default 1)')
+    parser.add_argument('--ticks-per-input', type=int, default=1, help='Number of ticks to run for each line of inputs')
+    parser.add_argument('--every', type=int, default=0, help='Write the outputs every this many ticks when running without inputs, 0 to only write them at the end')
+    parser.add_argument('--output', help='File to write outputs to (default stdout)')
+    parser.add_argument('--format', choices=['json', 'bits'], default='json', help='Format of the outputs')
+    parser.add_argument('--engine', choices=list(ENGINES), default='codegen', help='How to run the definition')
+    parser.add_argument('--save', help='Write the project with its final state to this path, in the binary format if it ends with {}'.format(binary.EXTENSION))
+    parser.add_argument('--packed-buses', action='store_true', help='Represent multi-bit buses as packed ints')
+    parser.add_argument('--profile', help='Profile the ticks and write the collapsed stacks to this path (interpreter engine only)')
+    parser.add_argument('--sweep', help='File to read sequences of inputs from, one sequence per line, each run from the saved state')
+    parser.add_argument('--processes', type=int, default=None, help='Number of worker processes for --sweep (default one per core)')
+    args = parser.parse_args(argv)
+    if args.profile is not None and args.engine != 'interpreter':
+        parser.error('--profile requires --engine interpreter')
+    if args.sweep is not None and (args.inputs is not None or args.profile is not None):
+        parser.error('--sweep cannot be combined with --inputs or --profile')
+    Gate.PACKED_BUSES = args.packed_buses
+
+    obj, project, gates = load_project(args.path)
+    definition = project._definitions.get(args.definition, None)
+    if not isinstance(definition, GateDefinition):
+        parser.error('{} is not a definition in {}'.format(args.definition, args.path))
+    simulator = Simulator(definition, args.engine)
+    profiler = Profiler() if args.profile is not None else None
+    if profiler is not None:
+        profiler.enable()
+
+    out = sys.stdout if args.output is None else open(args.output, 'w')
+    try:
+        if args.sweep is not None:
+            with open(args.sweep, 'r') as f:
+                sequences = [parse_sequence(line) for line in f if line.strip() != '']
+            traces = sweep(simulator, sequences, args.ticks_per_input, args.processes)
+            for idx, trace in enumerate(traces):
+                for step, outputs in enumerate(trace):
+                    line = format_outputs((step + 1) * args.ticks_per_input, outputs, args.format)
+                    if args.format == 'json':
+                        line = '{{"sequence": {}, {}'.format(idx, line[1:])
+                    else:
+                        line = '{} {}'.format(idx, line)
+                    out.write(line + '\n')
+        elif args.inputs is not None:
+            source = sys.stdin if args.inputs == '-' else open(args.inputs, 'r')
+            try:
+                for line in source:
+                    if line.strip() == '':
+                        continue
+                    simulator.set_inputs(parse_inputs(line))
+                    simulator.tick(args.ticks_per_input)
+                    out.write(format_outputs(simulator.num_ticks, simulator.outputs, args.format) + '\n')
+            finally:
+                if source is not sys.stdin:
+                    source.close()
+        else:
+            num_ticks = 1 if args.ticks is None else args.ticks
+            if args.every > 0:
+                while simulator.num_ticks < num_ticks:
+                    simulator.tick(min(args.every, num_ticks - simulator.num_ticks))
+                    out.write(format_outputs(simulator.num_ticks, simulator.outputs, args.format) + '\n')
+            else:
+                simulator.run(num_ticks)
+                out.write(format_outputs(simulator.num_ticks, simulator.outputs, args.format) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if profiler is not None:
+            profiler.disable()
+
+    if profiler is not None:
+        profiler.write_collapsed(args.profile)
+        sys.stderr.write(str(profiler) + '\n')
+
+    simulator.store_state()
+    if args.save is not None:
+        save_project(args.save, obj, project, gates)
+
+if __name__ == '__main__':
+    main()
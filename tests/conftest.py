@@ -0,0 +1,12 @@
+from gates.gate import Gate
+import pytest
+
+@pytest.fixture(params=[False, True], ids=['lists', 'packed'])
+def packed_buses(request):
+    '''
+    Run a test with buses as lists of bits and as packed buses
+    '''
+    previous = Gate.PACKED_BUSES
+    Gate.PACKED_BUSES = request.param
+    yield request.param
+    Gate.PACKED_BUSES = previous
@@ -0,0 +1,73 @@
+'''
+Helpers shared by the tests
+'''
+from gates.gate import Gate
+from gates.gate_definition import GateDefinition
+from gates.project import Project
+from gates.utils import ProgramEncoder
+from gates.utils.bus import pack_values
+import json
+import os
+
+SAVES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'saves')
+SAVES = ['counters.json', 'test0.json', 'test1.json']  # Saves whose definitions all tick in the interpreter
+
+def read_save(name):
+    '''
+    Read the project object of one of the bundled saves, which are either bare projects or saves written by the app
+    '''
+    with open(os.path.join(SAVES_DIR, name), 'r') as f:
+        obj = json.load(f)
+    return obj['project'] if 'project' in obj else obj
+
+def load_save(name, **kwargs):
+    return Project.deserialize(read_save(name), {}, **kwargs)
+
+def get_definitions(project):
+    '''
+    Return the project's custom definitions sorted by name
+    '''
+    return [project[name] for name in sorted(project.get_gate_names()) if isinstance(project[name], GateDefinition)]
+
+def random_inputs(definition, rng):
+    '''
+    Return random inputs for the definition in the current bus representation
+    '''
+    inputs = [rng.randint(0, 1) if dim == 1 else [rng.randint(0, 1) for _ in range(dim)] for dim in definition._input_dims]
+    return pack_values(inputs) if Gate.PACKED_BUSES else inputs
+
+def to_json(obj):
+    '''
+    Normalize an object the way it would be saved, with buses and ordered sets as lists
+    '''
+    return json.loads(json.dumps(obj, cls=ProgramEncoder))
+
+def remap_uids(obj, gates):
+    '''
+    Replace the uids in a serialized project with the saved uids of the gates they were loaded from
+    '''
+    saved_uids = {gate._uid: uid for uid, gate in gates.items()}
+    def remap_state(state):
+        if type(state) != dict:
+            return state
+        return {
+            saved_uids[key] if type(key) == int else key: [remap_state(value[0]), value[1]] if type(key) == int else value
+            for key, value in state.items()
+        }
+
+    definitions = {}
+    for name, definition in obj['definitions'].items():
+        definition = dict(definition)
+        definition['source'] = saved_uids[definition['source']]
+        definition['sink'] = saved_uids[definition['sink']]
+        definition['gates'] = {saved_uids[uid]: gate for uid, gate in definition['gates'].items()}
+        definition['gate_types'] = {
+            gate_type: sorted(saved_uids[uid] for uid in uids) for gate_type, uids in definition['gate_types'].items()
+        }
+        definition['connections'] = {
+            saved_uids[from_uid]: {saved_uids[to_uid]: pairs for to_uid, pairs in value.items()}
+            for from_uid, value in definition['connections'].items()
+        }
+        definition['state'] = remap_state(definition['state'])
+        definitions[name] = definition
+    return dict(obj, definitions=definitions)
@@ -0,0 +1,159 @@
+'''
+Tests of adding gates and connections in batches
+'''
+from gates.builtins import Nand
+from tests.helpers import load_save, get_definitions, to_json, remap_uids
+import pytest
+import random
+import copy
+
+GATE_TYPES = ['Nand', 'NOT', 'AND', 'OR', 'RsNorLatch']  # Gates with inputs and outputs of dimension 1 only
+
+def new_gate(project, name):
+    return Nand() if name == 'Nand' else project[name]()
+
+def random_design(seed, num_gates=10, num_connections=30):
+    '''
+    Return random gate types and connections between gates given by index, where -1 is the source and -2 the sink
+    '''
+    rng = random.Random(seed)
+    names = [rng.choice(GATE_TYPES) for _ in range(num_gates)]
+    connections = []
+    for _ in range(num_connections):
+        sender = rng.choice(range(-1, num_gates))
+        receiver = rng.choice([-2] + list(range(num_gates)))
+        connections.append((sender, rng.randint(0, 1), rng.randint(0, 1), receiver))
+    return names, connections
+
+def build(project, name, names, connections, batch):
+    '''
+    Build a definition of the design, with the batch APIs or one gate and connection at a time
+    Return its gates by index, which remap_uids uses in place of saved uids
+    '''
+    definition = project.define(name, [1, 1], [1, 1])
+    gates = [new_gate(project, gate_name) for gate_name in names]
+    if batch:
+        definition.add_gates(gates)
+    else:
+        for gate in gates:
+            definition.add_gate(gate)
+
+    by_index = dict(enumerate(gates))
+    by_index[-1], by_index[-2] = definition.source, definition.sink
+    pairs = []
+    for sender, output_idx, input_idx, receiver in connections:
+        from_gate, to_gate = by_index[sender], by_index[receiver]
+        pairs.append(((from_gate, min(output_idx, len(from_gate._output_dims) - 1)),
+            (min(input_idx, len(to_gate._input_dims) - 1), to_gate)))
+    if batch:
+        definition.add_connections(pairs)
+    else:
+        for from_pair, to_pair in pairs:
+            definition.add_connection(from_pair, to_pair)
+    return by_index
+
+def serialized(definition, by_index):
+    '''
+    Return the serialized definition with the uids of its gates replaced by their indices
+    The gates of other definitions, whose uids appear in the states of instances, keep their uids
+    '''
+    gates = {}
+    for other in get_definitions(definition._project):
+        if other is not definition:
+            gates.update(other._gates)
+    gates.update({'#{}'.format(index): gate for index, gate in by_index.items()})
+    obj = remap_uids({'definitions': {'': definition.serialize()}}, gates)['definitions']['']
+    del obj['name']
+    return to_json(obj)
+
+def indices(uids, by_index):
+    return {index for index, gate in by_index.items() if gate._uid in uids}
+
+@pytest.mark.parametrize('seed', range(10))
+def test_batch_matches_one_at_a_time(seed, packed_buses):
+    project = load_save('counters.json')
+    names, connections = random_design(seed)
+    batched_gates = build(project, 'Batch', names, connections, True)
+    single_gates = build(project, 'Single', names, connections, False)
+    batched, single = project['Batch'], project['Single']
+    assert serialized(batched, batched_gates) == serialized(single, single_gates)
+    assert project._dependency_graph.get_direct_successors('Batch') == \
+        project._dependency_graph.get_direct_successors('Single')
+
+    # Both root and cut the same gates, and so tick alike
+    batched._update_order()
+    single._update_order()
+    assert indices(batched._rooted_gates, batched_gates) == indices(single._rooted_gates, single_gates)
+    assert indices(batched._cut_gates, batched_gates) == indices(single._cut_gates, single_gates)
+
+    rng = random.Random(seed)
+    for _ in range(8):
+        inputs = [rng.randint(0, 1), rng.randint(0, 1)]
+        batched._state['inputs'] = list(inputs)
+        single._state['inputs'] = list(inputs)
+        batched.tick()
+        single.tick()
+        assert batched._state['outputs'] == single._state['outputs']
+    assert serialized(batched, batched_gates) == serialized(single, single_gates)
+
+def snapshot(definition, by_index):
+    '''
+    Return everything a failed batch must leave unchanged
+    '''
+    project = definition._project
+    return (
+        serialized(definition, by_index),
+        to_json(definition._graph._from_dict), to_json(definition._graph._to_dict),
+        list(definition._order), set(definition._rooted_gates), set(definition._cut_gates), definition._reorder,
+        definition._graph.is_order_tracked(), copy.deepcopy(definition._state), definition._version,
+        to_json(project._dependency_graph.serialize())
+    )
+
+@pytest.mark.parametrize('seed', range(5))
+def test_invalid_connection_leaves_definition_unchanged(seed):
+    project = load_save('counters.json')
+    names, connections = random_design(seed)
+    by_index = build(project, 'Batch', names, connections[:15], True)
+    definition = project['Batch']
+    nand, other = Nand(), Nand()
+    definition.add_gates([nand, other])
+    by_index[len(names)], by_index[len(names) + 1] = nand, other
+    definition._update_order()
+    before = snapshot(definition, by_index)
+
+    valid = [((nand, 0), (0, other)), ((definition.source, 1), (1, nand)), ((other, 0), (1, definition.sink))]
+    foreign = project['NOT']._source
+    invalid = [
+        ((nand, 1), (0, other)),               # No such output
+        ((nand, 0), (2, definition.sink)),     # No such input
+        ((foreign, 0), (0, nand)),             # Gate from another definition
+        ((nand, 0), (0, project['AND']())),    # Gate not added yet
+    ]
+    for connection in invalid:
+        for position in (0, len(valid)):
+            batch = valid[:position] + [connection] + valid[position:]
+            with pytest.raises(ValueError):
+                definition.add_connections(batch)
+            assert snapshot(definition, by_index) == before
+
+    # The same batch without the invalid connection goes through
+    definition.add_connections(valid)
+    assert snapshot(definition, by_index) != before
+
+def test_invalid_gate_leaves_definition_unchanged():
+    project = load_save('counters.json')
+    names, connections = random_design(0)
+    by_index = build(project, 'Batch', names, connections, True)
+    definition = project['Batch']
+    user = project.define('User', [1], [1])
+    user.add_gate(project['Batch']())
+    definition._update_order()
+    before = snapshot(definition, by_index)
+    gates = dict(definition._gates)
+
+    for gate in (by_index[0], project['User']()):  # A gate already in the definition, and a recursive one
+        with pytest.raises(ValueError):
+            definition.add_gates([Nand(), project['NOR'](), gate])
+        assert snapshot(definition, by_index) == before
+        assert definition._gates == gates
+        assert 'NOR' not in definition._gate_types
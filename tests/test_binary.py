@@ -0,0 +1,82 @@
+'''
+Tests of the binary save format and of loading saves without validation
+'''
+from gates.project import Project
+from gates.utils import binary
+from tests.helpers import SAVES, SAVES_DIR, read_save, load_save, get_definitions, random_inputs, to_json, \
+    remap_uids
+import pytest
+import random
+import copy
+import os
+
+ALL_SAVES = sorted(name for name in os.listdir(SAVES_DIR) if name.endswith('.json'))
+
+@pytest.mark.parametrize('save', ALL_SAVES)
+def test_round_trip_is_byte_identical(save, tmp_path):
+    src = os.path.join(SAVES_DIR, save)
+    binary.convert(src, tmp_path / 'save.lgb')
+    binary.convert(tmp_path / 'save.lgb', tmp_path / 'save.json')
+    with open(src, 'rb') as f:
+        expected = f.read()
+    with open(tmp_path / 'save.json', 'rb') as f:
+        assert f.read() == expected
+
+def run(project, num_ticks):
+    outputs = []
+    for definition in get_definitions(project):
+        rng = random.Random(definition._name)
+        for _ in range(num_ticks):
+            definition._state['inputs'] = random_inputs(definition, rng)
+            definition.tick()
+            outputs.append(to_json(definition._state['outputs']))
+    return outputs
+
+@pytest.mark.parametrize('save', SAVES)
+def test_unvalidated_load_matches_validated(save, packed_buses):
+    obj = read_save(save)
+    validated_gates, unvalidated_gates = {}, {}
+    validated = Project.deserialize(copy.deepcopy(obj), validated_gates)
+    unvalidated = Project.deserialize(copy.deepcopy(obj), unvalidated_gates, validate=False)
+    assert to_json(remap_uids(unvalidated.serialize(), unvalidated_gates)) == \
+        to_json(remap_uids(validated.serialize(), validated_gates))
+
+    assert run(unvalidated, 8) == run(validated, 8)
+    assert to_json(remap_uids(unvalidated.serialize(), unvalidated_gates)) == \
+        to_json(remap_uids(validated.serialize(), validated_gates))
+
+def test_definition_named_like_a_uid():
+    '''
+    Only uids are decoded as int keys, not names such as those in the dependency graph
+    '''
+    project = load_save('counters.json')
+    project.rename_definition('AND', '42')
+    data = binary.dumps(project.serialize())
+
+    obj = binary.loads(data, int_keys=True)
+    assert '42' in obj['dependency_graph']
+    assert all(type(key) == int for key in obj['definitions']['42']['connections'])
+
+    for lazy in (False, True):
+        loaded = Project.deserialize_binary(data, lazy=lazy)
+        assert loaded['42'].name == '42'
+        state = loaded['counter8bit']._state
+        assert all(type(key) == int for key in state if key not in ('inputs', 'outputs'))
+
+def test_bad_magic():
+    data = binary.dumps(read_save('test0.json'))
+    with pytest.raises(ValueError):
+        binary.loads(b'JSON' + data[len(binary.MAGIC):])
+
+def test_newer_version():
+    data = binary.dumps(read_save('test0.json'))
+    assert data[len(binary.MAGIC)] == binary.VERSION
+    data = binary.MAGIC + bytes([binary.VERSION + 1]) + data[len(binary.MAGIC) + 1:]
+    with pytest.raises(ValueError, match='version'):
+        binary.loads(data)
+
+def test_trailing_data():
+    data = binary.dumps(read_save('test0.json'))
+    binary.loads(data)
+    with pytest.raises(ValueError, match='after the end'):
+        binary.loads(data + b'\x00')
@@ -0,0 +1,42 @@
+'''
+Tests of the bitsliced engine against the interpreter
+'''
+from gates.engines import evaluate_vectors
+from gates.engines import netlist as netlist_module
+from tests.helpers import load_save, random_inputs, to_json
+import random
+import copy
+
+def test_evaluate_vectors_matches_interpreter():
+    project = load_save('counters.json')
+    definition = project['counter8bit']
+    rng = random.Random(0)
+    vectors = [random_inputs(definition, rng) for _ in range(10)]
+    initial = copy.deepcopy(definition._state)
+
+    expected = []
+    for inputs in vectors:
+        definition._state = copy.deepcopy(initial)
+        definition._state['inputs'] = copy.deepcopy(inputs)
+        for _ in range(3):
+            definition.tick()
+        expected.append(to_json(definition._state['outputs']))
+    definition._state = initial
+
+    assert to_json(evaluate_vectors(definition, vectors, num_ticks=3, lanes=4)) == expected
+
+def test_evaluate_vectors_reuses_netlist(monkeypatch):
+    project = load_save('counters.json')
+    definition = project['counter8bit']
+    vectors = [random_inputs(definition, random.Random(0))]
+    evaluate_vectors(definition, vectors)
+
+    compiled = []
+    init = netlist_module.Netlist.__init__
+    def counting_init(self, definition):
+        compiled.append(definition)
+        init(self, definition)
+    monkeypatch.setattr(netlist_module.Netlist, '__init__', counting_init)
+    evaluate_vectors(definition, vectors)
+    evaluate_vectors(definition, vectors)
+    assert compiled == []
@@ -0,0 +1,197 @@
+'''
+Tests of the builtin gates and of packed buses
+'''
+from gates.builtins import Nand, Reshaper, Constant, Source, Sink
+from gates.gate import Gate
+from gates.project import Project
+from gates.utils.bus import Bus, pack, unpack, pack_values, unpack_values
+import pytest
+import random
+import copy
+
+BITS = [0, 1, None]
+
+def random_bits(rng, dim):
+    return [rng.choice(BITS) for _ in range(dim)]
+
+def random_value(rng, dim):
+    '''
+    Return a random wire value in the current bus representation, sometimes with unknown bits
+    '''
+    if dim == 1:
+        return rng.choice(BITS)
+    return pack(random_bits(rng, dim)) if Gate.PACKED_BUSES else random_bits(rng, dim)
+
+def check_representation(values, dims):
+    '''
+    Check that wire values use the current bus representation
+    '''
+    for value, dim in zip(values, dims):
+        if dim == 1:
+            assert value is None or type(value) == int
+        elif Gate.PACKED_BUSES:
+            assert type(value) == Bus and value.dim == dim
+        else:
+            assert type(value) == list and len(value) == dim
+
+def test_nand(packed_buses):
+    nand = Nand()
+    for a in BITS:
+        for b in BITS:
+            expected = None if a is None or b is None else int(not (a and b))
+            assert nand([a, b]) == [expected]
+
+def random_dims(rng, total):
+    dims = []
+    while total != 0:
+        dim = min(total, rng.choice([1, 1, 2, 3, 4, 8]))
+        dims.append(dim)
+        total -= dim
+    return dims
+
+@pytest.mark.parametrize('seed', range(30))
+def test_reshaper(seed, packed_buses):
+    rng = random.Random(seed)
+    total = rng.randint(1, 20)
+    input_dims, output_dims = random_dims(rng, total), random_dims(rng, total)
+    if seed % 5 == 0:
+        output_dims = list(input_dims)  # Every output is an exact copy of an input
+    reshaper = Reshaper(input_dims, output_dims)
+
+    for _ in range(10):
+        inputs = [random_value(rng, dim) for dim in input_dims]
+        before = copy.deepcopy(inputs)
+        bits = []
+        for value in unpack_values(inputs):
+            bits.extend(value if type(value) == list else [value])
+        expected = []
+        for dim in output_dims:
+            expected.append(bits[0] if dim == 1 else bits[:dim])
+            bits = bits[dim:]
+
+        outputs = reshaper(inputs)
+        check_representation(outputs, output_dims)
+        assert unpack_values(outputs) == expected
+        assert inputs == before
+        if not Gate.PACKED_BUSES:
+            # Lists of bits can be modified in place, so outputs never share them with inputs
+            assert all(output is not input for output in outputs for input in inputs if type(output) == list)
+
+        # Unknown buses are read as all unknown bits
+        if any(dim > 1 for dim in input_dims):
+            inputs = [None if dim > 1 else value for value, dim in zip(inputs, input_dims)]
+            bits = []
+            for value, dim in zip(unpack_values(inputs), input_dims):
+                bits.extend([None] * dim if value is None else value if type(value) == list else [value])
+            outputs = unpack_values(reshaper(inputs))
+            assert [bit for output in outputs for bit in (output if type(output) == list else [output])] == bits
+
+    # Every bit of every output is routed from the bit of the input it is read from
+    assert [len(bits) for bits in reshaper.routing] == output_dims
+    assert [bit for bits in reshaper.routing for bit in bits] == \
+        [(input_idx, bit_idx) for input_idx, dim in enumerate(input_dims) for bit_idx in range(dim)]
+
+def test_reshaper_mismatched_dims():
+    with pytest.raises(ValueError):
+        Reshaper([4], [2, 1])
+
+def test_shared_shapes():
+    assert Nand()._shape is Nand()._shape
+    first, second = Reshaper([8], [1] * 8), Reshaper([8], [1] * 8)
+    assert first._shape is second._shape
+    assert first.routing is second.routing
+    assert Reshaper([8], [1] * 8, output_labels=['a'] * 8)._shape is not first._shape
+    assert Reshaper([8], [4, 4])._shape is not first._shape
+
+    # Serialized dims are copies, so editing them leaves the shared shape as it was
+    obj = first.serialize()
+    obj['input_dims'].append(1)
+    obj['output_labels'][0] = 'a'
+    assert second._input_dims == [8]
+    assert second._output_labels == [''] * 8
+    assert Reshaper.deserialize(second.serialize())._shape is second._shape
+
+    # Sources and sinks hold the dims of their definition, so they are never shared
+    dims = [1, 4]
+    source, sink = Source(dims), Sink(dims)
+    assert Source([1, 4])._shape is not source._shape
+    dims.append(2)
+    assert source.dims == [1, 4, 2] and sink.dims == [1, 4, 2]
+
+def test_compound_gates_follow_definition():
+    project = Project('Shape test')
+    definition = project.define('Wire', [1], [1])
+    definition.add_connection((definition.source, 0), (0, definition.sink))
+    gate = project['Wire']()
+    assert gate._shape is definition
+    definition.insert_input(1, 4, label='bus')
+    assert gate._input_dims == [1, 4]
+    assert gate._input_labels[1] == 'bus'
+    project.rename_definition('Wire', 'Buffer')
+    assert gate._name == 'Buffer'
+
+def test_constant(packed_buses):
+    constant = Constant(4, state=[[1, 0, None, 1]])
+    outputs = constant([])
+    check_representation(outputs, [4])
+    assert unpack_values(outputs) == [[1, 0, None, 1]]
+    assert constant.serialize() == {'dim': 4, 'state': [[1, 0, None, 1]]}
+    assert unpack_values(Constant.deserialize(constant.serialize())([])) == [[1, 0, None, 1]]
+    assert unpack_values(constant._duplicate()([])) == [[1, 0, None, 1]]
+
+    assert unpack_values(Constant(3)([])) == [[Gate.DEFAULT_VALUE] * 3]
+    assert Constant(1)([]) == [Gate.DEFAULT_VALUE]
+
+def test_source_and_sink(packed_buses):
+    dims = [1, 4, 1]
+    source, sink = Source(dims), Sink(dims)
+    state = source._init_state()
+    check_representation(state, dims)
+    assert unpack_values(state) == [0, [0] * 4, 0]
+
+    rng = random.Random(0)
+    values = [random_value(rng, dim) for dim in dims]
+    assert source([], values) is values
+    sink_state = sink._init_state()
+    check_representation(sink_state, dims)
+    assert sink(values, sink_state) == []
+    assert sink_state == values
+
+def test_bus_round_trip():
+    rng = random.Random(0)
+    for dim in list(range(10)) + [64, 100]:
+        for _ in range(20):
+            bits = random_bits(rng, dim) if rng.random() < 0.5 else [rng.randint(0, 1) for _ in range(dim)]
+            bus = Bus.from_bits(bits)
+            assert bus.dim == len(bus) == dim
+            assert bus.to_bits() == list(bus) == bits
+            assert bus == bits and bus == tuple(bits)
+            assert bus.is_known == (None not in bits)
+            assert [bus[idx] for idx in range(dim)] == bits
+            assert bus[1:3] == bits[1:3]
+            assert Bus(dim, bus.value, bus.unknown) == bus
+            assert hash(Bus.from_bits(list(bits))) == hash(bus)
+            assert copy.deepcopy(bus) is bus
+            if dim != 0:
+                assert bus[-1] == bits[-1]
+                idx, bit = rng.randrange(dim), rng.choice(BITS)
+                replaced = bus.replace(idx, bit)
+                assert replaced.to_bits() == bits[:idx] + [bit] + bits[idx + 1:]
+                assert bus.to_bits() == bits
+    with pytest.raises(IndexError):
+        Bus(3)[3]
+    with pytest.raises(IndexError):
+        Bus(3).replace(-4, 1)
+
+    # Unknown bits are never also set in the value
+    assert Bus(4, 0b1111, 0b0101).value == 0b1010
+    assert Bus(2, 0b111).value == 0b11
+
+def test_pack_values():
+    values = [1, None, [1, 0, None], [0, 1]]
+    packed = pack_values(values)
+    assert packed[:2] == [1, None]
+    assert type(packed[2]) == Bus and type(packed[3]) == Bus
+    assert unpack_values(packed) == values
+    assert pack(packed[2]) is packed[2] and unpack(values[2]) is values[2]
+    assert pack_values(None) is None and unpack_values(None) is None
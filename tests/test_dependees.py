@@ -0,0 +1,105 @@
+'''
+Tests of propagating interface changes of a definition to the definitions that depend on it
+'''
+from gates.builtins import Nand
+from gates.gate_definition import GateDefinition
+from gates.project import Project
+from tests.helpers import to_json, remap_uids
+import json
+import os
+
+EXPECTED = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'dependees.json')
+
+def chain(definition, gates):
+    '''
+    Add the gates to the definition, connected one after the other from its source to its sink
+    '''
+    for gate in gates:
+        definition.add_gate(gate)
+    senders = [definition.source] + gates
+    receivers = gates + [definition.sink]
+    for sender, receiver in zip(senders, receivers):
+        definition.add_connection((sender, 0), (0, receiver))
+
+def build_diamond():
+    '''
+    Build a project where Latch, a NAND latch with a state, is reached from Root through several paths: Root holds
+    Top and Left, Top holds Left, Right and Latch, and Left and Right both hold Latch
+    '''
+    project = Project('Dependees test')
+    latch = project.define('Latch', [1], [1])
+    first, second = Nand(), Nand()
+    latch.add_gate(first)
+    latch.add_gate(second)
+    latch.add_connection((latch.source, 0), (0, first))
+    latch.add_connection((second, 0), (1, first))
+    latch.add_connection((first, 0), (0, second))
+    latch.add_connection((first, 0), (1, second))
+    latch.add_connection((second, 0), (0, latch.sink))
+
+    chain(project.define('Left', [1], [1]), [project['Latch'](), project['Latch']()])
+    chain(project.define('Right', [1], [1]), [project['Latch']()])
+    chain(project.define('Top', [1], [1]), [project['Left'](), project['Right'](), project['Latch']()])
+    chain(project.define('Root', [1], [1]), [project['Top'](), project['Left']()])
+    for value in (1, 0, 1):
+        for name in ('Latch', 'Left', 'Right', 'Top', 'Root'):
+            project[name]._state['inputs'] = [value]
+            project[name].tick()
+
+    # Name the gates by their definition and position, as uids differ between runs
+    gates = {}
+    for name in ('Latch', 'Left', 'Right', 'Top', 'Root'):
+        for idx, gate in enumerate(project[name]._gates.values()):
+            gates['{}.{}'.format(name, idx)] = gate
+    return project, gates, second
+
+def edit_diamond():
+    '''
+    Change the interface and gates of Latch in the diamond, and return the serialized project after each edit
+    '''
+    project, gates, second = build_diamond()
+    latch = project['Latch']
+    edits = [
+        lambda: latch.insert_output(1, 1),
+        lambda: latch.insert_output(0, 4),
+        lambda: latch.remove_output(2),
+        lambda: latch.remove_gate(second),
+        lambda: latch.repair_instances(),
+    ]
+    results = [to_json(remap_uids(project.serialize(), gates))]
+    for edit in edits:
+        edit()
+        results.append(to_json(remap_uids(project.serialize(), gates)))
+    return results
+
+def test_edits_match_path_traversal():
+    '''
+    Visiting each dependee once gives the same projects as the former traversal, which followed every path through
+    the dependency graph and visited dependees once per path. Its results are kept in data/dependees.json
+    '''
+    with open(EXPECTED, 'r') as f:
+        expected = json.load(f)
+    assert edit_diamond() == expected
+
+def test_each_dependee_is_visited_once(monkeypatch):
+    visits = []
+    run_on_type_states = GateDefinition._run_on_type_states
+
+    def counted_run_on_type_states(definition, *args, **kwargs):
+        visits.append(definition._name)
+        return run_on_type_states(definition, *args, **kwargs)
+    monkeypatch.setattr(GateDefinition, '_run_on_type_states', counted_run_on_type_states)
+
+    project, _, second = build_diamond()
+    latch = project['Latch']
+    for edit in (lambda: latch.insert_output(1, 1), lambda: latch.remove_output(1),
+            lambda: latch.remove_gate(second), lambda: latch.repair_instances()):
+        visits.clear()
+        edit()
+        assert sorted(visits) == ['Left', 'Right', 'Root', 'Top']
+
+    # Every dependee is passed the uids of the instances of all dependees
+    calls = []
+    project._run_on_dependees(project['Left'], lambda dependee, nested: calls.append((dependee._name, set(nested))))
+    nested = set(project['Top']._instance_uids) | set(project['Root']._instance_uids)
+    assert sorted(calls, key=lambda call: call[0]) == [('Root', nested), ('Top', nested)]
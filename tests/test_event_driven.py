@@ -0,0 +1,54 @@
+'''
+Differential tests of the event-driven engine against the interpreter
+'''
+from gates.engines import EventDrivenEngine
+from tests.helpers import SAVES, load_save, get_definitions, random_inputs, to_json
+import pytest
+import random
+import copy
+
+NUM_TICKS = 12
+
+@pytest.mark.parametrize('save', SAVES)
+def test_event_driven_matches_interpreter(save, packed_buses):
+    project = load_save(save)
+    for definition in get_definitions(project):
+        rng = random.Random(definition._name)
+        sequence = [random_inputs(definition, rng) for _ in range(NUM_TICKS)]
+        initial = copy.deepcopy(definition._state)
+
+        expected = []
+        for inputs in sequence:
+            definition._state['inputs'] = copy.deepcopy(inputs)
+            definition.tick()
+            expected.append((to_json(definition._state['outputs']), to_json(definition.serialize_state(definition._state))))
+
+        # Every tick stores only what changed, which must leave the whole state as the interpreter does
+        definition._state = initial
+        engine = EventDrivenEngine(definition)
+        for i, inputs in enumerate(sequence):
+            engine.set_inputs(copy.deepcopy(inputs))
+            definition._state['inputs'] = copy.deepcopy(inputs)
+            engine.tick()
+            assert to_json(engine.outputs) == expected[i][0], definition._name
+            assert to_json(definition.serialize_state(definition._state)) == expected[i][1], definition._name
+
+@pytest.mark.parametrize('save', SAVES)
+def test_event_driven_runs_many_ticks(save):
+    '''
+    Ticking several times without storing, as with feedback designs left running, ends in the interpreter's state
+    '''
+    project = load_save(save)
+    for definition in get_definitions(project):
+        initial = copy.deepcopy(definition._state)
+        for _ in range(30):
+            definition.tick()
+        expected = to_json(definition.serialize_state(definition._state))
+
+        definition._state = initial
+        engine = EventDrivenEngine(definition)
+        engine.tick(10, store=False)
+        engine.tick(15)
+        engine.tick(5, store=False)
+        engine.store_state()
+        assert to_json(definition.serialize_state(definition._state)) == expected, definition._name
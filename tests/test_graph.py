@@ -0,0 +1,214 @@
+'''
+Tests of DirectedGraph's strongly connected components and compressed snapshots
+'''
+from gates.utils.graph import DirectedGraph
+from gates.utils.orderedset import OrderedSet
+import pytest
+import random
+import sys
+
+def reference_components(graph):
+    '''
+    Recursive Tarjan's algorithm, as DirectedGraph implemented it before its search was made iterative
+    '''
+    unvisited = OrderedSet([v for v in graph._from_dict])
+    stack = []
+    vertex_dict = {}  # Holds the index, lowlink and onstack status of every visited vertex
+    index = 0
+    sc_components = []
+
+    def helper(v):
+        nonlocal index
+        stack.append(v)
+        vertex_dict[v] = (index, index, True)
+        index += 1
+        for w in graph._from_dict[v]:
+            was_unvisited = False
+            if w in unvisited:
+                unvisited.discard(w)
+                helper(w)
+                was_unvisited = True
+            v_index, v_lowlink, _ = vertex_dict[v]
+            w_index, w_lowlink, w_onstack = vertex_dict[w]
+            if was_unvisited:
+                vertex_dict[v] = (v_index, min(v_lowlink, w_lowlink), True)
+            elif w_onstack:
+                vertex_dict[v] = (v_index, min(v_lowlink, w_index), True)
+
+        v_index, v_lowlink, _ = vertex_dict[v]
+        if v_index == v_lowlink:
+            component = OrderedSet()
+            w = None
+            while w != v:
+                w = stack.pop()
+                w_index, w_lowlink, _ = vertex_dict[w]
+                vertex_dict[w] = (w_index, w_lowlink, False)
+                component.add(w)
+            sc_components.insert(0, component)
+
+    while len(unvisited) != 0:
+        helper(unvisited.pop())
+    return sc_components
+
+def random_graph(rng, num_vertices, num_edges, self_loops=0):
+    graph = DirectedGraph()
+    vertices = list(range(num_vertices))
+    rng.shuffle(vertices)
+    for v in vertices:
+        graph.add_vertex(v)
+    for _ in range(num_edges):
+        graph.add_edge(rng.choice(vertices), rng.choice(vertices))
+    for v in rng.sample(vertices, self_loops):
+        graph.add_edge(v, v)
+
+    # Removed vertices leave the remaining ones in insertion order, but no longer numbered contiguously
+    for v in rng.sample(vertices, num_vertices // 10):
+        graph.remove_vertex(v)
+    return graph
+
+def check_components(graph):
+    components = graph.get_strongly_connected_components()
+    assert [list(component) for component in components] == \
+        [list(component) for component in reference_components(graph)]
+    return components
+
+@pytest.mark.parametrize('seed', range(40))
+def test_components_match_recursive(seed):
+    rng = random.Random(seed)
+    num_vertices = rng.randint(1, 60)
+    graph = random_graph(rng, num_vertices, rng.randint(0, 3 * num_vertices), rng.randint(0, num_vertices // 4))
+    components = check_components(graph)
+    assert sorted(v for component in components for v in component) == sorted(graph._from_dict)
+
+def test_self_loops():
+    graph = DirectedGraph()
+    for v in 'abcd':
+        graph.add_vertex(v)
+    graph.add_edge('a', 'a')
+    graph.add_edge('a', 'b')
+    graph.add_edge('b', 'c')
+    graph.add_edge('c', 'b')
+    graph.add_edge('c', 'c')
+    graph.add_edge('c', 'd')
+    components = check_components(graph)
+    assert [set(component) for component in components] == [{'a'}, {'b', 'c'}, {'d'}]
+
+    # A lone vertex with a loop is a component of its own, like one without
+    graph = DirectedGraph()
+    graph.add_vertex(0)
+    graph.add_edge(0, 0)
+    assert [list(component) for component in check_components(graph)] == [[0]]
+    assert DirectedGraph().get_strongly_connected_components() == []
+
+def deep_graph(rng, depth):
+    '''
+    Return a path of the given length with a few cycles along it and a back edge closing it, so that both the
+    search and the components are as deep as the path
+    '''
+    graph = DirectedGraph()
+    for v in range(depth):
+        graph.add_vertex(v)
+    for v in range(depth - 1):
+        graph.add_edge(v, v + 1)
+    for _ in range(depth // 100):
+        v = rng.randrange(depth)
+        graph.add_edge(v, rng.randrange(v + 1))
+    return graph
+
+@pytest.mark.parametrize('closed', [False, True], ids=['open', 'closed'])
+def test_deep_graphs(closed):
+    rng = random.Random(0)
+    depth = 3 * sys.getrecursionlimit()
+    graph = deep_graph(rng, depth)
+    if closed:
+        graph.add_edge(depth - 1, 0)
+
+    # The recursive search could not get through the path under the default limit
+    with pytest.raises(RecursionError):
+        reference_components(graph)
+
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(4 * depth)
+    try:
+        components = check_components(graph)
+    finally:
+        sys.setrecursionlimit(limit)
+    if closed:
+        assert len(components) == 1
+        assert len(components[0]) == depth
+    else:
+        assert len(components) > 1
+
+def check_snapshot(graph, snapshot):
+    '''
+    Check that the snapshot holds the same vertices and neighbours, in the same order, as the graph
+    '''
+    assert snapshot.vertices == list(graph._from_dict)
+    assert len(snapshot) == len(graph._from_dict)
+    for i, v in enumerate(snapshot.vertices):
+        assert snapshot.get_id(v) == i
+        for view, neighbours, ids, offsets, neighbour_ids in (
+            (snapshot.get_direct_successors(v), graph.get_direct_successors(v), snapshot.get_successor_ids(i),
+                snapshot.successor_offsets, snapshot.successor_ids),
+            (snapshot.get_direct_predecessors(v), graph.get_direct_predecessors(v), snapshot.get_predecessor_ids(i),
+                snapshot.predecessor_offsets, snapshot.predecessor_ids)
+        ):
+            assert list(view) == list(neighbours)
+            assert len(view) == len(neighbours)
+            assert [view[idx] for idx in range(len(view))] == list(neighbours)
+            assert [snapshot.vertices[j] for j in ids] == list(neighbours)
+            assert list(neighbour_ids[offsets[i]:offsets[i + 1]]) == list(ids)
+            for w in graph._from_dict:
+                assert (w in view) == (w in neighbours)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_snapshot_matches_graph(seed):
+    rng = random.Random(seed)
+    graph = random_graph(rng, 30, 60, 3)
+    vertices = list(graph._from_dict)
+    next_vertex = 30
+    for _ in range(100):
+        op = rng.random()
+        if op < 0.4 and len(vertices) != 0:
+            graph.add_edge(rng.choice(vertices), rng.choice(vertices))
+        elif op < 0.65:
+            edges = [(v, w) for v in vertices for w in graph._from_dict[v]]
+            if len(edges) != 0:
+                graph.remove_edge(*rng.choice(edges))
+        elif op < 0.85 and len(vertices) > 1:
+            v = rng.choice(vertices)
+            vertices.remove(v)
+            graph.remove_vertex(v)
+        else:
+            vertices.append(next_vertex)
+            graph.add_vertex(next_vertex)
+            next_vertex += 1
+
+        snapshot = graph.get_snapshot()
+        check_snapshot(graph, snapshot)
+        assert graph.get_snapshot() is snapshot
+
+def test_snapshot_is_frozen():
+    graph = DirectedGraph()
+    for v in 'abc':
+        graph.add_vertex(v)
+    graph.add_edge('a', 'b')
+    graph.add_edge('b', 'c')
+    snapshot = graph.get_snapshot()
+    successors = snapshot.get_direct_successors('a')
+
+    # Every change to the graph builds a new snapshot, and leaves the old one as it was
+    for edit in (lambda: graph.add_edge('a', 'c'), lambda: graph.remove_edge('a', 'b'),
+            lambda: graph.add_vertex('d'), lambda: graph.remove_vertex('b')):
+        edit()
+        assert graph.get_snapshot() is not snapshot
+        check_snapshot(graph, graph.get_snapshot())
+        snapshot = graph.get_snapshot()
+    assert list(successors) == ['b']
+    assert repr(successors) == "NeighbourView(['b'])"
+    assert list(snapshot.get_direct_successors('a')) == ['c']
+    assert list(snapshot.get_direct_predecessors('c')) == ['a']
+
+    # Adding a vertex that is already there is no change
+    graph.add_vertex('a')
+    assert graph.get_snapshot() is snapshot
@@ -0,0 +1,186 @@
+'''
+Tests of the topological order maintained incrementally by DirectedGraph and GateDefinition
+'''
+from gates.builtins import Nand
+from gates.project import Project
+from gates.utils.graph import DirectedGraph
+import pytest
+import random
+
+def is_acyclic(graph):
+    components = graph.get_strongly_connected_components()
+    return all(len(component) == 1 for component in components) and \
+        all(v not in graph.get_direct_successors(v) for v in graph._from_dict)
+
+def check_order(graph, order):
+    '''
+    Check that an order holds every vertex once and respects every edge
+    '''
+    assert sorted(order, key=str) == sorted(graph._from_dict, key=str)
+    positions = {v: i for i, v in enumerate(order)}
+    for v, successors in graph._from_dict.items():
+        for w in successors:
+            assert positions[v] < positions[w], (v, w)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_tracked_order_random_edits(seed):
+    rng = random.Random(seed)
+    graph = DirectedGraph()
+    vertices = list(range(30))
+    for v in vertices:
+        graph.add_vertex(v)
+    graph.track_order(vertices)
+    next_vertex = len(vertices)
+
+    for _ in range(300):
+        op = rng.random()
+        if op < 0.55 and len(vertices) > 1:
+            v, w = rng.sample(vertices, 2)
+            tracked = graph.is_order_tracked()
+            graph.add_edge(v, w)
+            if tracked and not graph.is_order_tracked():
+                # Tracking only stops when the new edge closes a cycle
+                assert not is_acyclic(graph)
+        elif op < 0.85:
+            edges = [(v, w) for v in vertices for w in graph.get_direct_successors(v)]
+            if len(edges) != 0:
+                graph.remove_edge(*rng.choice(edges))
+        elif op < 0.93 and len(vertices) > 2:
+            v = rng.choice(vertices)
+            vertices.remove(v)
+            graph.remove_vertex(v)
+        else:
+            vertices.append(next_vertex)
+            graph.add_vertex(next_vertex)
+            next_vertex += 1
+
+        if graph.is_order_tracked():
+            check_order(graph, graph.get_tracked_order())
+        elif is_acyclic(graph):
+            # Start tracking again from a fresh order, as GateDefinition does after a full reorder
+            order, cut_edges = graph.get_order(vertices[0])
+            assert len(cut_edges) == 0
+            graph.track_order(order)
+
+def test_tracked_order_compacts_holes():
+    graph = DirectedGraph()
+    for v in range(10):
+        graph.add_vertex(v)
+    for v in range(9):
+        graph.add_edge(v, v + 1)
+    graph.track_order(range(10))
+    for v in range(0, 10, 2):
+        graph.remove_vertex(v)
+    assert graph.get_tracked_order() == [1, 3, 5, 7, 9]
+    assert len(graph._tracked_order) <= 2 * len(graph._positions)
+
+def build_definition(num_gates):
+    project = Project('Order test')
+    definition = project.define('Random', [1, 1], [1, 1])
+    gates = [Nand() for _ in range(num_gates)]
+    definition.add_gates(gates)
+    definition._update_order()
+    return definition, gates
+
+def fresh_order(definition):
+    '''
+    Return the order, cut edges and rooted gates that a full reorder would compute, without touching the definition
+    '''
+    graph = definition._graph
+    order, cut_edges = graph.get_order(definition._source._uid)
+    rooted_gates = set(graph.get_all_predecessors(definition._sink._uid))
+    rooted_gates.add(definition._sink._uid)
+    return order, cut_edges, rooted_gates
+
+@pytest.mark.parametrize('seed', range(20))
+def test_definition_order_random_edits(seed):
+    '''
+    After every edit, the incrementally maintained order and rooted gates match a full reorder
+    '''
+    rng = random.Random(seed)
+    definition, gates = build_definition(12)
+    source, sink = definition.source, definition.sink
+    num_tracked = 0
+
+    for _ in range(150):
+        op = rng.random()
+        senders = [(gate, 0) for gate in gates] + [(source, 0), (source, 1)]
+        receivers = [(idx, gate) for gate in gates for idx in range(2)] + [(0, sink), (1, sink)]
+        if op < 0.5:
+            definition.add_connection(rng.choice(senders), rng.choice(receivers))
+        elif op < 0.8:
+            connections = [(key, pair) for key, pairs in definition._connections.items() for pair in pairs]
+            if len(connections) != 0:
+                (from_uid, to_uid), (output_idx, input_idx) = rng.choice(connections)
+                from_pair = (definition._gates[from_uid], output_idx)
+                to_pair = (input_idx, definition._gates[to_uid])
+                definition.remove_connection(from_pair, to_pair)
+        elif op < 0.85:
+            definition.clear_gate_input(rng.choice(receivers))
+        elif op < 0.9:
+            definition.clear_gate_output(rng.choice(senders))
+        elif op < 0.95 and len(gates) > 2:
+            gate = rng.choice(gates)
+            gates.remove(gate)
+            definition.remove_gate(gate)
+        else:
+            gate = Nand()
+            gates.append(gate)
+            definition.add_gate(gate)
+
+        tracked = definition._graph.is_order_tracked()
+        definition._update_order()
+        order, cut_edges, rooted_gates = fresh_order(definition)
+        assert set(definition._rooted_gates) == rooted_gates
+        assert set(definition._order) == set(definition._gates)
+        if tracked:
+            num_tracked += 1
+            assert len(cut_edges) == 0
+            assert len(definition._cut_gates) == 0
+            check_order(definition._graph, definition._order)
+        else:
+            assert list(definition._order) == order
+            assert set(definition._cut_gates) == set(v for v, _ in cut_edges)
+
+        # Every edge in the graph still carries at least one connection
+        for v, successors in definition._graph._from_dict.items():
+            for w in successors:
+                assert len(definition._connections[v, w]) != 0
+    assert num_tracked != 0
+
+def test_clear_gate_input_removes_edge():
+    definition, (nand, other) = build_definition(2)
+    source = definition.source
+    definition.add_connection((source, 0), (0, nand))
+    definition.add_connection((source, 1), (1, nand))
+    definition.add_connection((nand, 0), (0, definition.sink))
+    definition._update_order()
+    assert source._uid in definition._rooted_gates
+
+    # The edge stays while another input of the gate is connected to the source
+    definition.clear_gate_input((0, nand))
+    assert nand._uid in definition._graph.get_direct_successors(source._uid)
+    assert list(definition._connections[source._uid, nand._uid]) == [(1, 1)]
+
+    definition.clear_gate_input((1, nand))
+    assert nand._uid not in definition._graph.get_direct_successors(source._uid)
+    assert (source._uid, nand._uid) not in definition._connections
+    definition._update_order()
+    assert source._uid not in definition._rooted_gates
+    definition.tick()
+
+def test_clear_gate_output_removes_edge():
+    definition, (nand, other) = build_definition(2)
+    definition.add_connection((nand, 0), (0, other))
+    definition.add_connection((nand, 0), (1, other))
+    definition.add_connection((other, 0), (0, definition.sink))
+    definition._update_order()
+    assert nand._uid in definition._rooted_gates
+
+    definition.clear_gate_output((nand, 0))
+    assert other._uid not in definition._graph.get_direct_successors(nand._uid)
+    assert (nand._uid, other._uid) not in definition._connections
+    definition._update_order()
+    assert nand._uid not in definition._rooted_gates
+    assert other._uid in definition._rooted_gates
+    definition.tick()
@@ -0,0 +1,70 @@
+'''
+Differential tests of the compiled netlist against the interpreter
+'''
+from gates.engines import Netlist, NetlistEngine, get_netlist
+from tests.helpers import SAVES, load_save, get_definitions, random_inputs, to_json
+import pytest
+import random
+import copy
+
+NUM_TICKS = 12
+
+def run_interpreter(definition, sequence):
+    outputs = []
+    for inputs in sequence:
+        definition._state['inputs'] = copy.deepcopy(inputs)
+        definition.tick()
+        outputs.append(to_json(definition._state['outputs']))
+    return outputs
+
+def run_engine(definition, sequence):
+    engine = NetlistEngine(definition)
+    outputs = []
+    for inputs in sequence:
+        definition._state['inputs'] = copy.deepcopy(inputs)
+        engine.load_state()
+        engine.tick()
+        outputs.append(to_json(definition._state['outputs']))
+    return outputs
+
+@pytest.mark.parametrize('save', SAVES)
+def test_netlist_matches_interpreter(save, packed_buses):
+    project = load_save(save)
+    for definition in get_definitions(project):
+        rng = random.Random(definition._name)
+        sequence = [random_inputs(definition, rng) for _ in range(NUM_TICKS)]
+        initial = copy.deepcopy(definition._state)
+
+        expected = run_interpreter(definition, sequence)
+        expected_state = to_json(definition.serialize_state(definition._state))
+
+        definition._state = initial
+        assert run_engine(definition, sequence) == expected, definition._name
+        assert to_json(definition.serialize_state(definition._state)) == expected_state, definition._name
+
+@pytest.mark.parametrize('save', SAVES)
+def test_netlist_engine_run(save):
+    '''
+    Running many ticks at once, with cycle detection, ends in the same state as ticking one at a time
+    '''
+    project = load_save(save)
+    for definition in get_definitions(project):
+        initial = copy.deepcopy(definition._state)
+        for _ in range(40):
+            definition.tick()
+        expected = to_json(definition.serialize_state(definition._state))
+
+        definition._state = initial
+        NetlistEngine(definition).run(40)
+        assert to_json(definition.serialize_state(definition._state)) == expected, definition._name
+
+def test_get_netlist_is_cached_until_changed():
+    project = load_save('counters.json')
+    definition = project['counter8bit']
+    netlist = get_netlist(definition)
+    assert get_netlist(definition) is netlist
+    assert isinstance(netlist, Netlist)
+
+    # Editing a dependency invalidates the cached netlist of its dependees
+    project['NOT'].insert_output(1, 1)
+    assert get_netlist(definition) is not netlist
@@ -0,0 +1,159 @@
+'''
+Tests of OrderedSet
+'''
+from gates.utils import OrderedSet
+from tests.helpers import SAVES, load_save
+import pytest
+import random
+import pickle
+import copy
+
+def test_pop_keeps_indices():
+    # pop used to shift the indices of the wrong entries, which then removed the wrong entries or raised KeyErrors
+    oset = OrderedSet([10, 11, 12, 13, 14])
+    assert oset.pop(1) == 11
+    assert oset.pop(0) == 10
+    assert oset.pop() == 14
+    assert list(oset) == [12, 13]
+    assert oset.index(12) == 0 and oset.index(13) == 1
+
+    oset.discard(13)
+    oset.remove(12)
+    assert len(oset) == 0
+    with pytest.raises(KeyError):
+        oset.pop()
+
+@pytest.mark.parametrize('save', SAVES + ['project.json'])
+def test_saves_load(save):
+    # Loading relies on popping from the ordered sets of the dependency graph
+    project = load_save(save)
+    assert len(list(project.get_gate_names())) > 0
+
+def test_mutating_while_iterating_raises():
+    oset = OrderedSet([1, 2, 3])
+    with pytest.raises(RuntimeError):
+        for item in oset:
+            oset.discard(item)
+    oset = OrderedSet([1, 2, 3])
+    for item in list(oset):
+        oset.discard(item)
+    assert len(oset) == 0
+
+class ListSet:
+    '''
+    Reference model of an OrderedSet as a plain list without duplicates
+    '''
+    def __init__(self, items=()):
+        self.items = []
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        if item not in self.items:
+            self.items.append(item)
+        return self.items.index(item)
+
+    def discard(self, item):
+        if item in self.items:
+            self.items.remove(item)
+
+    def remove(self, item):
+        if item not in self.items:
+            raise KeyError(item)
+        self.items.remove(item)
+
+    def pop(self, index=-1):
+        if len(self.items) == 0:
+            raise KeyError('Set is empty')
+        return self.items.pop(index)
+
+    def index(self, item):
+        if item not in self.items:
+            raise KeyError(item)
+        return self.items.index(item)
+
+    def update(self, items):
+        index = 0
+        for item in items:
+            index = self.add(item)
+        return index
+
+    def difference_update(self, other):
+        self.items = [item for item in self.items if item not in other]
+
+    def intersection_update(self, other):
+        self.items = [item for item in self.items if item in other]
+
+    def symmetric_difference_update(self, other):
+        added = ListSet(item for item in other if item not in self.items).items
+        self.items = [item for item in self.items if item not in other] + added
+
+def run_both(oset, reference, operation):
+    '''
+    Apply an operation to an OrderedSet and to the reference model, checking that they return or raise the same
+    '''
+    results, errors = [], []
+    for target in (oset, reference):
+        try:
+            result = operation(target)
+            results.append(list(result) if isinstance(result, OrderedSet) else result)
+            errors.append(None)
+        except (KeyError, IndexError) as e:
+            results.append(None)
+            errors.append(type(e))
+    assert errors[0] == errors[1]
+    assert results[0] == results[1]
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_reference(seed):
+    rng = random.Random(seed)
+    for _ in range(50):
+        initial = [rng.randrange(20) for _ in range(rng.randrange(8))]
+        oset, reference = OrderedSet(initial), ListSet(initial)
+        for _ in range(40):
+            op = rng.randrange(12)
+            x = rng.randrange(20)
+            others = [rng.randrange(20) for _ in range(rng.randrange(6))]
+            if op == 0:
+                run_both(oset, reference, lambda s: s.add(x))
+            elif op == 1:
+                run_both(oset, reference, lambda s: s.discard(x))
+            elif op == 2:
+                run_both(oset, reference, lambda s: s.remove(x))
+            elif op == 3:
+                run_both(oset, reference, lambda s: s.pop())
+            elif op == 4:
+                idx = rng.randrange(-len(reference.items) - 1, len(reference.items) + 1)
+                run_both(oset, reference, lambda s: s.pop(idx))
+            elif op == 5:
+                run_both(oset, reference, lambda s: s.update(others))
+            elif op == 6:
+                run_both(oset, reference, lambda s: s.difference_update(others))
+            elif op == 7:
+                run_both(oset, reference, lambda s: s.intersection_update(others))
+            elif op == 8:
+                run_both(oset, reference, lambda s: s.symmetric_difference_update(others))
+            elif op == 9:
+                # Index based access builds the cached list and indices, which later edits must keep up to date
+                run_both(oset, reference, lambda s: s.index(x))
+                if len(reference.items) != 0:
+                    idx = rng.randrange(len(reference.items))
+                    assert oset[idx] == reference.items[idx]
+            elif op == 10:
+                assert list(oset[1:3]) == reference.items[1:3]
+                if len(reference.items) != 0:
+                    assert oset[[0, 0]] == reference.items[:1] * 2
+                assert list(reversed(oset)) == reference.items[::-1]
+            else:
+                copies = [oset.copy(), copy.deepcopy(oset), pickle.loads(pickle.dumps(oset))]
+                assert all(list(other) == reference.items for other in copies)
+                assert oset.union(others) == ListSet(reference.items + others).items
+                assert oset.intersection(others) == [item for item in reference.items if item in others]
+                assert oset.difference(others) == [item for item in reference.items if item not in others]
+
+            assert list(oset) == reference.items
+            assert len(oset) == len(reference.items)
+            assert all(item in oset for item in reference.items)
+            if rng.random() < 0.5:
+                # Only sometimes, so that edits also run without the cached list and indices
+                assert [oset.index(item) for item in reference.items] == list(range(len(reference.items)))
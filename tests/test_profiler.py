@@ -0,0 +1,85 @@
+'''
+Tests of the profiler's counts and collapsed stacks
+'''
+from gates.builtins import Nand
+from gates.gate_definition import GateDefinition, CompoundGate
+from gates.profiler import Profiler
+from gates.project import Project
+
+def build_project():
+    '''
+    Build a definition Top holding an instance of the combinational AND, made of a NAND and a NOT, followed by an
+    instance of Loop, a NAND whose output is fed back to its second input
+    '''
+    project = Project('Profiler test')
+    NOT = project.define('NOT', [1], [1])
+    nand = Nand()
+    NOT.add_gate(nand)
+    NOT.add_connections([((NOT.source, 0), (0, nand)), ((NOT.source, 0), (1, nand)), ((nand, 0), (0, NOT.sink))])
+
+    AND = project.define('AND', [1, 1], [1])
+    nand, invert = Nand(), project['NOT']()
+    AND.add_gates([nand, invert])
+    AND.add_connections([
+        ((AND.source, 0), (0, nand)), ((AND.source, 1), (1, nand)), ((nand, 0), (0, invert)), ((invert, 0), (0, AND.sink))
+    ])
+
+    Loop = project.define('Loop', [1], [1])
+    nand = Nand()
+    Loop.add_gate(nand)
+    Loop.add_connections([((Loop.source, 0), (0, nand)), ((nand, 0), (1, nand)), ((nand, 0), (0, Loop.sink))])
+
+    Top = project.define('Top', [1, 1], [1])
+    gate_and, gate_loop = project['AND'](), project['Loop']()
+    Top.add_gates([gate_and, gate_loop])
+    Top.add_connections([
+        ((Top.source, 0), (0, gate_and)), ((Top.source, 1), (1, gate_and)),
+        ((gate_and, 0), (0, gate_loop)), ((gate_loop, 0), (0, Top.sink))
+    ])
+
+    # Connecting Top already built the truth tables, so edit NOT for the first tick to build them again
+    NOT.add_gate(Nand())
+    return project, gate_and, gate_loop
+
+def test_gate_counts():
+    project, gate_and, gate_loop = build_project()
+    with Profiler() as profiler:
+        for _ in range(3):
+            project['Top'].tick()
+    stats = {name: (calls, gates) for name, calls, _, _, gates in profiler.get_definition_stats()}
+
+    # Every tick evaluates the two instances in Top and the NAND in Loop, but neither sources nor sinks
+    assert stats['Top'] == (3, 6)
+    assert stats['Loop'] == (3, 3)
+
+    # AND is answered from its truth table, and building the tables of AND and NOT is not counted
+    assert stats['AND'][1] == 0
+    assert stats['NOT'][1] == 0
+
+    gate_stats = {uid: (calls, gates) for uid, calls, _, _, gates in profiler.get_gate_stats()}
+    assert gate_stats[gate_loop.uid] == (3, 3)
+    assert gate_stats[gate_and.uid] == (3, 0)
+    assert profiler.get_gate_name(gate_loop.uid) == 'Loop'
+
+def test_collapsed_stacks(tmp_path):
+    project, _, _ = build_project()
+    with Profiler() as profiler:
+        project['Top'].tick()
+    lines = profiler.collapsed().splitlines()
+    stacks = {}
+    for line in lines:
+        path, microseconds = line.rsplit(' ', 1)
+        stacks[path] = int(microseconds)
+    assert set(stacks) == {'Top', 'Top;AND', 'Top;AND;NOT', 'Top;Loop'}
+    assert all(microseconds >= 0 for microseconds in stacks.values())
+
+    path = tmp_path / 'ticks.folded'
+    profiler.write_collapsed(str(path))
+    assert path.read_text() == profiler.collapsed()
+
+def test_disable_restores_methods():
+    originals = (GateDefinition.tick, GateDefinition._process_state, GateDefinition._build_truth_table, CompoundGate.__call__)
+    project, _, _ = build_project()
+    with Profiler():
+        project['Top'].tick()
+    assert (GateDefinition.tick, GateDefinition._process_state, GateDefinition._build_truth_table, CompoundGate.__call__) == originals
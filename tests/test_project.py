@@ -0,0 +1,60 @@
+'''
+Tests of lazily loaded projects
+'''
+from gates.project import Project
+from gates.gate_definition import GateDefinition
+from gates.utils import binary
+from tests.helpers import SAVES, read_save, to_json, remap_uids
+import pytest
+
+def lazy_and_eager(save):
+    obj = read_save(save)
+    lazy_gates, eager_gates = {}, {}
+    lazy = Project.deserialize(obj, lazy_gates, lazy=True)
+    eager = Project.deserialize(obj, eager_gates)
+    return lazy, lazy_gates, eager, eager_gates
+
+@pytest.mark.parametrize('save', SAVES)
+def test_lazy_load_serializes_like_eager_load(save):
+    lazy, lazy_gates, eager, eager_gates = lazy_and_eager(save)
+    assert not all(lazy.is_materialized(name) for name in lazy.get_gate_names())
+    assert to_json(remap_uids(lazy.serialize(), lazy_gates)) == to_json(remap_uids(eager.serialize(), eager_gates))
+    assert to_json(lazy.serialize()) == to_json(lazy.serialize())
+
+@pytest.mark.parametrize('save', SAVES)
+def test_lazy_binary_load_serializes_like_eager_load(save):
+    data = binary.dumps(read_save(save))
+    lazy_gates, eager_gates = {}, {}
+    lazy = Project.deserialize_binary(data, lazy_gates, lazy=True)
+    eager = Project.deserialize_binary(data, eager_gates)
+    assert to_json(remap_uids(lazy.serialize(), lazy_gates)) == to_json(remap_uids(eager.serialize(), eager_gates))
+
+def test_definitions_never_give_out_placeholders():
+    lazy, _, eager, _ = lazy_and_eager('counters.json')
+    definitions = lazy._definitions
+    names = list(definitions)
+    assert names == list(eager._definitions)
+    assert 'counter8bit' in repr(definitions)
+    assert not lazy.is_materialized('counter8bit')
+
+    assert all(definition is not None for definition in dict(definitions).values())
+    assert all(lazy.is_materialized(name) for name in names)
+
+    lazy, _, _, _ = lazy_and_eager('counters.json')
+    definitions = lazy._definitions
+    assert isinstance(definitions.setdefault('counter8bit', None), GateDefinition)
+    popped = definitions.pop('counter4bit')
+    assert isinstance(popped, GateDefinition)
+    assert 'counter4bit' not in definitions
+    assert lazy.is_materialized('counter4bit')
+    assert len(definitions) == len(names) - 1
+
+def test_lazy_loads_do_not_share_gates():
+    obj = read_save('counters.json')
+    first = Project.deserialize(obj, lazy=True)
+    second = Project.deserialize(obj, lazy=True)
+    assert first._loaded_gates is not second._loaded_gates
+    first['counter8bit']
+    assert len(second._loaded_gates) == 0
+    second['counter8bit']
+    assert set(first._loaded_gates) == set(second._loaded_gates)
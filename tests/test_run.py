@@ -0,0 +1,90 @@
+'''
+Tests of GateDefinition.run and run_until against ticking the interpreter
+'''
+from tests.helpers import SAVES, load_save, get_definitions, to_json
+import pytest
+import copy
+
+def interpreted(definition, num_ticks):
+    '''
+    Return the serialized states of a definition after every tick of the interpreter, leaving its state unchanged
+    '''
+    saved = copy.deepcopy(definition._state)
+    states = [to_json(definition.serialize_state(definition._state))]
+    for _ in range(num_ticks):
+        definition.tick()
+        states.append(to_json(definition.serialize_state(definition._state)))
+    definition._state = saved
+    return states
+
+@pytest.mark.parametrize('save', SAVES)
+def test_run_matches_ticks(save):
+    for definition in get_definitions(load_save(save)):
+        states = interpreted(definition, 70)
+        initial = copy.deepcopy(definition._state)
+        for num_ticks in (1, 5, 70):
+            definition._state = copy.deepcopy(initial)
+            definition.run(num_ticks)
+            assert to_json(definition.serialize_state(definition._state)) == states[num_ticks], definition._name
+
+            # Without cycle detection too
+            definition._state = copy.deepcopy(initial)
+            definition.run(num_ticks, detect_cycles=False)
+            assert to_json(definition.serialize_state(definition._state)) == states[num_ticks], definition._name
+
+def counter():
+    '''
+    Return a 2 bit counter that counts up on every tick, going through 4 states
+    '''
+    definition = load_save('counters.json')['counter2bit']
+    definition._state['inputs'] = [[0, 0], 0, 1]
+    return definition
+
+def test_run_skips_cycles():
+    definition = counter()
+    states = interpreted(definition, 1003)
+    initial = copy.deepcopy(definition._state)
+    for num_ticks in (3, 64, 65, 1000, 1003):
+        definition._state = copy.deepcopy(initial)
+        period = definition.run(num_ticks)
+        assert to_json(definition.serialize_state(definition._state)) == states[num_ticks]
+        if num_ticks > 4:
+            assert period is not None and period % 4 == 0
+
+def test_run_until_stops_at_first_match():
+    definition = counter()
+    outputs = [state['outputs'] for state in interpreted(definition, 8)]
+    target = outputs[3]
+    assert target not in outputs[:3]
+
+    states = interpreted(definition, 3)
+    calls = []
+    def predicate(values):
+        calls.append(to_json(values))
+        return to_json(values) == target
+    assert definition.run_until(predicate) == 3
+    assert calls == outputs[:4]
+    assert to_json(definition.serialize_state(definition._state)) == states[3]
+
+    # The predicate is checked before the first tick
+    assert definition.run_until(lambda values: to_json(values) == target) == 0
+
+def test_run_until_detects_cycles():
+    definition = counter()
+    calls = []
+    def never(values):
+        calls.append(to_json(values))
+        return False
+    assert definition.run_until(never) is None
+    # Brent's algorithm finds the cycle of 4 states within a few of its lengths
+    assert 4 < len(calls) <= 16
+
+    calls.clear()
+    assert definition.run_until(never, detect_cycles=False, max_ticks=50) is None
+    assert len(calls) == 51
+
+def test_run_until_max_ticks():
+    definition = counter()
+    states = interpreted(definition, 2)
+    assert definition.run_until(lambda values: False, max_ticks=2, detect_cycles=False) is None
+    assert to_json(definition.serialize_state(definition._state)) == states[2]
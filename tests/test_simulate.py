@@ -0,0 +1,72 @@
+'''
+Tests of the headless simulator's snapshots and sweeps with every engine
+'''
+from simulate import Simulator, sweep
+from tests.helpers import load_save, to_json
+import pytest
+import copy
+
+ENGINES = ['netlist', 'codegen', 'event']
+INPUTS = [[1, 0, 1, 1, 0, 0, 1, 0], 0, 1]
+
+def counter(engine):
+    '''
+    Return the counter, a simulator of it with the given engine, and a function giving the state the interpreter
+    reaches after a number of ticks from the same initial state
+    '''
+    definition = load_save('counters.json')['counter8bit']
+    initial = copy.deepcopy(definition._state)
+
+    def interpreted_state(num_ticks):
+        saved = definition._state
+        definition._state = copy.deepcopy(initial)
+        reference = Simulator(definition, 'interpreter')
+        reference.set_inputs(INPUTS)
+        reference.tick(num_ticks)
+        state = to_json(definition.serialize_state(definition._state))
+        definition._state = saved
+        return state
+
+    simulator = Simulator(definition, engine)
+    simulator.set_inputs(INPUTS)
+    return definition, simulator, interpreted_state
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_snapshot_and_restore(engine):
+    definition, simulator, interpreted_state = counter(engine)
+    simulator.tick(5)
+    snapshot = simulator.snapshot()
+    assert to_json(definition.serialize_state(definition._state)) == interpreted_state(5)
+
+    simulator.tick(7)
+    simulator.restore(snapshot, 5)
+    assert to_json(definition.serialize_state(definition._state)) == interpreted_state(5)
+    simulator.tick(3)
+    simulator.store_state()
+    assert simulator.num_ticks == 8
+    assert to_json(definition.serialize_state(definition._state)) == interpreted_state(8)
+
+    # Restoring the same snapshot again still rebinds the engine to the definition's new state
+    simulator.restore(snapshot, 5)
+    simulator.tick(4)
+    simulator.store_state()
+    assert to_json(definition.serialize_state(definition._state)) == interpreted_state(9)
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('processes', [1, 2])
+def test_sweep_leaves_state_unchanged(engine, processes):
+    sequences = [[INPUTS, [[0] * 8, 1, 1]], [[[1] * 8, 0, 0]], [INPUTS] * 3]
+    _, reference, _ = counter('interpreter')
+    reference.tick(10)
+    expected = sweep(reference, sequences, ticks_per_input=4, processes=1)
+
+    definition, simulator, interpreted_state = counter(engine)
+    simulator.tick(10)
+    assert to_json(sweep(simulator, sequences, ticks_per_input=4, processes=processes)) == to_json(expected)
+    assert simulator.num_ticks == 10
+    simulator.store_state()
+    assert to_json(definition.serialize_state(definition._state)) == interpreted_state(10)
+
+    simulator.tick(2)
+    simulator.store_state()
+    assert to_json(definition.serialize_state(definition._state)) == interpreted_state(12)
@@ -0,0 +1,195 @@
+'''
+Tests of flat state stores
+'''
+from gates.builtins import Nand
+from gates.engines import Netlist, get_netlist
+from gates.gate import Gate
+from gates.gate_definition import GateDefinition
+from gates.state_store import StateStore, History
+from gates.utils.bus import pack_values
+from tests.helpers import SAVES, load_save, get_definitions, random_inputs, to_json
+import pytest
+import random
+import copy
+
+def ticked_definitions(save, num_ticks=5):
+    '''
+    Return the definitions of a save after a few ticks on random inputs, so that their states are not all unknown
+    '''
+    definitions = get_definitions(load_save(save))
+    for definition in definitions:
+        rng = random.Random(definition._name)
+        for _ in range(num_ticks):
+            definition._state['inputs'] = random_inputs(definition, rng)
+            definition.tick()
+    return definitions
+
+@pytest.mark.parametrize('save', SAVES)
+def test_state_round_trip(save, packed_buses):
+    for definition in ticked_definitions(save):
+        state = copy.deepcopy(definition._state)
+        store = StateStore.from_state(state)
+        assert store.to_state() == state, definition._name
+        assert store.to_state() is not store.to_state()
+
+        # Unknown bits survive the round trip
+        inputs = [None if dim == 1 else [None] * dim for dim in definition._input_dims]
+        state['inputs'] = pack_values(inputs) if Gate.PACKED_BUSES else inputs
+        store.update(state)
+        assert store.to_state() == state, definition._name
+
+@pytest.mark.parametrize('save', SAVES)
+def test_serialized_round_trip(save, packed_buses):
+    for definition in ticked_definitions(save):
+        obj = definition.serialize_state(definition._state)
+        store = StateStore.from_serialized(obj)
+        assert store.to_serialized() == obj, definition._name
+        assert GateDefinition.deserialize_state(store.to_serialized(), definition._gates, definition._project) == \
+            GateDefinition.deserialize_state(obj, definition._gates, definition._project)
+
+        # A store of the runtime state holds the same bits as one of the serialized state
+        assert StateStore.from_state(definition._state).to_serialized() == obj, definition._name
+
+@pytest.mark.parametrize('save', SAVES)
+@pytest.mark.parametrize('compiled', [True, False], ids=['netlist', 'interpreter'])
+def test_tick_store_matches_tick(save, compiled, packed_buses, monkeypatch):
+    if not compiled:
+        # As for states holding values the netlist cannot bind, which are ticked through a StoreView
+        monkeypatch.setattr(Netlist, 'bind_layout', lambda netlist, layout: None)
+    for definition in get_definitions(load_save(save)):
+        rng = random.Random(definition._name)
+        store = definition.get_state_store()
+        for _ in range(10):
+            inputs = random_inputs(definition, rng)
+            definition._state['inputs'] = copy.deepcopy(inputs)
+            definition.tick()
+            before = copy.deepcopy(definition._state)
+            store.write((), 'inputs', inputs)
+            definition.tick_store(store)
+            assert definition._state == before, definition._name
+            assert to_json(store.to_state()) == to_json(definition._state), definition._name
+
+def test_read_and_write():
+    definition = ticked_definitions('counters.json')[0]
+    store = definition.get_state_store()
+    uid = next(key for key in definition._state if type(key) == int)
+    assert store.read((), uid) == list(definition._state[uid][1])
+    assert store.read_gate((), uid) == definition._state[uid]
+
+    outputs = [None] * len(store.read((), uid))
+    store.write((), uid, outputs)
+    assert store.read((), uid) == outputs
+    assert store.to_state()[uid][1] == outputs
+
+    with pytest.raises(ValueError):
+        store.write((), uid, outputs + [None])
+    with pytest.raises(ValueError):
+        store.read((), -1)
+
+def test_layout_mismatch():
+    definition, other = ticked_definitions('counters.json')[:2]
+    store = definition.get_state_store()
+    with pytest.raises(ValueError):
+        StateStore.from_state(other._state, store.layout)
+    assert StateStore.from_state(definition._state, store.layout).layout is store.layout
+
+def counter():
+    definition = load_save('counters.json')['counter8bit']
+    definition._state['inputs'] = random_inputs(definition, random.Random(0))
+    return definition
+
+def test_history_rewind():
+    definition = counter()
+    history = History(definition, 16)
+    states = []
+    for _ in range(10):
+        states.append(to_json(definition.serialize_state(definition._state)))
+        history.tick()
+    assert len(history) == 10
+
+    history.rewind()
+    assert to_json(definition.serialize_state(definition._state)) == states[9]
+    history.rewind(3)
+    assert to_json(definition.serialize_state(definition._state)) == states[6]
+    assert len(history) == 6
+
+    # Ticking again after a rewind records from the restored state
+    history.tick()
+    assert len(history) == 7
+    history.rewind()
+    assert to_json(definition.serialize_state(definition._state)) == states[6]
+
+    with pytest.raises(ValueError):
+        history.rewind(7)
+    with pytest.raises(ValueError):
+        history.rewind(0)
+
+def test_history_is_bounded():
+    definition = counter()
+    history = History(definition, 4)
+    states = []
+    for _ in range(10):
+        states.append(to_json(definition.serialize_state(definition._state)))
+        history.tick()
+    assert len(history) == history.size == 4
+
+    # Only the snapshots taken before the last 4 ticks are kept
+    assert [to_json(snapshot.to_serialized()) for snapshot in history.snapshots] == states[6:]
+    with pytest.raises(ValueError):
+        history.rewind(5)
+    history.rewind(4)
+    assert to_json(definition.serialize_state(definition._state)) == states[6]
+    assert len(history) == 0
+
+    with pytest.raises(ValueError):
+        History(definition, 0)
+
+def test_history_shares_unchanged_snapshots():
+    definition = counter()
+    history = History(definition, 4)
+    history.record()
+    history.record()
+    first, second = history.snapshots
+    assert first is second
+    history.tick()
+    assert history.snapshots[-1].layout is first.layout
+
+def test_snapshot_layout_follows_shape_changes():
+    definition = counter()
+    before = definition.snapshot()
+    assert definition.snapshot().layout is before.layout
+
+    # Adding a gate changes the shape of the state, so the next snapshot lays it out again
+    gate = Nand()
+    definition.add_gate(gate)
+    assert gate._uid in definition._state
+    after = definition.snapshot()
+    assert after.layout is not before.layout
+    assert after.to_state() == definition._state
+    assert definition.snapshot().layout is after.layout
+
+    history = History(definition, 4)
+    history.tick(2)
+    history.rewind(2)
+    assert to_json(definition.serialize_state(definition._state)) == to_json(after.to_serialized())
+
+    # Removing it again goes back to a layout of the original shape
+    definition.remove_gate(gate)
+    restored = definition.snapshot()
+    assert restored.layout is not after.layout
+    assert restored.layout == before.layout
+    definition.restore(before)
+    assert to_json(definition.serialize_state(definition._state)) == to_json(before.to_serialized())
+
+def test_tick_store_binds_layout_once():
+    definition = counter()
+    store = definition.get_state_store()
+    netlist = get_netlist(definition)
+    bound = netlist.bind_layout(store.layout)
+    assert bound is not None
+    definition.tick_store(store)
+    assert netlist.bind_layout(definition.get_state_store(store.layout).layout) is bound
+
+    # A store with a layout of its own is bound again
+    other = StateStore.from_state(copy.deepcopy(definition._state))
+    assert netlist.bind_layout(other.layout) is not bound
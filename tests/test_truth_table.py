@@ -0,0 +1,78 @@
+'''
+Tests of the truth tables of combinational definitions
+'''
+from gates.builtins import Nand
+from gates.gate_definition import GateDefinition
+from tests.helpers import load_save
+import pytest
+
+@pytest.fixture
+def builds(monkeypatch):
+    '''
+    Count the truth tables built, by the name of their definition
+    '''
+    counts = {}
+    build = GateDefinition._build_truth_table
+
+    def counted_build(definition):
+        counts[definition._name] = counts.get(definition._name, 0) + 1
+        build(definition)
+    monkeypatch.setattr(GateDefinition, '_build_truth_table', counted_build)
+    return counts
+
+def test_table_is_reused(builds):
+    project = load_save('counters.json')
+    AND = project['AND']
+    assert AND._lookup_truth_table([1, 1]) == [1]
+    table = AND._truth_table
+    assert AND._lookup_truth_table([0, 1]) == [0]
+    assert builds['AND'] == 1
+
+    # Ticking a definition made of ANDs answers them from the same table
+    half_adder = project['half_adder']
+    for inputs in ([0, 0], [0, 1], [1, 0], [1, 1]):
+        half_adder._state['inputs'] = inputs
+        half_adder.tick()
+        assert half_adder._state['outputs'] == [inputs[0] & inputs[1], inputs[0] ^ inputs[1]]
+    assert builds['AND'] == 1
+    assert AND._truth_table is table
+
+def test_unrelated_edit_keeps_table(builds):
+    project = load_save('counters.json')
+    AND = project['AND']
+    AND._lookup_truth_table([1, 1])
+    table = AND._truth_table
+
+    # XOR is neither AND nor one of the definitions it depends on
+    project['XOR'].add_gate(Nand())
+    assert AND._lookup_truth_table([1, 1]) == [1]
+    assert builds['AND'] == 1
+    assert AND._truth_table is table
+
+def test_dependency_edit_rebuilds_table(builds):
+    project = load_save('counters.json')
+    AND = project['AND']
+    AND._lookup_truth_table([1, 1])
+    table = AND._truth_table
+
+    # AND is made of a NAND and a NOT, so editing NOT invalidates the table of AND
+    NOT = project['NOT']
+    nand = Nand()
+    NOT.add_gate(nand)
+    assert AND._lookup_truth_table([1, 1]) == [1]
+    assert builds['AND'] == 2
+    assert AND._truth_table is not table
+
+    # As does editing AND itself
+    table = AND._truth_table
+    AND.add_gate(Nand())
+    assert AND._lookup_truth_table([1, 0]) == [0]
+    assert builds['AND'] == 3
+    assert AND._truth_table is not table
+
+    # A table of a definition that is no longer combinational is dropped
+    NOT.add_connection((nand, 0), (0, nand))
+    NOT.add_connection((nand, 0), (1, nand))
+    NOT.add_connection((nand, 0), (0, NOT.sink))
+    assert AND._lookup_truth_table([1, 1]) is None
+    assert builds['AND'] == 4
@@ -0,0 +1,70 @@
+'''
+Differential tests of VectorizedEvaluator against the netlist engine and the interpreter
+'''
+from gates.engines import Netlist, NetlistEngine, get_netlist
+from tests.helpers import SAVES, load_save, get_definitions, to_json
+import pytest
+import random
+import copy
+
+np = pytest.importorskip('numpy')
+from gates.engines.vectorized import VectorizedEvaluator
+
+NUM_VECTORS = 40
+
+def unflatten(definition, row):
+    '''
+    Split a row of input bits into the definition's inputs, in the format of its state
+    '''
+    inputs = []
+    idx = 0
+    for dim in definition._input_dims:
+        bits = [int(bit) for bit in row[idx:idx + dim]]
+        inputs.append(bits[0] if dim == 1 else bits)
+        idx += dim
+    return inputs
+
+def flatten(outputs):
+    return [bit for value in to_json(outputs) for bit in (value if isinstance(value, list) else [value])]
+
+def combinational_definitions(save):
+    return [
+        definition for definition in get_definitions(load_save(save))
+        if get_netlist(definition).combinational
+    ]
+
+@pytest.mark.parametrize('save', SAVES)
+def test_vectorized_matches_interpreter(save):
+    definitions = combinational_definitions(save)
+    for definition in definitions:
+        evaluator = VectorizedEvaluator(definition)
+        rng = np.random.default_rng(len(definition._name))
+        vectors = rng.integers(0, 2, size=(NUM_VECTORS, evaluator.input_width), dtype=np.uint8)
+        # Small chunks, so that vectors are split over several of them
+        outputs = evaluator(vectors, chunk_size=7)
+        assert outputs.shape == (NUM_VECTORS, evaluator.output_width)
+
+        initial = copy.deepcopy(definition._state)
+        engine = NetlistEngine(definition, Netlist(definition))
+        for row, result in zip(vectors, outputs):
+            inputs = unflatten(definition, row)
+            definition._state = copy.deepcopy(initial)
+            definition._state['inputs'] = copy.deepcopy(inputs)
+            definition.tick()
+            assert list(result) == flatten(definition._state['outputs']), definition._name
+
+            engine.set_inputs(inputs)
+            engine.tick(store=False)
+            assert list(result) == flatten(engine.outputs), definition._name
+
+def test_vectorized_checks_inputs():
+    definition = combinational_definitions('counters.json')[0]
+    evaluator = VectorizedEvaluator(definition)
+    with pytest.raises(ValueError):
+        evaluator(np.zeros((3, evaluator.input_width + 1), dtype=np.uint8))
+    assert evaluator(np.zeros((0, evaluator.input_width), dtype=np.uint8)).shape == (0, evaluator.output_width)
+
+def test_vectorized_rejects_feedback():
+    definition = load_save('counters.json')['counter8bit']
+    with pytest.raises(ValueError):
+        VectorizedEvaluator(definition)
@@ -2,6 +2,7 @@ import tkinter as tk
 import tkinter.ttk as ttk
 from tkinter import simpledialog
 from bbox import Bbox
+from gates.utils import Bus
 import math
 import random
 from functools import reduce
@@ -304,6 +305,8 @@ class Workspace(tk.Canvas):
             # Update the state
             if gate.dims[i] == 1:
                 state[i] = num
+            elif isinstance(state[i], Bus):
+                state[i] = state[i].replace(j, num)
             else:
                 state[i][j] = num
             